@@ -0,0 +1,44 @@
+"""
+Agent library loading shared by the Streamlit app and the batch CLI
+"""
+
+from pathlib import Path
+
+from resource_cache import RESOURCES
+
+AGENTS_FILE = 'agents.yaml'
+
+
+def load_agents(path=AGENTS_FILE):
+    """Load agents from agents.yaml; a missing file yields an empty library, parse errors raise"""
+    agents_file = Path(path)
+    if not agents_file.exists():
+        return {'agents': []}
+    import yaml  # deferred: only needed when the library is (re)loaded
+    with open(agents_file, 'r', encoding='utf-8') as f:
+        data = yaml.safe_load(f)
+    return data if data else {'agents': []}
+
+
+def shared_agents(path=AGENTS_FILE):
+    """load_agents cached across sessions, reloaded when the file's mtime changes"""
+    agents_file = Path(path)
+    mtime = agents_file.stat().st_mtime_ns if agents_file.exists() else None
+    return RESOURCES.get_or_build('agents', str(agents_file.resolve()), lambda: load_agents(path),
+                                  version=mtime, label=path)
+
+
+def agent_config(agent, provider=None, model=None):
+    """Runner config (provider/model/system_prompt/params) for a library agent"""
+    return {
+        'name': agent.get('name'),
+        'desc': agent.get('desc', ''),
+        'provider': agent.get('provider') or provider,
+        'model': agent.get('model') or model,
+        'system_prompt': agent.get('system_prompt', ''),
+        'params': {
+            'temperature': agent.get('temperature', 0.2),
+            'max_tokens': agent.get('max_tokens', 1500),
+            'top_p': agent.get('top_p', 1.0),
+        },
+    }
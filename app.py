@@ -4,39 +4,61 @@ Hermes Luxury Style UI - Streamlit Implementation (Production Ready)
 Fixed for Hugging Face Spaces Deployment
 """
 
-import os
-import io
 import time
+_script_start = time.perf_counter()
+
+import os
 import json
-import yaml
-import base64
-import traceback
-import pandas as pd
+import tempfile
 from datetime import datetime
-from pathlib import Path
 import streamlit as st
 
-# Providers - with error handling for missing packages
-try:
-    import google.generativeai as genai
-    GEMINI_AVAILABLE = True
-except ImportError:
-    GEMINI_AVAILABLE = False
-    st.warning("google-generativeai not installed. Gemini features disabled.")
+import agent_library
+from providers import (
+    GEMINI_AVAILABLE, OPENAI_AVAILABLE, GROK_AVAILABLE,
+    CLIENTS, IMPORT_TIMES, run_provider,
+)
+from ratelimit import LIMITS
+from metrics import METRICS, format_duration
+from response_cache import RESPONSE_CACHE, CACHE_USE, CACHE_REFRESH, CACHE_BYPASS
+from routing import HEDGE_PERCENTILE
+from resource_cache import RESOURCES
+from ingest import PYMUPDF_AVAILABLE, content_hash, parse_page_range, iter_page_text, pdf_page_count, load_document
+from retrieval import DEFAULT_TOP_K
+from chunking import DEFAULT_CHUNK_TOKENS
+from runner import (
+    DEFAULT_MAX_WORKERS, validate_dag, build_prompt, run_dag, run_agent, dag_to_dot, config_fingerprint,
+)
+from incremental import REUSE, page_hashes, document_sections, agent_pages, input_record, diff_documents, plan_rereview
+from planner import (
+    OK as PLAN_OK, ROUTE, TIKTOKEN_AVAILABLE, plan_run, fit_prompt, estimate_record, accuracy as estimate_accuracy,
+    count_tokens,
+)
+from previews import read_sample, sample_document, describe
+from comparison import (
+    IDENTICAL as CMP_IDENTICAL, CHANGED as CMP_CHANGED, ADDED as CMP_ADDED, REMOVED as CMP_REMOVED,
+    compare_documents, comparison_document,
+)
+from findings import parse_findings, consolidate, severity_counts, findings_csv
+from page_render import (
+    PIXMAP_CACHE, THUMBS_PER_VIEW, visible_window, render_pages, render_page, page_image_url,
+)
+from run_store import CANCELLED as RUN_CANCELLED, SKIPPED, get_store, run_status, spool
+from jobs import JOBS, JOB_POLL_S, QUEUED, RUNNING, DONE, FAILED, CANCELLED, FINISHED_STATES, JobCancelled
+import checklist
+import corpus
+import startup_profile
+import rerun_profile
 
-try:
-    from openai import OpenAI
-    OPENAI_AVAILABLE = True
-except ImportError:
-    OPENAI_AVAILABLE = False
-    st.warning("openai package not installed. OpenAI features disabled.")
+_imports_done = time.perf_counter()
+profiler = rerun_profile.start_rerun(st.session_state, _script_start)
+profiler.phase("page config & CSS")
 
-try:
-    from xai_sdk import Client as XAIClient
-    from xai_sdk.chat import user as xai_user, system as xai_system, image as xai_image
-    GROK_AVAILABLE = True
-except ImportError:
-    GROK_AVAILABLE = False
+if not GEMINI_AVAILABLE:
+    st.warning("google-generativeai not installed. Gemini features disabled.")
+if not OPENAI_AVAILABLE:
+    st.warning("openai package not installed. OpenAI features disabled.")
+if not GROK_AVAILABLE:
     st.warning("xai_sdk not installed. Grok features disabled.")
 
 # Page configuration
@@ -87,16 +109,23 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+profiler.phase("session state")
+
 # Initialize session state
 defaults = {
     'language': 'en',
     'agents': [],
     'selected_agent': None,
     'review_sessions': [],
-    'run_log': [],
+    'last_run_id': None,
+    'active_job': None,
+    'session_tag': os.urandom(3).hex(),
+    'history_cursors': [None],
     'runner_state': {},
     'prompt_configs': {},
-    'providers_ready': {}
+    'providers_ready': {},
+    'documents': {},
+    'upload_samples': {}
 }
 for k, v in defaults.items():
     if k not in st.session_state:
@@ -115,7 +144,7 @@ TRANSLATIONS = {
         'language': 'Language',
         'create_agent': 'Create Custom Agent',
         'active_sessions': 'Active Sessions',
-        'ocr_confidence': 'OCR Confidence',
+        'text_coverage': 'Text Coverage',
         'agents_running': 'Agents Running',
         'avg_review_time': 'Avg Review Time',
         'recent_activity': 'Recent Activity',
@@ -124,6 +153,7 @@ TRANSLATIONS = {
         'checklist': 'Checklist',
         'generate_mock': 'Generate Mock Submission',
         'model_health': 'Model Health',
+        'provider_latency': 'Provider Latency (last hour)',
     },
     'zh': {
         'title': '🛡️ FDA 510(k) 智能審查系統',
@@ -136,7 +166,7 @@ TRANSLATIONS = {
         'language': '語言',
         'create_agent': '創建自定義代理',
         'active_sessions': '活躍會話',
-        'ocr_confidence': 'OCR 信心度',
+        'text_coverage': '文字覆蓋率',
         'agents_running': '運行中的代理',
         'avg_review_time': '平均審查時間',
         'recent_activity': '最近活動',
@@ -145,201 +175,70 @@ TRANSLATIONS = {
         'checklist': '檢查清單',
         'generate_mock': '生成模擬提交',
         'model_health': '模型健康狀態',
+        'provider_latency': '模型延遲（最近一小時）',
     }
 }
 
 def t(key):
     return TRANSLATIONS.get(st.session_state.language, TRANSLATIONS['en']).get(key, key)
 
-@st.cache_data
 def load_agents():
-    """Load agents from agents.yaml with error handling"""
-    agents_file = Path('agents.yaml')
-    if agents_file.exists():
-        try:
-            with open(agents_file, 'r', encoding='utf-8') as f:
-                data = yaml.safe_load(f)
-                return data if data else {'agents': []}
-        except Exception as e:
-            st.error(f"Error loading agents.yaml: {e}")
-            return {'agents': []}
-    return {'agents': []}
-
-# Provider initializers with better error handling
-def init_gemini(api_key):
-    if not GEMINI_AVAILABLE:
-        return False
+    """Load agents from agents.yaml with error handling; shared across sessions until the file changes"""
     try:
-        genai.configure(api_key=api_key)
-        # Test the connection
-        list(genai.list_models())
-        st.session_state.providers_ready['gemini'] = True
-        return True
+        return agent_library.shared_agents()
     except Exception as e:
-        st.session_state.providers_ready['gemini'] = False
-        st.error(f"Gemini init failed: {e}")
+        st.error(f"Error loading agents.yaml: {e}")
+        return {'agents': []}
+
+# Provider initializers - keys are validated once per TTL in the shared
+# client registry instead of on every rerun
+def _init_provider(provider, label, api_key):
+    with profiler.section(f"init {provider}"):
+        ok, err = CLIENTS.validate(provider, api_key)
+    st.session_state.providers_ready[provider] = ok
+    if not ok:
+        st.error(f"{label} init failed: {err}")
+    return ok
+
+def init_gemini(api_key):
+    if not GEMINI_AVAILABLE:
         return False
+    return _init_provider('gemini', 'Gemini', api_key)
 
 def init_openai(api_key):
     if not OPENAI_AVAILABLE:
         return False
-    try:
-        client = OpenAI(api_key=api_key)
-        # Test connection
-        client.models.list()
-        st.session_state.providers_ready['openai'] = True
-        return True
-    except Exception as e:
-        st.session_state.providers_ready['openai'] = False
-        st.error(f"OpenAI init failed: {e}")
-        return False
+    return _init_provider('openai', 'OpenAI', api_key)
 
 def init_grok(api_key):
     if not GROK_AVAILABLE:
         return False
-    try:
-        _ = XAIClient(api_key=api_key)
-        st.session_state.providers_ready['grok'] = True
-        return True
-    except Exception as e:
-        st.session_state.providers_ready['grok'] = False
-        st.error(f"xAI Grok init failed: {e}")
-        return False
-
-# Provider call wrappers with robust error handling
-def call_gemini(model_name, system_prompt, user_prompt, params):
-    if not GEMINI_AVAILABLE:
-        raise RuntimeError("Gemini not available")
-    model = genai.GenerativeModel(model_name)
-    full_prompt = f"System: {system_prompt}\n\nUser: {user_prompt}"
-    resp = model.generate_content(full_prompt, generation_config={
-        "temperature": params.get("temperature", 0.2),
-        "top_p": params.get("top_p", 1.0),
-        "max_output_tokens": params.get("max_tokens", 1500),
-    })
-    return resp.text
-
-def call_openai_direct(openai_api_key, model, system_prompt, user_prompt, params):
-    if not OPENAI_AVAILABLE:
-        raise RuntimeError("OpenAI not available")
-    client = OpenAI(api_key=openai_api_key)
-    response = client.chat.completions.create(
-        model=model,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ],
-        temperature=params.get("temperature", 0.2),
-        top_p=params.get("top_p", 1.0),
-        max_tokens=params.get("max_tokens", 1500),
-    )
-    return response.choices[0].message.content
-
-def call_openai_with_pmpt(openai_api_key, pmpt_id, user_prompt, override_model=None, params=None):
-    if not OPENAI_AVAILABLE:
-        raise RuntimeError("OpenAI not available")
-    # Fallback to direct call if prompt API not available
-    return call_openai_direct(
-        openai_api_key, 
-        override_model or "gpt-4o-mini",
-        f"Use prompt ID: {pmpt_id}",
-        user_prompt,
-        params or {}
-    )
-
-def retrieve_openai_prompt(openai_api_key, pmpt_id):
-    """Retrieve prompt metadata - graceful fallback"""
-    return {
-        "id": pmpt_id,
-        "name": pmpt_id,
-        "description": "Prompt configuration",
-        "system_prompt": "",
-        "model": None,
-        "params": {}
-    }
-
-def call_grok(xai_api_key, model, system_prompt, user_prompt, params, image_url=None):
-    if not GROK_AVAILABLE:
-        raise RuntimeError("Grok not available")
-    client = XAIClient(api_key=xai_api_key, timeout=3600)
-    chat = client.chat.create(model=model)
-    chat.append(xai_system(system_prompt))
-    if image_url:
-        chat.append(xai_user(user_prompt, xai_image(image_url)))
-    else:
-        chat.append(xai_user(user_prompt))
-    response = chat.sample()
-    return response.content
-
-def run_provider(provider, config, user_prompt, keys):
-    """Unified provider execution with error handling"""
-    try:
-        if provider == "gemini":
-            if not keys.get("gemini"):
-                raise ValueError("Missing Gemini API key")
-            return call_gemini(
-                model_name=config.get("model", "gemini-2.0-flash-exp"),
-                system_prompt=config.get("system_prompt", ""),
-                user_prompt=user_prompt,
-                params=config.get("params", {})
-            )
-        elif provider == "openai":
-            if not keys.get("openai"):
-                raise ValueError("Missing OpenAI API key")
-            pmpt_id = config.get("pmpt_id")
-            if pmpt_id:
-                return call_openai_with_pmpt(
-                    openai_api_key=keys["openai"],
-                    pmpt_id=pmpt_id,
-                    user_prompt=user_prompt,
-                    override_model=config.get("model"),
-                    params=config.get("params", {})
-                )
-            else:
-                return call_openai_direct(
-                    openai_api_key=keys["openai"],
-                    model=config.get("model", "gpt-4o-mini"),
-                    system_prompt=config.get("system_prompt", ""),
-                    user_prompt=user_prompt,
-                    params=config.get("params", {})
-                )
-        elif provider == "grok":
-            if not keys.get("grok"):
-                raise ValueError("Missing xAI API key")
-            return call_grok(
-                xai_api_key=keys["grok"],
-                model=config.get("model", "grok-beta"),
-                system_prompt=config.get("system_prompt", "You are Grok."),
-                user_prompt=user_prompt,
-                params=config.get("params", {}),
-                image_url=config.get("image_url")
-            )
-        else:
-            raise ValueError(f"Unsupported provider: {provider}")
-    except Exception as e:
-        raise RuntimeError(f"{provider} execution failed: {str(e)}")
+    return _init_provider('grok', 'xAI Grok', api_key)
 
 # Mock data generator
-def generate_mock_submission(device_type='Orthopedic Implant'):
+MOCK_DIR = os.path.join(tempfile.gettempdir(), "fda_review_mock")
+
+def generate_mock_submission(pages=corpus.DEFAULT_PAGES, seed=None):
+    """A synthetic submission (see corpus.py) written to disk and loaded as a document, plus its session record"""
+    seed = int(time.time() * 1000) % 10 ** 9 if seed is None else seed
+    os.makedirs(MOCK_DIR, exist_ok=True)
+    path = os.path.join(MOCK_DIR, f"mock-{seed}-{pages}p.txt")
+    record = corpus.generate(path, pages, seed)
+    doc = load_document(path)
     mock_data = {
-        'device_name': f'Mock {device_type} Device {datetime.now().strftime("%Y%m%d")}',
+        'device_name': record['device_name'],
         'submission_date': datetime.now().strftime('%Y-%m-%d'),
-        'device_type': device_type,
-        'predicate_device': 'K123456',
-        'sections': {
-            'device_description': 'A novel orthopedic implant designed for knee reconstruction...',
-            'indications_for_use': 'Indicated for patients requiring knee arthroplasty...',
-            'substantial_equivalence': 'This device is substantially equivalent to predicate...',
-            'performance_testing': 'Mechanical testing performed per ASTM F1800...',
-            'biocompatibility': 'Tested per ISO 10993-1, all tests passed...',
-            'sterilization': 'Gamma sterilization validated per ISO 11137...',
-        },
-        'pages': 145,
-        'confidence_score': 0.94
+        'device_type': record['device_type'],
+        'predicate_device': record['predicate_device'],
+        'document': doc['name'],
+        'sections': {s['title']: s['pages'] for s in record['sections']},
+        'pages': record['pages'],
+        'omitted_items': record['omitted_items'],
     }
-    return mock_data
+    return mock_data, doc
 
 # Sidebar
+profiler.phase("sidebar")
 with st.sidebar:
     st.markdown(f"### {t('language')}")
     col_lang1, col_lang2 = st.columns(2)
@@ -375,30 +274,68 @@ with st.sidebar:
     else:
         st.info("Provide at least one API key to run agents.")
 
+    with st.expander("⏱️ Rate Limits", expanded=False):
+        st.caption("Shared by every session on this server.")
+
+        def apply_limit(prov, field):
+            LIMITS.configure(prov, **{field: st.session_state[f"{field}_{prov}"]})
+
+        for prov in ("gemini", "openai", "grok"):
+            # Re-seeded from the shared limiter every run, so another session's change shows up here
+            # and only an edit made in this session (on_change) is written back
+            current = LIMITS.settings(prov)
+            st.session_state[f"rpm_{prov}"] = current["rpm"]
+            st.session_state[f"tpm_{prov}"] = current["tpm"]
+            colrl1, colrl2 = st.columns(2)
+            with colrl1:
+                st.number_input(f"{prov} req/min", 1, 100000, key=f"rpm_{prov}",
+                                on_change=apply_limit, args=(prov, "rpm"))
+            with colrl2:
+                st.number_input(f"{prov} tok/min", 1000, 100000000, step=1000, key=f"tpm_{prov}",
+                                on_change=apply_limit, args=(prov, "tpm"))
+
     st.divider()
     st.markdown("### ⚡ Quick Actions")
+    mock_pages = st.number_input("Mock submission pages", 10, 1000, corpus.DEFAULT_PAGES, step=10, key="mock_pages")
     if st.button(t('generate_mock'), use_container_width=True):
-        mock_data = generate_mock_submission()
+        mock_data, mock_doc = generate_mock_submission(int(mock_pages))
         st.session_state.review_sessions.append(mock_data)
-        st.toast(f"Generated: {mock_data['device_name']}", icon="✅")
+        # Reviewable like an upload: it shows up in the checklist and runner document pickers
+        st.session_state.documents[mock_doc['name']] = mock_doc
+        st.toast(f"Generated: {mock_data['device_name']} ({mock_doc['page_count']} pages)", icon="✅")
 
-    if st.button('📊 Export Last Run Log', use_container_width=True):
-        if st.session_state.run_log:
-            log_json = json.dumps(st.session_state.run_log, ensure_ascii=False, indent=2)
+    cache_stats = RESPONSE_CACHE.stats()
+    if st.button(f"🧹 Clear Response Cache ({cache_stats['entries']})", use_container_width=True):
+        RESPONSE_CACHE.clear()
+        st.toast("Response cache cleared", icon="🧹")
+
+    last_run_id = st.session_state.last_run_id
+    if last_run_id:
+        st.download_button(
+            label='📊 Export Last Run Log',
+            data=lambda: spool(get_store().export_ndjson(run_id=last_run_id)),
+            file_name="run_log.ndjson",
+            mime="application/x-ndjson",
+            use_container_width=True
+        )
+        last_run = get_store().run(last_run_id)
+        if last_run and last_run['findings']:
             st.download_button(
-                label="Download run_log.json",
-                data=log_json,
-                file_name="run_log.json",
-                mime="application/json"
+                label=f"📋 Export Consolidated Findings ({len(last_run['findings'])})",
+                data=lambda: spool(findings_csv(last_run['findings'])),
+                file_name="findings.csv",
+                mime="text/csv",
+                use_container_width=True
             )
-        else:
-            st.info("No run log available yet.")
+    else:
+        st.caption("No run log available yet.")
 
 # Main header
 st.markdown(f"# {t('title')}")
 st.markdown(f"*{t('subtitle')}*")
 
 # Load agents
+profiler.phase("agent library")
 agents_config = load_agents()
 AGENTS = agents_config.get('agents', [])
 
@@ -411,33 +348,144 @@ tab1, tab2, tab3, tab4 = st.tabs([
 ])
 
 # Dashboard
+profiler.phase("dashboard tab")
 with tab1:
+    ingest_stats = METRICS.ingest_stats()
+    review_stats = METRICS.review_stats()
     col1, col2, col3, col4 = st.columns(4)
     with col1: 
         st.metric(t('active_sessions'), len(st.session_state.review_sessions))
     with col2: 
-        st.metric(t('ocr_confidence'), "94.2%")
+        coverage = ingest_stats['text_coverage']
+        st.metric(t('text_coverage'), "—" if coverage is None else f"{coverage:.1%}",
+                  help="Share of extracted pages with a text layer")
     with col3: 
-        st.metric(t('agents_running'), str(len(AGENTS)))
+        job_stats = JOBS.stats()
+        st.metric(t('agents_running'), job_stats['agents_running'],
+                  help=f"Across {job_stats[RUNNING]} running and {job_stats[QUEUED]} queued jobs in all sessions")
     with col4: 
-        st.metric(t('avg_review_time'), "4.2h")
+        st.metric(t('avg_review_time'), format_duration(review_stats['avg_elapsed_s']),
+                  help=f"Mean wall time over {review_stats['reviews']} runner executions")
 
     st.divider()
     st.markdown(f"### {t('model_health')}")
     mh1, mh2, mh3 = st.columns(3)
     
-    def health_chip(label, ok):
-        css = "chip-success" if ok else "chip-error"
+    def health_chip(label, provider):
+        ready = st.session_state.providers_ready.get(provider, False)
+        state, detail = METRICS.provider_health(provider)
+        if not ready or state == 'down':
+            css = "chip-error"
+        elif state == 'degraded':
+            css = "chip-running"
+        else:
+            css = "chip-success"
         st.markdown(f'<span class="status-chip {css}">{label}</span>', unsafe_allow_html=True)
+        if detail:
+            st.caption(f"{state} • p50 {format_duration(detail['p50_s'])} • p95 {format_duration(detail['p95_s'])} • "
+                       f"errors {detail['error_rate']:.0%} of {detail['calls']}")
     
     with mh1: 
-        health_chip("Gemini", st.session_state.providers_ready.get('gemini', False))
+        health_chip("Gemini", 'gemini')
     with mh2: 
-        health_chip("OpenAI", st.session_state.providers_ready.get('openai', False))
+        health_chip("OpenAI", 'openai')
     with mh3: 
-        health_chip("Grok", st.session_state.providers_ready.get('grok', False))
+        health_chip("Grok", 'grok')
+
+    provider_rows = METRICS.provider_stats()
+    if provider_rows:
+        st.markdown(f"### {t('provider_latency')}")
+        st.dataframe(provider_rows, use_container_width=True, hide_index=True)
+    hedge_stats = METRICS.hedge_stats()
+    if hedge_stats['calls']:
+        st.caption(f"Routing: {hedge_stats['hedged']} of {hedge_stats['calls']} calls hedged "
+                   f"({hedge_stats['hedge_rate']:.0%}) • secondary won {hedge_stats['secondary_wins']} • "
+                   f"{hedge_stats['failovers']} failovers • ${hedge_stats['added_cost_usd']:.4f} added cost")
+    if ingest_stats['pages']:
+        st.caption(f"Ingestion: {ingest_stats['pages']:,} pages parsed • "
+                   f"{ingest_stats['pages_per_s'] or '—'} pages/s")
+
+    resource_stats = RESOURCES.stats()
+    with st.expander(f"🗃️ Shared Resource Cache • {resource_stats['entries']} entries • "
+                     f"{resource_stats['bytes'] / 1e6:.1f} of {resource_stats['max_bytes'] / 1e6:.0f} MB",
+                     expanded=False):
+        st.caption("Parsed documents, page text, retrieval indexes, the agent library and the checklist, "
+                   "shared by every session on this server.")
+        lookups = resource_stats['hits'] + resource_stats['misses']
+        colr1, colr2, colr3 = st.columns(3)
+        colr1.metric("Hit rate", f"{resource_stats['hits'] / lookups:.0%}" if lookups else "—")
+        colr2.metric("Misses", resource_stats['misses'])
+        colr3.metric("Evictions", resource_stats['evictions'])
+        if resource_stats['by_kind']:
+            st.dataframe([
+                {'kind': kind, 'entries': k['entries'], 'size_mb': round(k['bytes'] / 1e6, 2), 'hits': k['hits']}
+                for kind, k in sorted(resource_stats['by_kind'].items())
+            ], use_container_width=True, hide_index=True)
+            st.dataframe([
+                dict(e, last_used=datetime.fromtimestamp(e['last_used']).strftime('%H:%M:%S'))
+                for e in RESOURCES.entries()
+            ], use_container_width=True, hide_index=True)
+        if st.button("🧹 Clear Shared Cache", use_container_width=True):
+            RESOURCES.discard()
+            st.toast("Shared resource cache cleared", icon="🧹")
+
+    st.divider()
+    st.markdown(f"### {t('recent_activity')}")
+    store = get_store()
+    colh1, colh2, colh3 = st.columns(3)
+    with colh1:
+        hist_submission = st.selectbox("Submission", [None] + store.distinct('submission'),
+                                       format_func=lambda v: "All" if v is None else v, key="hist_submission")
+    with colh2:
+        hist_agent = st.selectbox("Agent", [None] + store.distinct('agent'),
+                                  format_func=lambda v: "All" if v is None else v, key="hist_agent")
+    with colh3:
+        hist_provider = st.selectbox("Provider", [None] + store.distinct('provider'),
+                                     format_func=lambda v: "All" if v is None else v, key="hist_provider")
+    hist_filters = {'submission': hist_submission, 'agent': hist_agent, 'provider': hist_provider}
+    if st.session_state.get('history_filters') != hist_filters:
+        st.session_state.history_filters = hist_filters
+        st.session_state.history_cursors = [None]
+
+    cursors = st.session_state.history_cursors
+    hist_rows, next_cursor = store.query(cursor=cursors[-1], **hist_filters)
+    if hist_rows:
+        st.dataframe([
+            {
+                'time': datetime.fromtimestamp(r['ts']).strftime('%Y-%m-%d %H:%M:%S'),
+                'submission': r['submission'],
+                'agent': r['agent'],
+                'model': f"{r['provider']}:{r['model']}",
+                'status': run_status(r),
+                'elapsed_s': r['elapsed_s'],
+                'tokens_in': r['tokens_in'],
+                'tokens_out': r['tokens_out'],
+                'cache': r['cache'],
+            }
+            for r in hist_rows
+        ], use_container_width=True, hide_index=True)
+        colp1, colp2, colp3, colp4 = st.columns(4)
+        with colp1:
+            if st.button("← Newer", disabled=len(cursors) == 1, use_container_width=True):
+                cursors.pop()
+                st.rerun()
+        with colp2:
+            if st.button("Older →", disabled=next_cursor is None, use_container_width=True):
+                cursors.append(next_cursor)
+                st.rerun()
+        with colp3:
+            st.download_button("⬇️ NDJSON", data=lambda: spool(store.export_ndjson(**hist_filters)),
+                               file_name="agent_runs.ndjson", mime="application/x-ndjson",
+                               use_container_width=True)
+        with colp4:
+            st.download_button("⬇️ CSV", data=lambda: spool(store.export_csv(**hist_filters)),
+                               file_name="agent_runs.csv", mime="text/csv", use_container_width=True)
+        st.caption(f"Page {len(cursors)} • {store.count(**hist_filters):,} agent runs")
+    else:
+        st.caption("No agent runs recorded yet.")
 
 # Agents Library
+profiler.phase("agents tab")
 with tab2:
     st.markdown(f"## {t('agent_library')}")
     
@@ -460,6 +508,7 @@ with tab2:
         st.warning("No agents found in agents.yaml. Please create the file.")
 
 # Document Review
+profiler.phase("upload previews")
 with tab3:
     st.markdown(f"## {t('review')}")
     
@@ -473,21 +522,179 @@ with tab3:
         for file in uploaded_files:
             st.success(f"📄 Uploaded: {file.name}")
             with st.expander(f"Preview: {file.name}"):
-                if file.type == "text/plain":
+                if file.type == "application/pdf":
+                    if not PYMUPDF_AVAILABLE:
+                        st.info("PyMuPDF not installed. PDF text extraction disabled.")
+                        continue
                     try:
-                        content = file.read().decode('utf-8')
-                        st.text_area("Content", content[:1000], height=200)
+                        # getvalue() hands back the upload's bytes without copying
+                        data = file.getvalue()
+                        doc_hash = content_hash(data)
+                        page_count = RESOURCES.get_or_build('page_count', doc_hash, lambda: pdf_page_count(data))
+                        page_spec = st.text_input(
+                            "Pages to extract (e.g. 1-5, 8, 12-)",
+                            key=f"pages_{file.name}"
+                        )
+                        pages = parse_page_range(page_spec, page_count)
+
+                        def parse_document():
+                            bar = st.progress(0.0)
+                            texts = {}
+                            for k, (page_no, text) in enumerate(iter_page_text(data, pages, doc_hash), start=1):
+                                texts[page_no] = text
+                                if k % 25 == 0 or k == len(pages):
+                                    bar.progress(k / len(pages))
+                            return {'name': file.name, 'hash': doc_hash, 'page_count': page_count, 'pages': texts}
+
+                        # Parsed once per content and page selection for every session
+                        parsed = RESOURCES.get_or_build('document', (doc_hash, tuple(pages)), parse_document,
+                                                        label=f"{file.name} • {len(pages)} pages")
+                        texts = parsed['pages']
+                        if st.session_state.documents.get(file.name, {}).get('pages') is not texts:
+                            # The upload's bytes are kept by reference for on-demand page rendering
+                            st.session_state.documents[file.name] = dict(parsed, name=file.name, data=data)
+                        st.caption(f"{page_count} pages • {len(texts)} extracted • "
+                                   f"{sum(len(t) for t in texts.values()):,} characters")
+                        preview = "\n".join(texts[n] for n in sorted(texts)[:3])
+                        st.text_area("Content", preview[:1000], height=200)
                     except Exception as e:
                         st.error(f"Error reading file: {e}")
                 else:
-                    st.info(f"File type: {file.type}")
+                    try:
+                        # Only the head of the upload is read; reruns reuse the sample
+                        sample = st.session_state.upload_samples.get(file.file_id)
+                        if sample is None:
+                            file.seek(0)
+                            sample = st.session_state.upload_samples[file.file_id] = read_sample(file.name, file)
+                        if st.session_state.documents.get(file.name, {}).get('hash') != sample['hash']:
+                            shared = RESOURCES.get_or_build('document', sample['hash'],
+                                                            lambda: sample_document(file.name, sample),
+                                                            label=f"{file.name} • sample")
+                            st.session_state.documents[file.name] = dict(shared, name=file.name)
+                        st.caption(describe(sample))
+                        if sample['kind'] == 'csv':
+                            st.dataframe(sample['preview'], use_container_width=True, hide_index=True)
+                            st.dataframe(sample['columns'], use_container_width=True, hide_index=True)
+                        elif sample['kind'] == 'json':
+                            st.code(sample['preview'], language="json")
+                        else:
+                            st.text_area("Content", sample['preview'], height=200)
+                        if sample['truncated']:
+                            st.caption("Agents are given the same sample, headed by these totals.")
+                    except Exception as e:
+                        st.error(f"Error reading file: {e}")
     else:
         st.info("📤 Upload documents to begin review")
 
+    profiler.phase("document viewer")
+    viewer_docs = [name for name, d in st.session_state.documents.items() if d.get('data') is not None]
+    if viewer_docs:
+        st.markdown(f"### {t('document_viewer')}")
+        viewer_name = st.selectbox("Document", viewer_docs, key="viewer_doc")
+        vdoc = st.session_state.documents[viewer_name]
+        page_key = f"viewer_page_{viewer_name}"
+        viewer_page = st.number_input("Page", min_value=1, max_value=vdoc['page_count'], key=page_key)
+
+        def show_page(n, key=page_key, count=vdoc['page_count']):
+            st.session_state[key] = max(1, min(count, n))
+
+        # Only the strip's visible window is rendered
+        window = visible_window(vdoc['page_count'], (viewer_page - 1) // THUMBS_PER_VIEW * THUMBS_PER_VIEW)
+        thumbs = render_pages(vdoc['data'], vdoc['hash'], window)
+        colv1, colv2 = st.columns(2)
+        colv1.button("◀ Previous pages", disabled=window[0] == 0, use_container_width=True,
+                     on_click=show_page, args=(window[0] + 1 - THUMBS_PER_VIEW,))
+        colv2.button("Next pages ▶", disabled=window[-1] + 1 >= vdoc['page_count'], use_container_width=True,
+                     on_click=show_page, args=(window[-1] + 2,))
+        for col, n in zip(st.columns(THUMBS_PER_VIEW), window):
+            with col:
+                st.image(thumbs[n])
+                st.button(f"p{n + 1}", key=f"thumb_{viewer_name}_{n}", on_click=show_page, args=(n + 1,),
+                          type="primary" if n + 1 == viewer_page else "secondary", use_container_width=True)
+        st.image(render_page(vdoc['data'], vdoc['hash'], viewer_page - 1),
+                 caption=f"{viewer_name} • page {viewer_page} of {vdoc['page_count']}")
+        pixmap_stats = PIXMAP_CACHE.stats()
+        st.caption(f"Rendered page cache: {pixmap_stats['images']} images • "
+                   f"{pixmap_stats['bytes'] / 1e6:.1f} MB • {pixmap_stats['hits']} hits")
+
+    profiler.phase("checklist")
+    if st.session_state.documents:
+        st.markdown(f"### {t('checklist')}")
+        checklist_doc = st.selectbox("Check coverage of", list(st.session_state.documents), key="checklist_doc")
+        doc = st.session_state.documents[checklist_doc]
+        try:
+            cl_started = time.perf_counter()
+            cl_results = checklist.coverage(doc['pages'])
+            cl_elapsed = time.perf_counter() - cl_started
+        except FileNotFoundError:
+            cl_results = None
+            st.warning(f"{checklist.CHECKLIST_FILE} not found.")
+        if cl_results:
+            counts = checklist.summarize(cl_results)
+            colc1, colc2, colc3 = st.columns(3)
+            colc1.metric("Covered", counts[checklist.COVERED])
+            colc2.metric("Ambiguous", counts[checklist.AMBIGUOUS])
+            colc3.metric("Missing", counts[checklist.MISSING])
+            st.caption(f"{len(cl_results)} items over {len(doc['pages'])} pages in {cl_elapsed * 1000:.0f} ms "
+                       f"(keyword matching; ambiguous items can be escalated to an agent)")
+            st.dataframe([
+                {
+                    'item': r['id'],
+                    'section': r['section'],
+                    'ref': r['ref'],
+                    'requirement': r['text'],
+                    'status': r['status'],
+                    'score': r['score'],
+                    'pages': ", ".join(str(n) for n in r['pages'][:12]) + (" …" if len(r['pages']) > 12 else ""),
+                    'not found': ", ".join(r['missing']),
+                }
+                for r in cl_results
+            ], use_container_width=True, hide_index=True)
+
+            if counts[checklist.AMBIGUOUS]:
+                esc_providers = [p for p, ok in (("openai", OPENAI_AVAILABLE), ("gemini", GEMINI_AVAILABLE),
+                                                 ("grok", GROK_AVAILABLE)) if ok]
+                cole1, cole2 = st.columns(2)
+                with cole1:
+                    esc_provider = st.selectbox("Escalation provider", esc_providers, key="checklist_provider")
+                with cole2:
+                    esc_model = st.text_input("Escalation model", value="gpt-4o-mini", key="checklist_model")
+                if st.button(f"🔎 Escalate {counts[checklist.AMBIGUOUS]} ambiguous items", use_container_width=True):
+                    esc_cfg = {
+                        'name': 'Checklist escalation',
+                        'desc': 'Settle checklist items that keyword matching could not decide',
+                        'provider': esc_provider,
+                        'model': esc_model,
+                        'system_prompt': "You are an expert FDA reviewer of device software documentation.",
+                        'params': {'temperature': 0.0, 'max_tokens': 2000, 'top_p': 1.0},
+                    }
+                    esc_doc = dict(doc, pages=checklist.escalation_pages(cl_results, doc['pages']))
+                    esc_keys = {'openai': openai_key, 'gemini': gemini_key, 'grok': grok_key}
+                    esc_stats = {}
+                    store = get_store()
+                    run_id = store.start_run('checklist', submission=checklist_doc, agents=1)
+                    esc_started = time.time()
+                    entry = {'agent': esc_cfg['name'], 'provider': esc_provider, 'model': esc_model}
+                    with st.spinner("Escalating ambiguous items..."):
+                        try:
+                            entry['output'] = run_agent(esc_cfg, checklist.escalation_prompt(cl_results), esc_keys,
+                                                        doc=esc_doc, top_k=0, stats=esc_stats)
+                            st.markdown(entry['output'])
+                        except Exception as e:
+                            entry['error'] = str(e)
+                            st.error(f"Escalation failed: {e}")
+                    entry['elapsed_s'] = time.time() - esc_started
+                    for field in ('tokens_in', 'tokens_out', 'cache'):
+                        entry[field] = esc_stats.get(field)
+                    store.record(run_id, entry, submission=checklist_doc, doc_hash=doc['hash'])
+                    store.finish_run(run_id, int('error' in entry), entry['elapsed_s'])
+
 # Prompt ID Runner
+profiler.phase("runner widgets")
 with tab4:
     st.markdown("## 🧩 Prompt ID Runner")
-    st.caption("Execute agents sequentially with custom configurations.")
+    st.caption("Execute agents with custom configurations. Independent agents run in parallel; "
+               "declared dependencies feed upstream outputs into downstream prompts.")
 
     num_agents = st.number_input(
         "Number of agents to execute", 
@@ -510,6 +717,28 @@ with tab4:
             if not provider_options:
                 st.error("No providers available. Install required packages.")
                 continue
+
+            # Prefill prompt and params from a library agent when one is picked
+            library_agent = st.selectbox(
+                "Start from library agent",
+                options=[None] + [a.get('name') for a in AGENTS],
+                format_func=lambda name: "(custom)" if name is None else name,
+                key=f"lib_{i}"
+            )
+            agent_def = next((a for a in AGENTS if a.get('name') == library_agent), {})
+            # The prompt and parameter widgets are seeded only through session state, since the
+            # library agent overwrites them; a widget value= default as well would make Streamlit warn
+            if library_agent and st.session_state.get(f"lib_applied_{i}") != library_agent:
+                st.session_state[f"sys_{i}"] = agent_def.get('system_prompt', '')
+                st.session_state[f"temp_{i}"] = float(agent_def.get('temperature', 0.2))
+                st.session_state[f"mtok_{i}"] = int(agent_def.get('max_tokens', 1500))
+                st.session_state[f"topp_{i}"] = float(agent_def.get('top_p', 1.0))
+            else:
+                st.session_state.setdefault(f"sys_{i}", "You are an expert FDA 510(k) reviewer.")
+                st.session_state.setdefault(f"temp_{i}", 0.2)
+                st.session_state.setdefault(f"mtok_{i}", 1500)
+                st.session_state.setdefault(f"topp_{i}", 1.0)
+            st.session_state[f"lib_applied_{i}"] = library_agent
             
             provider = st.selectbox(
                 "Provider", 
@@ -531,7 +760,6 @@ with tab4:
             
             system_prompt = st.text_area(
                 "System Prompt", 
-                value="You are an expert FDA 510(k) reviewer.", 
                 height=120, 
                 key=f"sys_{i}"
             )
@@ -540,23 +768,67 @@ with tab4:
             with colp1:
                 temperature = st.slider(
                     "Temperature", 
-                    0.0, 1.0, 0.2, 0.05, 
+                    0.0, 1.0, step=0.05, 
                     key=f"temp_{i}"
                 )
             with colp2:
                 max_tokens = st.number_input(
                     "Max Tokens", 
-                    64, 8000, 1500, 64, 
+                    64, 8000, step=64, 
                     key=f"mtok_{i}"
                 )
             with colp3:
                 top_p = st.slider(
                     "Top P", 
-                    0.0, 1.0, 1.0, 0.05, 
+                    0.0, 1.0, step=0.05, 
                     key=f"topp_{i}"
                 )
+
+            image_page = 0
+            if provider == "grok":
+                image_page = st.number_input(
+                    "Attach page image (0 = none)",
+                    min_value=0,
+                    max_value=10000,
+                    value=0,
+                    key=f"img_{i}",
+                    help="Sends a downscaled render of this page of the PDF source document, "
+                         "e.g. a test setup figure or labeling."
+                )
+
+            colh1, colh2 = st.columns(2)
+            with colh1:
+                hedge_provider = st.selectbox(
+                    "Hedge / fail over to",
+                    options=[None] + provider_options,
+                    format_func=lambda p: "Off" if p is None else p,
+                    key=f"hedge_{i}",
+                    help="Duplicates the call on this provider when it runs past the model's recent "
+                         "p95 latency, and uses it directly while the primary provider is down."
+                )
+            with colh2:
+                hedge_model = st.text_input(
+                    "Hedge model",
+                    key=f"hedge_model_{i}",
+                    placeholder=default_models.get(hedge_provider, ""),
+                    disabled=hedge_provider is None
+                ) or default_models.get(hedge_provider)
+
+            depends_on = st.multiselect(
+                "Depends on",
+                options=[j + 1 for j in range(num_agents) if j != i],
+                format_func=lambda j: f"Agent {j}",
+                key=f"deps_{i}"
+            )
             
             agent_configs.append({
+                'agent_index': i + 1,
+                'depends_on': depends_on,
+                'image_page': image_page,
+                'routing': {'provider': hedge_provider, 'model': hedge_model, 'percentile': HEDGE_PERCENTILE}
+                           if hedge_provider and hedge_model else None,
+                'name': library_agent,
+                'desc': agent_def.get('desc', ''),
                 'provider': provider,
                 'model': model,
                 'system_prompt': system_prompt,
@@ -567,6 +839,46 @@ with tab4:
                 }
             })
 
+    st.markdown("### Source Document")
+    doc_names = list(st.session_state.documents)
+    colsd1, colsd2 = st.columns([2, 1])
+    with colsd1:
+        source_doc = st.selectbox(
+            "Run agents over an uploaded document",
+            options=[None] + doc_names,
+            format_func=lambda name: "(prompt only)" if name is None else name,
+            key="runner_source_doc"
+        )
+    with colsd2:
+        chunk_budget = st.number_input(
+            "Chunk budget (tokens)",
+            min_value=1000,
+            max_value=200000,
+            value=DEFAULT_CHUNK_TOKENS,
+            step=1000,
+            help="Upper bound on document tokens per call; the model's context window may lower it."
+        )
+    retrieval_k = st.number_input(
+        "Pages per agent (BM25 top-k, 0 = all pages)",
+        min_value=0,
+        max_value=200,
+        value=DEFAULT_TOP_K,
+        step=1,
+        help="Each agent only receives the pages that best match its system prompt and description."
+    ) if source_doc else 0
+    if source_doc:
+        st.caption("Long documents are split on section and page boundaries, reviewed per chunk in "
+                   "parallel, and the per-chunk findings are merged into one answer per agent.")
+        predicate_doc = st.selectbox(
+            "Compare against predicate",
+            options=[None] + [name for name in doc_names if name != source_doc],
+            format_func=lambda name: "(review the document alone)" if name is None else name,
+            key="runner_predicate_doc",
+            help="Aligns the two documents by section and sends agents only what differs from the predicate."
+        )
+    else:
+        predicate_doc = None
+
     st.markdown("### User Prompt")
     user_prompt_text = st.text_area(
         "Enter the prompt to send to each agent", 
@@ -574,70 +886,365 @@ with tab4:
         key="runner_user_prompt"
     )
 
-    if st.button("🚀 Run Agents Sequentially", use_container_width=True):
+    deps = {cfg['agent_index']: cfg['depends_on'] for cfg in agent_configs}
+    labels = {cfg['agent_index']: f"Agent {cfg['agent_index']} ({cfg['provider']}:{cfg['model']})" for cfg in agent_configs}
+    dag_error = None
+    try:
+        validate_dag(deps)
+    except ValueError as e:
+        dag_error = str(e)
+
+    if any(deps.values()):
+        with st.expander("Dependency Graph", expanded=False):
+            st.graphviz_chart(dag_to_dot(deps, labels))
+
+    max_parallel = st.number_input(
+        "Max parallel agents",
+        min_value=1,
+        max_value=10,
+        value=DEFAULT_MAX_WORKERS,
+        step=1
+    )
+
+    colr1, colr2 = st.columns(2)
+    with colr1:
+        stream_output = st.checkbox("Stream tokens as they arrive", value=True)
+    with colr2:
+        cache_mode = st.selectbox(
+            "Response cache",
+            options=[CACHE_USE, CACHE_REFRESH, CACHE_BYPASS],
+            format_func={
+                CACHE_USE: "Use cache",
+                CACHE_REFRESH: "Refresh (re-run and overwrite)",
+                CACHE_BYPASS: "Bypass",
+            }.get,
+            key="runner_cache_mode"
+        )
+
+    doc = st.session_state.documents.get(source_doc) if source_doc else None
+    for cfg in agent_configs:
+        if not cfg['image_page']:
+            continue
+        if doc and doc.get('data') is not None and cfg['image_page'] <= doc['page_count']:
+            cfg['image_url'] = page_image_url(doc['data'], doc['hash'], cfg['image_page'] - 1)
+        else:
+            st.warning(f"Agent {cfg['agent_index']}: page {cfg['image_page']} can't be attached; "
+                       "pick a PDF source document that has it.")
+    if doc and predicate_doc:
+        comparison = compare_documents(st.session_state.documents[predicate_doc], doc)
+        cmp_stats = comparison['stats']
+        doc = comparison_document(comparison)
+        diff_tokens = sum(count_tokens(text) for text in doc['pages'].values())
+        with st.expander(f"Predicate comparison • {cmp_stats[CMP_CHANGED]} changed • {cmp_stats[CMP_ADDED]} added • "
+                         f"{cmp_stats[CMP_REMOVED]} removed • {cmp_stats[CMP_IDENTICAL]} identical sections",
+                         expanded=False):
+            st.caption(f"Agents receive ~{diff_tokens:,} tokens of differences instead of ~{cmp_stats['tokens_full']:,} for both "
+                       f"documents; {cmp_stats['paragraphs_skipped']} of {cmp_stats['paragraphs']} subject "
+                       "paragraphs are identical to the predicate and skipped.")
+            st.dataframe([
+                {
+                    'section': r['title'],
+                    'predicate section': r['predicate_title'] or "—",
+                    'status': r['status'],
+                    'similarity': r['similarity'],
+                    'changed hunks': len(r['hunks']),
+                    'subject pages': ", ".join(map(str, r['subject_pages'])),
+                    'predicate pages': ", ".join(map(str, r['predicate_pages'])),
+                }
+                for r in comparison['sections']
+            ], use_container_width=True, hide_index=True)
+    fingerprints = {
+        cfg['agent_index']: config_fingerprint(cfg, user_prompt_text, top_k=retrieval_k, chunk_budget=chunk_budget)
+        for cfg in agent_configs
+    }
+    rereview_plan = {}
+    if doc:
+        store = get_store()
+        prior_runs = store.recent_runs(limit=20, with_document=True)
+        prior_run_id = st.selectbox(
+            "Incremental re-review: reuse results from",
+            options=[None] + [r['run_id'] for r in prior_runs],
+            format_func=lambda rid: "(run every agent)" if rid is None else next(
+                f"{datetime.fromtimestamp(r['started']).strftime('%Y-%m-%d %H:%M')} • {r['submission']} • "
+                f"{r['agents']} agents" for r in prior_runs if r['run_id'] == rid),
+            key="runner_prior_run",
+            help="Agents whose input pages are unchanged since that run reuse its output; the rest re-run."
+        )
+        if prior_run_id and not dag_error:
+            prior_run = store.run(prior_run_id)
+            rereview_plan = plan_rereview(
+                list(store.iter_entries(run_id=prior_run_id)),
+                {cfg['agent_index']: cfg for cfg in agent_configs},
+                fingerprints, doc, retrieval_k, deps
+            )
+            meta = prior_run.get('doc_meta') or {}
+            diff = diff_documents(meta.get('page_hashes', {}), meta.get('sections', []), doc)
+            reused = sum(1 for p in rereview_plan.values() if p['action'] == REUSE)
+            with st.expander(f"Changes since that run • {reused} of {len(rereview_plan)} agents reused", expanded=True):
+                st.caption(f"{diff['pages_unchanged']} pages unchanged • "
+                           f"{len(diff['pages_new_content'])} new or changed • {len(diff['pages_removed'])} removed • "
+                           f"{len(diff['pages_moved'])} moved")
+                if diff['sections']:
+                    st.dataframe([
+                        {'section': s['title'], 'change': s['change'], 'pages': ", ".join(map(str, s['pages']))}
+                        for s in diff['sections']
+                    ], use_container_width=True, hide_index=True)
+                st.dataframe([
+                    {
+                        'agent': labels[idx],
+                        'action': p['action'],
+                        'reason': p['reason'],
+                        'changed pages': ", ".join(map(str, p['changed_pages'][:15])),
+                    }
+                    for idx, p in sorted(rereview_plan.items())
+                ], use_container_width=True, hide_index=True)
+
+    profiler.phase("runner plan")
+    run_plan = {}
+    if agent_configs and not dag_error:
+        run_plan = plan_run({cfg['agent_index']: cfg for cfg in agent_configs}, user_prompt_text, deps, get_store(),
+                            doc=doc, top_k=retrieval_k, chunk_budget=chunk_budget)
+        total_plan = run_plan['total']
+        cost = "—" if total_plan['cost_usd'] is None else f"${total_plan['cost_usd']:.4f}"
+        with st.expander(f"Pre-flight estimate • ~{total_plan['tokens_in']:,} input tokens • ~{cost} • "
+                         f"~{format_duration(total_plan['latency_s'])}", expanded=False):
+            st.dataframe([
+                {
+                    'agent': labels[idx],
+                    'model': p['model'],
+                    'calls': p['calls'],
+                    'tokens in': p['tokens_in'],
+                    'tokens out (forecast)': p['tokens_out'],
+                    'cost (USD)': p['cost_usd'],
+                    'latency (s)': p['latency_s'],
+                    'history': p['history_runs'],
+                    'action': p['action'],
+                }
+                for idx, p in sorted((k, v) for k, v in run_plan.items() if k != 'total')
+            ], use_container_width=True, hide_index=True)
+            for idx, p in sorted((k, v) for k, v in run_plan.items() if k != 'total'):
+                if p['action'] != PLAN_OK:
+                    st.warning(f"{labels[idx]}: {p['note']}")
+            st.caption(f"Tokens counted {'with tiktoken' if TIKTOKEN_AVAILABLE else 'locally (approximate)'}; "
+                       "latency is the dependency critical path, forecast from each model's recent runs. "
+                       "Prices are approximate list prices.")
+            acc = estimate_accuracy(get_store())
+            if acc['runs']:
+                st.caption(f"Accuracy over the last {acc['runs']} estimated runs (median error): "
+                           + " • ".join(f"{label} {acc[field]:.0%}" for field, label in
+                                        (('tokens_in', 'input tokens'), ('tokens_out', 'output tokens'),
+                                         ('latency_s', 'latency')) if acc[field] is not None))
+
+    if st.button("🚀 Run Agents", use_container_width=True):
         if not user_prompt_text.strip():
             st.warning("Please enter a user prompt before running.")
+        elif dag_error:
+            st.error(dag_error)
         else:
-            progress = st.progress(0.0)
-            run_log = []
             total = len(agent_configs)
+            # Agents whose prompt overflows their model's context run on the planned larger model
+            cfg_by_index = {cfg['agent_index']: dict(cfg, model=run_plan[cfg['agent_index']]['model'])
+                            for cfg in agent_configs}
+            keys = {
+                'openai': openai_key, 
+                'gemini': gemini_key, 
+                'grok': grok_key
+            }
 
-            for i, cfg in enumerate(agent_configs, start=1):
-                agent_label = f"Agent {i} ({cfg['provider']}:{cfg['model']})"
-                
-                with st.status(f"Running {agent_label}...", expanded=True) as status:
+            # Runs on a job worker, not the script thread: no st.* calls in here.
+            # Progress and streamed chunks go to the job table and are polled below.
+            def review_job(job):
+                store = get_store()
+                doc_meta = {'page_hashes': page_hashes(doc), 'sections': document_sections(doc)} if doc else None
+                run_id = store.start_run('app', submission=source_doc, user_prompt=user_prompt_text, agents=total,
+                                         doc_meta=doc_meta)
+                job.run_id = run_id
+                run_log = []
+                run_stats = {idx: {} for idx in deps}
+                cancelled = set()
+
+                def execute_agent(idx, upstream):
                     try:
-                        start = time.time()
-                        
-                        out = run_provider(
-                            provider=cfg['provider'],
-                            config=cfg,
-                            user_prompt=user_prompt_text,
-                            keys={
-                                'openai': openai_key, 
-                                'gemini': gemini_key, 
-                                'grok': grok_key
-                            }
+                        job.check_cancelled()
+                    except JobCancelled:
+                        cancelled.add(idx)
+                        raise
+                    cfg = cfg_by_index[idx]
+                    plan = rereview_plan.get(idx)
+                    if plan and plan['action'] == REUSE:
+                        pages, _ = agent_pages(cfg, doc, retrieval_k)
+                        run_stats[idx].update(cache='reused', input_pages=input_record(doc, pages),
+                                              reused_from=plan['prior']['id'])
+                        return plan['prior']['output']
+                    prompt = fit_prompt(cfg, build_prompt(user_prompt_text, upstream, labels))
+                    with rerun_profile.provider_call(f"{cfg['provider']}:{cfg['model']}"):
+                        return run_agent(
+                            cfg, prompt, keys,
+                            doc=doc,
+                            cache_mode=cache_mode,
+                            top_k=retrieval_k,
+                            chunk_budget=chunk_budget,
+                            on_chunk=job.buffer(idx).append if stream_output else None,
+                            stats=run_stats[idx]
                         )
-                        
-                        elapsed = time.time() - start
-                        status.update(label=f"{agent_label} complete", state="complete")
-                        
-                        entry = {
-                            'agent_index': i,
-                            'provider': cfg['provider'],
-                            'model': cfg['model'],
-                            'output': out,
-                            'elapsed_s': round(elapsed, 2),
-                            'timestamp': datetime.now().isoformat()
-                        }
-                        run_log.append(entry)
-                        
-                        with st.expander(f"Result: {agent_label}", expanded=False):
-                            st.code(out)
-                        
-                        st.toast(f"Agent {i} finished", icon="✅")
-                        
-                    except Exception as e:
-                        status.update(label=f"{agent_label} failed", state="error")
-                        st.error(f"Error: {str(e)}")
-                        
-                        entry = {
-                            'agent_index': i,
-                            'provider': cfg['provider'],
-                            'model': cfg['model'],
-                            'error': str(e),
-                            'timestamp': datetime.now().isoformat()
-                        }
-                        run_log.append(entry)
-                    
-                    progress.progress(i / total)
-
-            st.session_state.run_log = run_log
-            st.success("All agents processed.")
-            st.balloons()
+
+                def on_done(idx, result):
+                    cfg = cfg_by_index[idx]
+                    entry = {
+                        'agent_index': idx,
+                        'agent': cfg['name'] or f"Agent {idx}",
+                        'fingerprint': fingerprints[idx],
+                        'provider': cfg['provider'],
+                        'model': cfg['model'],
+                        'depends_on': cfg['depends_on'],
+                        'estimate': estimate_record(run_plan[idx]),
+                    }
+                    if predicate_doc:
+                        entry['predicate'] = predicate_doc
+                    if run_plan[idx]['action'] == ROUTE:
+                        entry['routed_from'] = next(c['model'] for c in agent_configs if c['agent_index'] == idx)
+                    # Agents the cancel stopped, directly or by cancelling one they depend on
+                    was_cancelled = idx in cancelled or (result['skipped'] and cancelled & set(deps[idx]))
+                    if was_cancelled:
+                        cancelled.add(idx)
+                        entry['status'] = RUN_CANCELLED
+                        entry['error'] = "Cancelled before it started"
+                    elif 'error' in result:
+                        if result['skipped']:
+                            entry['status'] = SKIPPED
+                        entry['error'] = result['error']
+                        entry['retries'] = run_stats[idx].get('retries')
+                    else:
+                        entry['output'] = result['output']
+                        entry['findings'] = parse_findings(result['output'], entry['agent'])
+                        entry['elapsed_s'] = result['elapsed_s']
+                        stats = run_stats[idx]
+                        entry['ttft_s'] = stats.get('ttft_s')
+                        entry['tokens_in'] = stats.get('tokens_in')
+                        entry['tokens_out'] = stats.get('tokens_out')
+                        entry['tokens_per_s'] = stats.get('tokens_per_s')
+                        entry['cache'] = stats.get('cache')
+                        entry['throttle_wait_s'] = stats.get('throttle_wait_s')
+                        entry['retries'] = stats.get('retries')
+                        for field in ('retrieved_pages', 'input_pages', 'reused_from', 'routing'):
+                            if field in stats:
+                                entry[field] = stats[field]
+                        if 'chunks' in stats:
+                            entry['document'] = source_doc
+                            entry['chunks'] = stats['chunks']
+                    entry['queued_s'] = result['queued_s']
+                    entry['timestamp'] = datetime.now().isoformat()
+                    store.record(run_id, entry, submission=source_doc, doc_hash=doc['hash'] if doc else None)
+                    run_log.append(entry)
+                    job.agent_done(idx, output=result.get('output'), error=entry.get('error'),
+                                   skipped=result['skipped'], cancelled=bool(was_cancelled))
+
+                run_started = time.time()
+                run_dag(deps, execute_agent, max_workers=max_parallel, on_start=job.agent_started, on_done=on_done)
+
+                run_errors = sum(1 for e in run_log if 'error' in e and e.get('status') != RUN_CANCELLED)
+                reported = [f for e in run_log for f in e.get('findings', [])]
+                consolidated = consolidate(reported)
+                store.finish_run(run_id, run_errors, time.time() - run_started, findings=consolidated)
+                METRICS.record_review(len(run_log), run_errors, time.time() - run_started)
+                job.summary.update(
+                    findings=len(consolidated),
+                    findings_reported=len(reported),
+                    errors=run_errors,
+                    cache_hits=sum(1 for e in run_log if e.get('cache') == 'hit'),
+                    cache_misses=sum(1 for e in run_log if e.get('cache') in ('miss', 'refresh')),
+                    reused=sum(1 for e in run_log if e.get('cache') == 'reused'),
+                )
+
+            title = (f"{total} agent{'s' if total != 1 else ''}" + (f" on {source_doc}" if source_doc else "")
+                     + (f" vs {predicate_doc}" if predicate_doc else ""))
+            st.session_state.active_job = JOBS.submit(title, review_job, {idx: labels[idx] for idx in deps},
+                                                      owner=st.session_state.session_tag)
+            st.toast(f"Queued: {title}", icon="🕒")
+
+    profiler.phase("jobs panel")
+    st.markdown("### Background Jobs")
+    recent_jobs = JOBS.jobs(limit=20)
+    if recent_jobs:
+        job_ids = [j['id'] for j in recent_jobs]
+        if st.session_state.active_job not in job_ids:
+            st.session_state.active_job = job_ids[0]
+        session_tag = st.session_state.session_tag
+        st.session_state.active_job = st.selectbox(
+            "Job",
+            options=job_ids,
+            index=job_ids.index(st.session_state.active_job),
+            format_func=lambda jid: next(
+                f"{datetime.fromtimestamp(j['created']).strftime('%H:%M:%S')} • {j['title']}"
+                + (" • yours" if j['owner'] == session_tag else "")
+                for j in recent_jobs if j['id'] == jid),
+            help="Jobs keep running across reruns and page refreshes; every session shares the same workers."
+        )
+        active = JOBS.get(st.session_state.active_job)
+        polling = active is not None and active.status not in FINISHED_STATES
+
+        @st.fragment(run_every=JOB_POLL_S if polling else None)
+        def job_panel():
+            snap = JOBS.get(st.session_state.active_job).snapshot()
+            if snap['status'] in FINISHED_STATES and (polling or st.session_state.get('job_seen') != snap['id']):
+                st.session_state.job_seen = snap['id']
+                if snap['run_id'] and snap['owner'] == session_tag:
+                    st.session_state.last_run_id = snap['run_id']
+                # Stop polling and let the rest of the page (run log export) see the finished run
+                st.rerun()
+            elapsed = format_duration(snap['elapsed_s']) if snap['elapsed_s'] is not None else "queued"
+            st.progress(snap['progress'], text=f"{snap['status']} • {snap['done']}/{snap['total']} agents • {elapsed}")
+            if snap['status'] not in FINISHED_STATES and st.button("⏹️ Cancel job", key=f"cancel_{snap['id']}"):
+                JOBS.cancel(snap['id'])
+                st.toast("Cancelling: running agents finish, the rest are skipped", icon="⏹️")
+            for agent in snap['agents'].values():
+                if agent['state'] in ('pending', 'cancelled'):
+                    st.markdown(f'<span class="status-chip chip-pending">{agent["state"]}</span> {agent["label"]}',
+                                unsafe_allow_html=True)
+                    continue
+                state = {'running': 'running', 'complete': 'complete'}.get(agent['state'], 'error')
+                with st.status(f"{agent['label']} {agent['state']}", state=state,
+                               expanded=agent['state'] == 'running' and bool(agent['partial'])):
+                    if agent['error']:
+                        st.error(f"Error: {agent['error']}")
+                    elif agent['output'] is not None:
+                        st.code(agent['output'])
+                    elif agent['partial']:
+                        st.code(agent['partial'])
+            if snap['status'] == FAILED:
+                st.error(f"Job failed: {snap['error']}")
+            elif snap['status'] in (DONE, CANCELLED):
+                summary = snap['summary']
+                if summary:
+                    st.caption(f"Response cache: {summary['cache_hits']} hits • {summary['cache_misses']} misses"
+                               + (f" • {summary['reused']} agents reused from the prior run" if summary['reused'] else ""))
+                if snap['status'] == DONE:
+                    st.success("All agents processed.")
+                else:
+                    st.warning("Job cancelled.")
+                run = get_store().run(snap['run_id']) if snap['run_id'] else None
+                if run and run['findings']:
+                    counts = severity_counts(run['findings'])
+                    with st.expander(f"📋 Consolidated Findings • {len(run['findings'])} from "
+                                     f"{summary.get('findings_reported', '?')} reported • "
+                                     + " • ".join(f"{n} {sev}" for sev, n in counts.items() if n),
+                                     expanded=True):
+                        st.dataframe([
+                            {'severity': f['severity'], 'finding': f['text'], 'standards': ", ".join(f['standards']),
+                             'pages': ", ".join(map(str, f['pages'])), 'agents': ", ".join(f['agents']),
+                             'reported by': f['count']}
+                            for f in run['findings']
+                        ], use_container_width=True, hide_index=True)
+                        st.download_button("⬇️ Findings CSV", data=lambda: spool(findings_csv(run['findings'])),
+                                           file_name="findings.csv", mime="text/csv",
+                                           key=f"findings_csv_{snap['id']}")
+
+        job_panel()
+    else:
+        st.caption("No jobs yet. Runs are queued here and keep going while you use the rest of the app.")
 
 # Footer
+profiler.phase("footer")
 st.divider()
 st.markdown("""
 <div style='text-align: center; color: #92400E; font-size: 0.9em;'>
@@ -645,3 +1252,41 @@ st.markdown("""
     <p>Powered by Multi-Provider AI • Streamlit</p>
 </div>
 """, unsafe_allow_html=True)
+
+if startup_profile.ENABLED:
+    run_times = startup_profile.record_run(_script_start, _imports_done)
+    with st.sidebar.expander("⏱️ Startup Profile", expanded=False):
+        first = startup_profile.FIRST_RUN
+        st.caption(f"First run: imports {first['imports_s'] * 1000:.0f} ms • script {first['script_s'] * 1000:.0f} ms")
+        st.caption(f"This run: imports {run_times['imports_s'] * 1000:.0f} ms • "
+                   f"script {run_times['script_s'] * 1000:.0f} ms")
+        if IMPORT_TIMES:
+            st.caption("Provider SDKs (on first use): " +
+                       " • ".join(f"{p} {s * 1000:.0f} ms" for p, s in IMPORT_TIMES.items()))
+
+rerun = profiler.end()
+if rerun is not None:
+    with st.sidebar.expander(f"🩺 Rerun Profile • {rerun['total_ms']:.0f} ms • {rerun['alloc_kb']:+,.0f} KB",
+                             expanded=False):
+        st.caption(f"Rerun {rerun['rerun']} of this session • {rerun['traced_kb'] / 1024:.1f} MB traced • "
+                   f"history of the last {len(profiler.history)} reruns")
+        st.dataframe([
+            {'section': ("  " * sec['depth']) + sec['section'], 'ms': sec['ms'], 'alloc KB': sec['alloc_kb'],
+             'peak KB': sec['peak_kb']}
+            for sec in rerun['sections']
+        ], use_container_width=True, hide_index=True)
+        if len(profiler.history) > 1:
+            st.line_chart({'total ms': [r['total_ms'] for r in profiler.history]}, height=120)
+            st.dataframe(profiler.summary(), use_container_width=True, hide_index=True)
+        if rerun['top_growth']:
+            st.caption("Allocation sites that grew since the previous rerun")
+            st.dataframe(rerun['top_growth'], use_container_width=True, hide_index=True)
+        calls = rerun_profile.provider_call_summary()
+        if calls:
+            st.caption("Provider calls on job workers")
+            st.dataframe([dict(call=label, **c) for label, c in calls.items()], use_container_width=True,
+                         hide_index=True)
+        st.download_button("⬇️ Export profile (JSON)",
+                           data=lambda: json.dumps(profiler.export(), indent=2, default=str),
+                           file_name="rerun_profile.json", mime="application/json", use_container_width=True,
+                           help="Compare two exports with: python rerun_profile.py diff before.json after.json")
@@ -0,0 +1,299 @@
+"""
+Headless batch review: run the agent library across a folder of submissions
+
+    python batch_review.py submissions/ --out batch_results/ \
+        --provider openai --model gpt-4o-mini --processes 2 --threads 4
+
+With --predicate, each submission is compared section by section against
+the predicate's document and agents only review what differs (see
+comparison.py).
+
+Writes one <document>.json per submission plus report.json / report.md, and
+records every agent run in the shared run store (see run_store.py).
+Re-running with the same --out resumes: a document is skipped only when every
+requested agent already succeeded under the same prompt, settings and
+predicate, and otherwise only the missing, failed or changed agents re-run. API keys come from
+GOOGLE_API_KEY, OPENAI_API_KEY and XAI_API_KEY.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from datetime import datetime
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from agent_library import AGENTS_FILE, load_agents, agent_config
+from ingest import TEXT_SUFFIXES, load_document
+from response_cache import CACHE_USE, CACHE_MODES
+from retrieval import DEFAULT_TOP_K
+from chunking import DEFAULT_CHUNK_TOKENS
+from runner import DEFAULT_MAX_WORKERS, config_fingerprint, run_dag, run_agent
+from run_store import get_store
+from findings import parse_findings, consolidate, severity_counts
+from comparison import compare_documents, comparison_document
+
+DEFAULT_PROMPT = ("Review the following 510(k) submission content within your scope and report findings "
+                  "as CRITICAL/MAJOR/MINOR with page references.")
+SUPPORTED_SUFFIXES = ('.pdf',) + TEXT_SUFFIXES
+
+
+def env_keys():
+    return {
+        'gemini': os.getenv("GOOGLE_API_KEY", ""),
+        'openai': os.getenv("OPENAI_API_KEY", ""),
+        'grok': os.getenv("XAI_API_KEY", ""),
+    }
+
+
+def find_documents(directory):
+    return sorted(p for p in Path(directory).iterdir()
+                  if p.is_file() and p.suffix.lower() in SUPPORTED_SUFFIXES)
+
+
+def _write_json(path, data):
+    tmp = path.with_suffix(path.suffix + '.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def agent_fingerprints(configs, prompt, top_k=DEFAULT_TOP_K, chunk_budget=DEFAULT_CHUNK_TOKENS, predicate=None):
+    """{agent name: fingerprint} of each agent under this prompt, retrieval/chunk settings and predicate"""
+    return {cfg['name']: config_fingerprint(cfg, prompt, top_k=top_k, chunk_budget=chunk_budget,
+                                            predicate=predicate['hash'] if predicate else None)
+            for cfg in configs}
+
+
+def is_current(result, fingerprints):
+    """True when a saved result is complete with every requested agent's output under matching fingerprints"""
+    done = {e['agent']: e.get('fingerprint') for e in result.get('agents', []) if 'output' in e}
+    return result.get('status') == 'complete' and all(done.get(n) == fp for n, fp in fingerprints.items())
+
+
+def review_document(path, configs, out_dir, prompt=DEFAULT_PROMPT, threads=DEFAULT_MAX_WORKERS,
+                    cache_mode=CACHE_USE, top_k=DEFAULT_TOP_K, chunk_budget=DEFAULT_CHUNK_TOKENS, predicate=None):
+    """Run every agent config over one document (or its differences from predicate), saving after each agent"""
+    path = Path(path)
+    result_path = Path(out_dir) / f"{path.name}.json"
+    started = time.time()
+    doc = load_document(path)
+    comparison = None
+    if predicate is not None:
+        comparison = compare_documents(predicate, doc)
+        doc = comparison_document(comparison)
+
+    prior = {}
+    if result_path.exists():
+        with open(result_path, 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+        if previous.get('hash') == doc['hash']:
+            prior = {e['agent']: e for e in previous.get('agents', []) if 'output' in e}
+
+    result = {
+        'document': path.name,
+        'hash': doc['hash'],
+        'page_count': doc['page_count'],
+        'predicate': comparison['predicate'] if comparison else None,
+        'comparison': comparison['stats'] if comparison else None,
+        'status': 'running',
+        'started': datetime.now().isoformat(),
+        'agents': [],
+    }
+    fingerprints = agent_fingerprints(configs, prompt, top_k, chunk_budget, predicate)
+    todo = {}
+    for cfg in configs:
+        done = prior.get(cfg['name'])
+        if done and done.get('fingerprint') == fingerprints[cfg['name']]:
+            result['agents'].append(dict(done, resumed=True))
+        else:
+            todo[cfg['name']] = cfg
+    _write_json(result_path, result)
+
+    keys = env_keys()
+    run_stats = {name: {} for name in todo}
+    store = get_store()
+    run_id = store.start_run('batch', submission=path.name, user_prompt=prompt, agents=len(todo))
+
+    def execute(name, upstream):
+        return run_agent(todo[name], prompt, keys, doc=doc, cache_mode=cache_mode, top_k=top_k,
+                         chunk_budget=chunk_budget, stats=run_stats[name])
+
+    def on_done(name, res):
+        cfg = todo[name]
+        stats = run_stats[name]
+        entry = {
+            'agent': name,
+            'fingerprint': fingerprints[name],
+            'provider': cfg['provider'],
+            'model': cfg['model'],
+        }
+        if 'error' in res:
+            entry['error'] = res['error']
+        else:
+            entry['output'] = res['output']
+            entry['findings'] = parse_findings(res['output'], name)
+        entry['elapsed_s'] = res['elapsed_s']
+        for field in ('tokens_in', 'tokens_out', 'cache', 'throttle_wait_s', 'retries',
+                      'retrieved_pages', 'input_pages', 'chunks'):
+            if field in stats:
+                entry[field] = stats[field]
+        entry['timestamp'] = datetime.now().isoformat()
+        store.record(run_id, entry, submission=path.name, doc_hash=doc['hash'])
+        result['agents'].append(entry)
+        _write_json(result_path, result)
+
+    run_dag({name: [] for name in todo}, execute, max_workers=threads, on_done=on_done)
+
+    order = [cfg['name'] for cfg in configs]
+    result['agents'].sort(key=lambda e: order.index(e['agent']))
+    failed = [e['agent'] for e in result['agents'] if 'error' in e]
+    result['status'] = 'partial' if failed else 'complete'
+    # Resumed entries from older result files may predate findings parsing
+    result['findings'] = consolidate([
+        f for e in result['agents'] if 'output' in e
+        for f in (e['findings'] if 'findings' in e else parse_findings(e['output'], e['agent']))
+    ])
+    result['finished'] = datetime.now().isoformat()
+    result['elapsed_s'] = round(time.time() - started, 2)
+    _write_json(result_path, result)
+    store.finish_run(run_id, len(failed), result['elapsed_s'], findings=result['findings'])
+    return summarize(result)
+
+
+def summarize(result):
+    return {
+        'document': result['document'],
+        'status': result['status'],
+        'page_count': result.get('page_count'),
+        'agents_ok': sum(1 for e in result['agents'] if 'output' in e),
+        'agents_failed': [e['agent'] for e in result['agents'] if 'error' in e],
+        'agents_resumed': sum(1 for e in result['agents'] if e.get('resumed')),
+        'findings': severity_counts(result.get('findings', [])),
+        'elapsed_s': result.get('elapsed_s'),
+    }
+
+
+def write_report(out_dir, documents):
+    """Consolidate every per-document result file into report.json and report.md"""
+    out_dir = Path(out_dir)
+    results = []
+    for path in documents:
+        result_path = out_dir / f"{Path(path).name}.json"
+        if result_path.exists():
+            with open(result_path, 'r', encoding='utf-8') as f:
+                results.append(json.load(f))
+
+    report = {
+        'generated': datetime.now().isoformat(),
+        'documents': [summarize(r) for r in results],
+    }
+    _write_json(out_dir / 'report.json', report)
+
+    lines = ["# Batch Review Report", "", f"Generated {report['generated']}", "",
+             "| Document | Status | Pages | Agents OK | Failed | Critical / Major / Minor | Elapsed (s) |",
+             "|---|---|---|---|---|---|---|"]
+    for s in report['documents']:
+        counts = " / ".join(str(n) for n in s['findings'].values())
+        lines.append(f"| {s['document']} | {s['status']} | {s['page_count']} | {s['agents_ok']} | "
+                     f"{', '.join(s['agents_failed']) or '-'} | {counts} | {s['elapsed_s']} |")
+    for r in results:
+        lines += ["", f"## {r['document']}"]
+        if r.get('findings'):
+            lines += ["", "### Consolidated findings", ""]
+            for f in r['findings']:
+                refs = ", ".join(f['standards'] + ([f"p. {', '.join(map(str, f['pages']))}"] if f['pages'] else []))
+                lines.append(f"- **{f['severity']}** {f['text']}" + (f" ({refs})" if refs else "")
+                             + f" — {', '.join(f['agents']) or 'unattributed'}")
+        for e in r['agents']:
+            lines += ["", f"### {e['agent']} ({e['provider']}:{e['model']})", ""]
+            lines.append(e['output'] if 'output' in e else f"**Error:** {e['error']}")
+    with open(out_dir / 'report.md', 'w', encoding='utf-8') as f:
+        f.write("\n".join(lines) + "\n")
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the agent library across a folder of submissions.")
+    parser.add_argument('directory', help="folder of .pdf/.txt/.md/.json/.csv submissions")
+    parser.add_argument('--out', default='batch_results', help="output folder (also the resume state)")
+    parser.add_argument('--agents-file', default=AGENTS_FILE)
+    parser.add_argument('--agent', action='append', dest='agents',
+                        help="agent name to run (repeatable; default: every library agent)")
+    parser.add_argument('--provider', default='openai', choices=['gemini', 'openai', 'grok'],
+                        help="provider for agents that don't declare one")
+    parser.add_argument('--model', default='gpt-4o-mini', help="model for agents that don't declare one")
+    parser.add_argument('--prompt', default=DEFAULT_PROMPT, help="instructions sent with each document")
+    parser.add_argument('--predicate', help="predicate device document; agents review only the differences")
+    parser.add_argument('--processes', type=int, default=1, help="documents reviewed in parallel")
+    parser.add_argument('--threads', type=int, default=DEFAULT_MAX_WORKERS, help="agents per document in parallel")
+    parser.add_argument('--top-k', type=int, default=DEFAULT_TOP_K, help="pages per agent (0 = all)")
+    parser.add_argument('--chunk-budget', type=int, default=DEFAULT_CHUNK_TOKENS)
+    parser.add_argument('--cache', default=CACHE_USE, choices=CACHE_MODES)
+    parser.add_argument('--no-resume', action='store_true', help="re-run documents that already completed")
+    args = parser.parse_args(argv)
+
+    library = load_agents(args.agents_file).get('agents', [])
+    if args.agents:
+        unknown = set(args.agents) - {a.get('name') for a in library}
+        if unknown:
+            parser.error(f"unknown agent(s): {', '.join(sorted(unknown))}")
+        library = [a for a in library if a.get('name') in args.agents]
+    configs = [agent_config(a, args.provider, args.model) for a in library]
+    if not configs:
+        parser.error("no agents to run")
+
+    documents = find_documents(args.directory)
+    if args.predicate:
+        documents = [p for p in documents if p.resolve() != Path(args.predicate).resolve()]
+    if not documents:
+        parser.error(f"no supported documents in {args.directory}")
+    out_dir = Path(args.out)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    predicate = load_document(args.predicate) if args.predicate else None
+    fingerprints = agent_fingerprints(configs, args.prompt, args.top_k, args.chunk_budget, predicate)
+    todo = []
+    for path in documents:
+        result_path = out_dir / f"{path.name}.json"
+        if not args.no_resume and result_path.exists():
+            with open(result_path, 'r', encoding='utf-8') as f:
+                # Added agents or a changed prompt, setting or predicate re-run what they affect
+                if is_current(json.load(f), fingerprints):
+                    print(f"skip  {path.name} (complete)")
+                    continue
+        if args.no_resume and result_path.exists():
+            result_path.unlink()
+        todo.append(path)
+
+    kwargs = dict(prompt=args.prompt, threads=args.threads, cache_mode=args.cache,
+                  top_k=args.top_k, chunk_budget=args.chunk_budget, predicate=predicate)
+    failures = 0
+
+    def _report(path, get_summary):
+        try:
+            summary = get_summary()
+        except Exception as e:
+            print(f"failed   {path.name}: {e}", file=sys.stderr)
+            return 1
+        print(f"{summary['status']:8s} {path.name} ({summary['elapsed_s']}s)")
+        return int(summary['status'] != 'complete')
+
+    if args.processes <= 1:
+        for path in todo:
+            failures += _report(path, lambda: review_document(path, configs, out_dir, **kwargs))
+    else:
+        with ProcessPoolExecutor(max_workers=args.processes) as pool:
+            futures = {pool.submit(review_document, path, configs, out_dir, **kwargs): path for path in todo}
+            for fut in as_completed(futures):
+                failures += _report(futures[fut], fut.result)
+
+    write_report(out_dir, documents)
+    print(f"Report written to {out_dir / 'report.md'}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,8 @@
+"""
+Offline benchmark harness for the review pipeline
+
+    python -m bench run --agents 1 5 10 --pages 10 100 500
+    python -m bench record --fixtures bench/fixtures.jsonl --provider openai --model gpt-4o-mini
+    python -m bench run --replay bench/fixtures.jsonl
+    python -m bench load --pages 10 100 1000 --sessions 1 8 32
+"""
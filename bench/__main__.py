@@ -0,0 +1,339 @@
+"""
+Benchmark CLI: runner wall time, per-agent overhead, ingestion throughput, memory peak
+
+    python -m bench run [--agents 1 5 10] [--pages 10 100 500] [--replay fixtures.jsonl]
+    python -m bench load [--pages 10 100 1000] [--sessions 1 8 32] [--format txt|pdf]
+    python -m bench record --fixtures fixtures.jsonl --provider openai --model gpt-4o-mini
+"""
+
+import os
+import sys
+import json
+import time
+import tempfile
+import platform
+import argparse
+import statistics
+import tracemalloc
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from agent_library import load_agents, agent_config
+from ingest import PYMUPDF_AVAILABLE, content_hash, iter_page_text, load_document
+from response_cache import CACHE_BYPASS
+from ratelimit import LIMITS
+from runner import run_dag, run_agent
+from batch_review import env_keys
+from bench.stub_server import DEFAULT_PROFILE, StubServer
+from bench.fixtures import FixtureRecorder, FixtureReplayer
+import corpus
+
+def corpus_doc(n_pages, seed=0):
+    """A generated submission (see corpus.py) in memory, as load_document would read its text file"""
+    pages = dict(enumerate(corpus.iter_pages(corpus.plan_submission(n_pages, seed))))
+    digest = content_hash("\f".join(pages.values()).encode('utf-8'))
+    return {'name': f"synthetic-{n_pages}p", 'hash': digest, 'page_count': n_pages, 'pages': pages}
+
+
+def corpus_pdf(n_pages, seed=0):
+    """PDF bytes of a generated submission"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "submission.pdf")
+        corpus.generate(path, n_pages, seed)
+        with open(path, 'rb') as f:
+            return f.read()
+
+
+def bench_configs(n_agents, provider, model):
+    library = load_agents().get('agents', [])
+    configs = []
+    for i in range(n_agents):
+        cfg = agent_config(library[i % len(library)], provider, model)
+        cfg['name'] = f"{cfg['name']} #{i + 1}"
+        configs.append(cfg)
+    return configs
+
+
+def measure(fn):
+    """(result, wall_s, python_peak_mb) for one call"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = fn()
+    finally:
+        wall = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return result, wall, peak / 1e6
+
+
+def run_review(configs, doc, keys, threads, top_k):
+    stats = {cfg['name']: {} for cfg in configs}
+    by_name = {cfg['name']: cfg for cfg in configs}
+
+    def execute(name, upstream):
+        return run_agent(by_name[name], "Review this submission.", keys, doc=doc, cache_mode=CACHE_BYPASS,
+                         top_k=top_k, stats=stats[name])
+
+    results = run_dag({name: [] for name in by_name}, execute, max_workers=threads)
+    return results, stats
+
+
+def bench_runner(agent_counts, page_sizes, keys, provider, model, threads, top_k, seed):
+    rows = []
+    # Untimed warm-up: imports, client setup and connection pools are paid for here
+    run_review(bench_configs(min(agent_counts), provider, model), corpus_doc(min(page_sizes), seed), keys,
+               threads, top_k)
+    for pages in page_sizes:
+        doc = corpus_doc(pages, seed)
+        for n_agents in agent_counts:
+            configs = bench_configs(n_agents, provider, model)
+            (results, stats), wall, peak = measure(lambda: run_review(configs, doc, keys, threads, top_k))
+            agent_s = [r['elapsed_s'] for r in results.values() if 'output' in r]
+            rows.append({
+                'agents': n_agents,
+                'pages': pages,
+                'wall_s': round(wall, 3),
+                'errors': sum(1 for r in results.values() if 'error' in r),
+                'calls': sum(len(s.get('chunks', [])) for s in stats.values()),
+                'mean_agent_s': round(sum(agent_s) / len(agent_s), 3) if agent_s else None,
+                'tokens_in': sum(s.get('tokens_in') or 0 for s in stats.values()),
+                'py_peak_mb': round(peak, 2),
+            })
+            print(f"runner   agents={n_agents:<3} pages={pages:<5} wall={wall:.2f}s", file=sys.stderr)
+    return rows
+
+
+def bench_ingest(page_sizes, seed):
+    rows = []
+    if not PYMUPDF_AVAILABLE:
+        return rows
+    for pages in page_sizes:
+        for parallel in (False, True):
+            # A document of its own per pass, so the shared page cache can't serve it
+            data = corpus_pdf(pages, seed + int(parallel))
+            _, wall, peak = measure(lambda: sum(1 for _ in iter_page_text(data, parallel=parallel)))
+            rows.append({
+                'pages': pages,
+                'parallel': parallel,
+                'wall_s': round(wall, 3),
+                'pages_per_s': round(pages / wall, 1) if wall else None,
+                'py_peak_mb': round(peak, 2),
+            })
+            print(f"ingest   pages={pages:<5} parallel={parallel!s:<5} wall={wall:.2f}s", file=sys.stderr)
+    return rows
+
+
+def review_session(path, configs, keys, threads, top_k):
+    """One user's review: load the submission from disk, then run every agent on it"""
+    started = time.perf_counter()
+    doc = load_document(path)
+    ingest_s = time.perf_counter() - started
+    results, _ = run_review(configs, doc, keys, threads, top_k)
+    return {'ingest_s': ingest_s, 'session_s': time.perf_counter() - started,
+            'errors': sum(1 for r in results.values() if 'error' in r)}
+
+
+def bench_load(page_sizes, session_counts, corpus_dir, fmt, keys, provider, model, n_agents, threads, top_k,
+               seed):
+    """Concurrent review sessions over generated submissions; each session gets its own document"""
+    rows = []
+    configs = bench_configs(n_agents, provider, model)
+    outline = corpus.submission_outline()
+    for pages in page_sizes:
+        # Distinct documents, so sessions don't share page or section caches
+        paths = []
+        for i in range(max(session_counts)):
+            path = os.path.join(corpus_dir, f"load-{pages}p-{i + 1:03d}.{fmt}")
+            if not os.path.exists(path):
+                corpus.generate(path, pages, seed * 1000003 + pages * 1009 + i, outline=outline)
+            paths.append(path)
+        for sessions in session_counts:
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=sessions) as pool:
+                runs = list(pool.map(lambda p: review_session(p, configs, keys, threads, top_k), paths[:sessions]))
+            wall = time.perf_counter() - started
+            session_s = sorted(r['session_s'] for r in runs)
+            rows.append({
+                'pages': pages,
+                'sessions': sessions,
+                'wall_s': round(wall, 3),
+                'session_p50_s': round(statistics.median(session_s), 3),
+                'session_p95_s': round(session_s[min(len(session_s) - 1, int(0.95 * len(session_s)))], 3),
+                'ingest_max_s': round(max(r['ingest_s'] for r in runs), 3),
+                'pages_per_s': round(pages * sessions / wall, 1) if wall else None,
+                'errors': sum(r['errors'] for r in runs),
+                'rss_peak_mb': rss_peak_mb(),
+            })
+            print(f"load     pages={pages:<5} sessions={sessions:<3} wall={wall:.2f}s", file=sys.stderr)
+    return rows
+
+
+def markdown_table(rows):
+    if not rows:
+        return "(no rows)"
+    cols = list(rows[0])
+    lines = ["| " + " | ".join(cols) + " |", "|" + "---|" * len(cols)]
+    lines += ["| " + " | ".join(str(r[c]) for c in cols) + " |" for r in rows]
+    return "\n".join(lines)
+
+
+def rss_peak_mb():
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(peak / (1e6 if sys.platform == "darwin" else 1e3), 1)
+    except ImportError:
+        return None
+
+
+def stub_keys(server):
+    # One key per server so the client registry doesn't reuse a client bound to an old base_url
+    return {'openai': f"sk-bench-{server.httpd.server_address[1]}", 'gemini': '', 'grok': ''}
+
+
+def cmd_run(args):
+    # Benchmarks measure the pipeline, not our own throttling
+    for provider in {"openai", args.provider}:
+        LIMITS.configure(provider, rpm=10 ** 6, tpm=10 ** 9)
+    profile = dict(DEFAULT_PROFILE, seed=args.seed, ttft_median_s=args.ttft, tokens_per_s_mean=args.tokens_per_s,
+                   output_tokens=args.output_tokens, error_rate_429=args.error_rate)
+    report = {
+        'meta': {
+            'generated': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'seed': args.seed,
+            'source': f"replay:{args.replay}" if args.replay else "stub",
+            'profile': profile if not args.replay else {'speed': args.speed},
+            'threads': args.threads,
+            'top_k': args.top_k,
+        },
+    }
+
+    if args.replay:
+        with FixtureReplayer(args.replay, speed=args.speed) as replayer:
+            # Replayed calls never reach the provider, so a placeholder key will do
+            keys = {p: k or "replay" for p, k in env_keys().items()}
+            report['runner'] = bench_runner(args.agents, args.pages, keys, args.provider, args.model,
+                                            args.threads, args.top_k, args.seed)
+            report['meta']['replay'] = {'served': replayer.served, 'missing': replayer.missing}
+        report['overhead'] = []
+    else:
+        with StubServer(**profile) as server:
+            os.environ["OPENAI_BASE_URL"] = server.base_url
+            report['runner'] = bench_runner(args.agents, args.pages, stub_keys(server), "openai", "stub-model",
+                                            args.threads, args.top_k, args.seed)
+        # Zero-latency provider: whatever time remains is our own per-agent overhead
+        with StubServer(**dict(profile, ttft_median_s=0.0, tokens_per_s_mean=10 ** 6,
+                               tokens_per_s_sd=0.0, error_rate_429=0.0)) as server:
+            os.environ["OPENAI_BASE_URL"] = server.base_url
+            report['overhead'] = bench_runner(args.agents, args.pages[:1], stub_keys(server), "openai",
+                                              "stub-model-0ms", args.threads, args.top_k, args.seed)
+    report['ingest'] = [] if args.skip_ingest else bench_ingest(args.pages, args.seed)
+    report['meta']['rss_peak_mb'] = rss_peak_mb()
+
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    for section in ('runner', 'overhead', 'ingest'):
+        print(f"\n## {section}\n")
+        print(markdown_table(report[section]))
+    print(f"\nReport written to {args.out}")
+
+
+def cmd_load(args):
+    if args.format == 'pdf' and not PYMUPDF_AVAILABLE:
+        sys.exit("PyMuPDF is not installed; use --format txt")
+    for provider in {"openai", args.provider}:
+        LIMITS.configure(provider, rpm=10 ** 6, tpm=10 ** 9)
+    profile = dict(DEFAULT_PROFILE, seed=args.seed, ttft_median_s=args.ttft, tokens_per_s_mean=args.tokens_per_s,
+                   output_tokens=args.output_tokens)
+    with tempfile.TemporaryDirectory(prefix="bench-corpus-") as tmp:
+        corpus_dir = args.corpus or tmp
+        os.makedirs(corpus_dir, exist_ok=True)
+        with StubServer(**profile) as server:
+            os.environ["OPENAI_BASE_URL"] = server.base_url
+            rows = bench_load(args.pages, args.sessions, corpus_dir, args.format, stub_keys(server), "openai",
+                              "stub-model", args.agents, args.threads, args.top_k, args.seed)
+    report = {
+        'meta': {
+            'generated': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'seed': args.seed,
+            'format': args.format,
+            'agents': args.agents,
+            'profile': profile,
+            'threads': args.threads,
+            'top_k': args.top_k,
+        },
+        'load': rows,
+    }
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(markdown_table(rows))
+    print(f"\nReport written to {args.out}")
+
+
+def cmd_record(args):
+    with FixtureRecorder(args.fixtures) as recorder:
+        rows = bench_runner(args.agents, args.pages, env_keys(), args.provider, args.model, args.threads,
+                            args.top_k, args.seed)
+    print(markdown_table(rows))
+    print(f"\nRecorded {recorder.recorded} responses to {args.fixtures}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench", description="Offline review pipeline benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def common(p):
+        p.add_argument('--agents', type=int, nargs='+', default=[1, 5, 10], help="agent counts to sweep")
+        p.add_argument('--pages', type=int, nargs='+', default=[10, 100, 500], help="document sizes to sweep")
+        p.add_argument('--threads', type=int, default=4)
+        p.add_argument('--top-k', type=int, default=12)
+        p.add_argument('--seed', type=int, default=0)
+        p.add_argument('--provider', default='openai')
+        p.add_argument('--model', default='gpt-4o-mini')
+
+    run = sub.add_parser('run', help="benchmark against the stub server or recorded fixtures")
+    common(run)
+    run.add_argument('--replay', help="fixtures JSONL to replay instead of the stub server")
+    run.add_argument('--speed', type=float, default=1.0, help="replay latency scale (0 = instant)")
+    run.add_argument('--ttft', type=float, default=DEFAULT_PROFILE['ttft_median_s'])
+    run.add_argument('--tokens-per-s', type=float, default=DEFAULT_PROFILE['tokens_per_s_mean'])
+    run.add_argument('--output-tokens', type=int, default=DEFAULT_PROFILE['output_tokens'])
+    run.add_argument('--error-rate', type=float, default=DEFAULT_PROFILE['error_rate_429'])
+    run.add_argument('--skip-ingest', action='store_true')
+    run.add_argument('--out', default='bench_report.json')
+    run.set_defaults(func=cmd_run)
+
+    load = sub.add_parser('load', help="concurrent review sessions over generated 510(k) submissions")
+    load.add_argument('--pages', type=int, nargs='+', default=[10, 100, 1000], help="submission sizes")
+    load.add_argument('--sessions', type=int, nargs='+', default=[1, 8, 32], help="concurrent session counts")
+    load.add_argument('--agents', type=int, default=3, help="agents per session")
+    load.add_argument('--format', default='txt', choices=corpus.FORMATS)
+    load.add_argument('--corpus', help="keep generated submissions here and reuse them on later runs")
+    load.add_argument('--threads', type=int, default=4)
+    load.add_argument('--top-k', type=int, default=12)
+    load.add_argument('--seed', type=int, default=0)
+    load.add_argument('--provider', default='openai')
+    load.add_argument('--ttft', type=float, default=DEFAULT_PROFILE['ttft_median_s'])
+    load.add_argument('--tokens-per-s', type=float, default=DEFAULT_PROFILE['tokens_per_s_mean'])
+    load.add_argument('--output-tokens', type=int, default=DEFAULT_PROFILE['output_tokens'])
+    load.add_argument('--out', default='bench_load.json')
+    load.set_defaults(func=cmd_load)
+
+    record = sub.add_parser('record', help="run against a real provider and save fixtures")
+    common(record)
+    record.add_argument('--fixtures', required=True)
+    record.set_defaults(func=cmd_record)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
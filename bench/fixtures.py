@@ -0,0 +1,117 @@
+"""
+Record/replay fixtures for run_provider
+
+Recording tees every provider response (keyed like the response cache) into
+a JSONL file together with its latency profile. Replaying serves those
+responses without any network, optionally reproducing the recorded latency,
+so runner changes can be compared against real provider behaviour for free.
+"""
+
+import json
+import time
+import threading
+
+import providers
+from providers import estimate_tokens
+from response_cache import cache_key
+
+
+class FixtureRecorder:
+    """Context manager that appends each real provider response to a JSONL file"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._original = None
+        self.recorded = 0
+
+    def _write(self, record):
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self.recorded += 1
+
+    def __enter__(self):
+        self._original = original = providers._provider_call
+
+        def recording_call(provider, config, user_prompt, keys, stream=False, usage=None, timeout=None, cancel=None):
+            key = cache_key(provider, config, user_prompt)
+            start = time.time()
+            if not stream:
+                text = original(provider, config, user_prompt, keys, timeout=timeout, cancel=cancel)
+                self._write({"key": key, "provider": provider, "model": config.get("model"),
+                             "output": text, "ttft_s": None, "elapsed_s": time.time() - start,
+                             "usage": {}})
+                return text
+
+            def gen():
+                parts, first = [], None
+                for chunk in original(provider, config, user_prompt, keys, stream=True, usage=usage,
+                                      timeout=timeout, cancel=cancel):
+                    if first is None:
+                        first = time.time()
+                    parts.append(chunk)
+                    yield chunk
+                self._write({"key": key, "provider": provider, "model": config.get("model"),
+                             "output": "".join(parts), "ttft_s": (first - start) if first else None,
+                             "elapsed_s": time.time() - start, "usage": dict(usage or {})})
+            return gen()
+
+        providers._provider_call = recording_call
+        return self
+
+    def __exit__(self, *exc):
+        providers._provider_call = self._original
+
+
+class FixtureReplayer:
+    """
+    Context manager serving recorded responses in place of provider calls.
+
+    speed scales the recorded latency (0 = instant, 1 = as recorded).
+    Requests without a fixture raise KeyError so gaps are obvious.
+    """
+
+    def __init__(self, path, speed=1.0):
+        self.speed = speed
+        self.fixtures = {}
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    self.fixtures[record["key"]] = record
+        self._original = None
+        self.served = 0
+        self.missing = 0
+
+    def __enter__(self):
+        self._original = providers._provider_call
+
+        def replay_call(provider, config, user_prompt, keys, stream=False, usage=None, timeout=None, cancel=None):
+            record = self.fixtures.get(cache_key(provider, config, user_prompt))
+            if record is None:
+                self.missing += 1
+                raise KeyError(f"No fixture for {provider}:{config.get('model')} request")
+            self.served += 1
+            output = record["output"]
+            ttft = (record.get("ttft_s") or 0.0) * self.speed
+            rest = max(0.0, record["elapsed_s"] * self.speed - ttft)
+            if not stream:
+                time.sleep(ttft + rest)
+                return output
+
+            def gen():
+                if usage is not None:
+                    usage.update(record.get("usage") or {"output_tokens": estimate_tokens(output)})
+                time.sleep(ttft)
+                pieces = [output[i:i + 64] for i in range(0, len(output), 64)] or [""]
+                for piece in pieces:
+                    yield piece
+                    time.sleep(rest / len(pieces))
+            return gen()
+
+        providers._provider_call = replay_call
+        return self
+
+    def __exit__(self, *exc):
+        providers._provider_call = self._original
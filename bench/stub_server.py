@@ -0,0 +1,148 @@
+"""
+Local OpenAI-compatible stub server with configurable latency and token rate
+
+Serves /v1/models and /v1/chat/completions (streaming and non-streaming).
+Each request's time-to-first-token, token rate and output length are drawn
+from distributions seeded by the request body, so repeated runs see the
+same latencies regardless of thread interleaving.
+"""
+
+import json
+import time
+import random
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_PROFILE = {
+    "ttft_median_s": 0.4,      # lognormal time to first token
+    "ttft_sigma": 0.5,
+    "tokens_per_s_mean": 80.0,  # normal generation rate
+    "tokens_per_s_sd": 20.0,
+    "output_tokens": 300,      # capped by the request's max_tokens
+    "error_rate_429": 0.0,
+    "seed": 0,
+}
+
+WORDS = ("finding", "ISO", "10993-5", "cytotoxicity", "MAJOR", "page", "sterilization", "ASTM",
+         "F2077", "fatigue", "acceptance", "criteria", "deficiency", "MINOR", "CRITICAL", "report")
+
+
+def _rng(profile, body):
+    digest = hashlib.sha256(body + str(profile["seed"]).encode()).digest()
+    return random.Random(int.from_bytes(digest[:8], "big"))
+
+
+def plan_response(profile, body, max_tokens):
+    """(ttft_s, tokens_per_s, n_tokens, throttled) for one request"""
+    rng = _rng(profile, body)
+    ttft = rng.lognormvariate(0, profile["ttft_sigma"]) * profile["ttft_median_s"] if profile["ttft_median_s"] else 0.0
+    rate = max(1.0, rng.gauss(profile["tokens_per_s_mean"], profile["tokens_per_s_sd"]))
+    n_tokens = max(1, min(profile["output_tokens"], max_tokens or profile["output_tokens"]))
+    throttled = rng.random() < profile["error_rate_429"]
+    return ttft, rate, n_tokens, throttled
+
+
+def _make_handler(profile, counters):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _json(self, status, payload, headers=None):
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            self._json(200, {"object": "list", "data": [
+                {"id": "stub-model", "object": "model", "created": 0, "owned_by": "bench"}]})
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            req = json.loads(body)
+            ttft, rate, n_tokens, throttled = plan_response(profile, body, req.get("max_tokens"))
+            with counters["lock"]:
+                counters["requests"] += 1
+                counters["throttled"] += throttled
+            if throttled:
+                self._json(429, {"error": {"message": "Rate limit reached (stub)", "type": "rate_limit"}},
+                           {"retry-after": "0"})
+                return
+
+            prompt_tokens = sum(len(m.get("content") or "") for m in req.get("messages", [])) // 4
+            rng = _rng(profile, body)
+            tokens = [rng.choice(WORDS) + " " for _ in range(n_tokens)]
+            usage = {"prompt_tokens": prompt_tokens, "completion_tokens": n_tokens,
+                     "total_tokens": prompt_tokens + n_tokens}
+            model = req.get("model", "stub-model")
+            time.sleep(ttft)
+
+            if not req.get("stream"):
+                time.sleep(n_tokens / rate)
+                self._json(200, {"id": "stub", "object": "chat.completion", "created": 0, "model": model,
+                                 "choices": [{"index": 0, "finish_reason": "stop",
+                                              "message": {"role": "assistant", "content": "".join(tokens)}}],
+                                 "usage": usage})
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            step = 8  # tokens per SSE chunk
+            for i in range(0, n_tokens, step):
+                chunk = {"id": "stub", "object": "chat.completion.chunk", "created": 0, "model": model,
+                         "choices": [{"index": 0, "delta": {"content": "".join(tokens[i:i + step])},
+                                      "finish_reason": None}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.wfile.flush()
+                time.sleep(min(step, n_tokens - i) / rate)
+            final = {"id": "stub", "object": "chat.completion.chunk", "created": 0, "model": model,
+                     "choices": [], "usage": usage}
+            self.wfile.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode())
+            self.close_connection = True
+
+    return Handler
+
+
+class StubServer:
+    """Runs the stub on a background thread; base_url is OpenAI-client ready"""
+
+    def __init__(self, port=0, **profile):
+        self.profile = dict(DEFAULT_PROFILE, **profile)
+        self.counters = {"requests": 0, "throttled": 0, "lock": threading.Lock()}
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), _make_handler(self.profile, self.counters))
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}/v1"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stub server for benchmarks")
+    parser.add_argument("--port", type=int, default=8765)
+    for key, value in DEFAULT_PROFILE.items():
+        parser.add_argument(f"--{key.replace('_', '-')}", type=type(value), default=value)
+    args = vars(parser.parse_args())
+    port = args.pop("port")
+    with StubServer(port, **args) as server:
+        print(f"Stub provider listening on {server.base_url}")
+        server.thread.join()
@@ -0,0 +1,364 @@
+"""
+Deterministic checklist coverage over extracted submission text
+
+checklist-102225.md is parsed into items (section C) tagged with the binder
+section and guidance reference they belong to (sections A and B), and with
+the concepts each item requires. Concepts come from the checklist's own
+glossary (sections D and F) plus short phrases of the item text. Every
+concept pattern is compiled into one matcher that scans each page in a single
+pass, so coverage for a whole submission takes milliseconds. Items where
+only some concepts are found are ambiguous and can be escalated to an agent.
+"""
+
+import re
+import json
+from pathlib import Path
+
+from resource_cache import RESOURCES
+
+CHECKLIST_FILE = 'checklist-102225.md'
+# Share of an item's concepts that must be found for it to count as covered
+COVERED_THRESHOLD = 0.75
+
+COVERED = 'covered'
+AMBIGUOUS = 'ambiguous'
+MISSING = 'missing'
+
+# Abbreviations used in the checklist that the glossary doesn't spell out
+ALIASES = {
+    'cm': ('configuration management',),
+    'doc': ('declaration of conformity',),
+    'dhf': ('design history file',),
+    'pccp': ('predetermined change control plan',),
+    'ots': ('off-the-shelf', 'off the shelf'),
+    'ai/ml': ('artificial intelligence', 'machine learning', 'ai', 'ml'),
+    'sw91': ('aami sw91',),
+}
+# Words dropped when turning item text into phrases
+FILLER_WORDS = {
+    'a', 'an', 'the', 'of', 'to', 'for', 'in', 'on', 'at', 'by', 'with', 'and', 'or', 'vs', 'incl', 'e.g',
+    'is', 'are', 'be', 'if', 'as', 'any', 'all', 'its', 'how', 'needed', 'applicable', 'used', 'clear',
+    'clearly', 'included', 'includes', 'provided', 'identified', 'defined', 'described', 'specified',
+    'listed', 'explained', 'noted', 'observed', 'referenced', 'evident', 'evidenced', 'documented',
+    'addressed', 'adequate', 'available', 'requested', 'cited', 'confirms', 'covers', 'defines', 'shows',
+    'use', 'using', 'uses', 'equivalent', 'full', 'proper', 'comprehensive', 'consistent', 'legible',
+    'aligns', 'align', 'highlighted', 'delineated', 'annotated', 'assessed', 'reference', 'references',
+    'mapped', 'implements', 'derived', 'from', 'prioritized', 'complete', 'submitted', 'levels', 'expected',
+    'robust', 'proposing', 'new', 'overall', 'initial', 'approach', 'status', 'claims', 'traced', 'broader',
+    'targeted', 'strategy', 'prior', 'documents',
+}
+MAX_PHRASE_WORDS = 3
+
+_SECTION_HEAD = re.compile(r'^([A-H])\.\s+(.+)$')
+_BINDER_HEAD = re.compile(r'^(\d+)\.\s+(.+?)\s*(?:\(([^)]*)\))?\s*$')
+_CROSSWALK = re.compile(r'^-\s+(.+?)\s+->\s+Section\s+(\d+)')
+_GUIDANCE_REF = re.compile(r'\b(VI\.[A-J]|VII|V)\b')
+_TABLE_ROW = re.compile(r'^\|\s*([^|]+?)\s*\|')
+_WORD = re.compile(r"[a-z0-9][a-z0-9/\-.]*[a-z0-9]|[a-z0-9]")
+
+
+_FOLD = str.maketrans({**{c: '-' for c in '‐‑‒–—―−'}, **{c: "'" for c in '‘’“”'}})
+
+
+def fold(text):
+    """Lowercase and unify dashes/quotes (cheap enough to run on every page)"""
+    return text.lower().translate(_FOLD)
+
+
+def normalize(text):
+    """fold() plus collapsed whitespace, for patterns and checklist text"""
+    return re.sub(r'\s+', ' ', fold(text))
+
+
+def _split_parenthetical(term):
+    """'Software Requirements Specification (SRS)' -> ['software requirements specification', 'srs']"""
+    m = re.match(r'^(.+?)\s*\(([^)]+)\)\s*$', term)
+    parts = [m.group(1), m.group(2)] if m else [term]
+    return [normalize(p).strip() for p in parts if p.strip()]
+
+
+def _sections(lines):
+    """{letter: [lines]} for the lettered top-level sections"""
+    sections, current = {}, None
+    for line in lines:
+        m = _SECTION_HEAD.match(line.strip())
+        if m and not line.startswith(' '):
+            current = m.group(1)
+            sections[current] = []
+        elif current:
+            sections[current].append(line.rstrip())
+    return sections
+
+
+def _glossary(sections):
+    """Concepts as tuples of alternative patterns, from the keyword table and entity JSON"""
+    concepts = []
+    for line in sections.get('D', []):
+        m = _TABLE_ROW.match(line)
+        if m and not m.group(1).startswith(('Original', '---')):
+            concepts.append(tuple(_split_parenthetical(m.group(1))))
+    entity_json = "\n".join(sections.get('F', []))
+    start, end = entity_json.find('['), entity_json.rfind(']')
+    if start != -1 and end > start:
+        try:
+            for entity in json.loads(entity_json[start:end + 1]):
+                concepts.append(tuple(_split_parenthetical(entity['entity'])))
+        except (ValueError, KeyError):
+            pass
+    for abbr, expansions in ALIASES.items():
+        concepts.append((abbr,) + expansions)
+    # Merge concepts that share an alternative (e.g. 'SRS' and 'Software Requirements Specification (SRS)')
+    merged = []
+    for alts in concepts:
+        for existing in merged:
+            if set(alts) & set(existing):
+                existing.extend(a for a in alts if a not in existing)
+                break
+        else:
+            merged.append(list(alts))
+    return [tuple(alts) for alts in merged]
+
+
+def _binder(sections):
+    """{section number: {'title', 'ref'}} from the submission map and crosswalk"""
+    binder = {}
+    for line in sections.get('A', []):
+        m = _BINDER_HEAD.match(line.strip()) if not line.startswith(' ') else None
+        if m:
+            refs = _GUIDANCE_REF.findall(m.group(3) or '')
+            binder[int(m.group(1))] = {'title': m.group(2).strip(), 'ref': refs[0] if refs else None}
+    for line in sections.get('B', []):
+        m = _CROSSWALK.match(line.strip())
+        if m and int(m.group(2)) in binder and not binder[int(m.group(2))]['ref']:
+            refs = _GUIDANCE_REF.findall(m.group(1))
+            binder[int(m.group(2))]['ref'] = refs[0] if refs else None
+    return binder
+
+
+def binder_outline(path=CHECKLIST_FILE):
+    """[{'number', 'title', 'ref', 'topics'}] for the submission map; topics are the bullets under each heading"""
+    with open(path, 'r', encoding='utf-8') as f:
+        sections = _sections(f.read().splitlines())
+    binder = _binder(sections)
+    outline, current = [], None
+    for line in sections.get('A', []):
+        m = _BINDER_HEAD.match(line.strip()) if not line.startswith(' ') else None
+        if m and int(m.group(1)) in binder:
+            current = dict(binder[int(m.group(1))], number=int(m.group(1)), topics=[])
+            outline.append(current)
+        elif current and line.startswith(' ') and line.strip():
+            current['topics'].append(re.sub(r'^(?:-|\d+(?:\.\d+)+)\s+', '', line.strip()))
+    return outline
+
+
+def _words(text):
+    return set(re.findall(r'[a-z0-9]+', normalize(text))) - FILLER_WORDS
+
+
+def _best_section(group, binder):
+    """Binder section whose title shares the most words with a checklist group heading"""
+    group_words = _words(group)
+    best, best_score = None, 0
+    for number, info in binder.items():
+        score = len(group_words & _words(info['title']))
+        if score > best_score:
+            best, best_score = number, score
+    return best
+
+
+def _item_concepts(text, glossary):
+    """Glossary concepts mentioned by the item, plus short phrases for the rest of its text"""
+    norm = normalize(text)
+    found, spans = [], []
+    for alts in sorted(glossary, key=lambda a: -max(len(x) for x in a)):
+        for alt in alts:
+            for m in re.finditer(r'(?<![a-z0-9])' + re.escape(alt) + r'(?![a-z0-9])', norm):
+                if not any(s < m.end() and m.start() < e for s, e in spans):
+                    spans.append(m.span())
+                    if alts not in found:
+                        found.append(alts)
+    remainder = list(norm)
+    for s, e in spans:
+        remainder[s:e] = ' ' * (e - s)
+    # Runs of consecutive content words, so every phrase appears verbatim in the item
+    phrases, run = [], []
+    for piece in re.split(r"[,;:()/.]", "".join(remainder)):
+        for word in _WORD.findall(piece) + [None]:
+            if word and word not in FILLER_WORDS and len(word) > 2:
+                run.append(word)
+                continue
+            if run:
+                phrase = (" ".join(run[:MAX_PHRASE_WORDS]),)
+                if phrase not in found and phrase not in phrases:
+                    phrases.append(phrase)
+            run = []
+    return found + phrases
+
+
+def parse_checklist(path=CHECKLIST_FILE):
+    """Checklist items: id, group, section, ref, text and concepts (tuples of alternative patterns)"""
+    with open(path, 'r', encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    sections = _sections(lines)
+    glossary = _glossary(sections)
+    binder = _binder(sections)
+
+    items, group, group_no, n = [], None, 0, 0
+    for line in sections.get('C', []):
+        if line.startswith('- '):
+            group = line[2:].strip()
+            group_no += 1
+            n = 0
+        elif line.startswith('  - ') and group:
+            n += 1
+            text = line.strip()[2:]
+            number = _best_section(group, binder)
+            items.append({
+                'id': f"C{group_no}.{n}",
+                'group': group,
+                'section': f"{number}. {binder[number]['title']}" if number else None,
+                'ref': binder[number]['ref'] if number else None,
+                'text': text,
+                'concepts': _item_concepts(text, glossary),
+            })
+    return items
+
+
+class KeywordMatcher:
+    """
+    Finds every occurrence of a fixed set of patterns in one pass over the text.
+
+    Patterns are compiled into a single regex whose alternation is factored
+    as a trie (shared prefixes tried once, longest first), so the scan runs
+    in the regex engine rather than per-pattern Python loops. Spaces in a
+    pattern match any run of whitespace, including line breaks. A match also
+    credits every shorter pattern it contains ('risk management plan' counts
+    for 'risk management'), and the scan resumes inside each match, so
+    overlapping patterns are all found ('software requirements' and
+    'requirements specification' in "software requirements specification").
+    """
+
+    def __init__(self, patterns):
+        self.patterns = sorted({p for p in patterns if p})
+        trie = {}
+        for p in self.patterns:
+            node = trie
+            for ch in p:
+                node = node.setdefault(ch, {})
+            node[''] = True
+        self._regex = re.compile(r'(?<![a-z0-9])(' + self._trie_regex(trie) + r')(?![a-z0-9])')
+        bounded = {p: re.compile(r'(?<![a-z0-9])' + re.escape(p) + r'(?![a-z0-9])') for p in self.patterns}
+        self._contains = {p: [q for q in self.patterns if q != p and len(q) < len(p) and bounded[q].search(p)]
+                          for p in self.patterns}
+
+    @classmethod
+    def _trie_regex(cls, node):
+        branches = [(r'\s+' if ch == ' ' else re.escape(ch)) + cls._trie_regex(child)
+                    for ch, child in sorted(node.items()) if ch]
+        # Longer continuations first so the longest pattern wins
+        if '' in node:
+            return f"(?:{'|'.join(branches)})?" if branches else ''
+        return branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+
+    def scan(self, text):
+        """Set of patterns found in text"""
+        found = set()
+        text = fold(text)
+        m = self._regex.search(text)
+        while m:
+            p = re.sub(r'\s+', ' ', m.group(1))
+            if p in self._contains:
+                found.add(p)
+                found.update(self._contains[p])
+            # Not from m.end(): a pattern may start inside this match and run past it
+            m = self._regex.search(text, m.start() + 1)
+        return found
+
+
+def load_checklist(path=CHECKLIST_FILE):
+    """(items, matcher) for a checklist file, reparsed only when the file changes"""
+    mtime = Path(path).stat().st_mtime_ns
+
+    def build():
+        items = parse_checklist(path)
+        return items, KeywordMatcher(alt for item in items for alts in item['concepts'] for alt in alts)
+
+    return RESOURCES.get_or_build('checklist', str(Path(path).resolve()), build, version=mtime, label=path)
+
+
+def coverage(pages, items=None, matcher=None):
+    """
+    Per-item coverage of {page_index: text}.
+
+    Each result carries status (covered/ambiguous/missing), score, the page
+    numbers (1-based) where each concept was found and the concepts missing.
+    """
+    if items is None:
+        items, matcher = load_checklist()
+    hits = {}
+    for page_no in sorted(pages):
+        for p in matcher.scan(pages[page_no]):
+            hits.setdefault(p, []).append(page_no + 1)
+
+    results = []
+    for item in items:
+        found, missing = {}, []
+        for alts in item['concepts']:
+            page_list = sorted({n for alt in alts for n in hits.get(alt, ())})
+            if page_list:
+                found[alts[0]] = page_list
+            else:
+                missing.append(alts[0])
+        total = len(item['concepts'])
+        score = len(found) / total if total else 0.0
+        if total and score >= COVERED_THRESHOLD:
+            status = COVERED
+        elif found:
+            status = AMBIGUOUS
+        else:
+            status = MISSING
+        results.append({
+            'id': item['id'],
+            'group': item['group'],
+            'section': item['section'],
+            'ref': item['ref'],
+            'text': item['text'],
+            'status': status,
+            'score': round(score, 2),
+            'found': found,
+            'missing': missing,
+            'pages': sorted({n for page_list in found.values() for n in page_list}),
+        })
+    return results
+
+
+def summarize(results):
+    counts = {COVERED: 0, AMBIGUOUS: 0, MISSING: 0}
+    for r in results:
+        counts[r['status']] += 1
+    return counts
+
+
+def escalation_prompt(results):
+    """Instructions asking an agent to settle the ambiguous items"""
+    lines = ["The following checklist items were only partially evidenced by keyword matching. "
+             "For each item, state MET, NOT MET or UNCLEAR with page references and one line of rationale.", ""]
+    for r in results:
+        if r['status'] != AMBIGUOUS:
+            continue
+        ref = f" ({r['ref']})" if r['ref'] else ""
+        lines.append(f"- [{r['id']}] {r['group']}{ref}: {r['text']}")
+        lines.append(f"  found: {', '.join(f'{c} (p. {pages[0]})' for c, pages in r['found'].items())}; "
+                     f"not found: {', '.join(r['missing']) or '-'}")
+    return "\n".join(lines)
+
+
+def escalation_pages(results, pages, limit=40):
+    """Subset of {page_index: text} where ambiguous items had partial matches, most-hit pages first"""
+    counts = {}
+    for r in results:
+        if r['status'] == AMBIGUOUS:
+            for n in r['pages']:
+                counts[n - 1] = counts.get(n - 1, 0) + 1
+    keep = sorted(counts, key=lambda n: (-counts[n], n))[:limit]
+    return {n: pages[n] for n in sorted(keep) if n in pages}
@@ -0,0 +1,249 @@
+"""
+Token-budgeted chunking and map-reduce execution over long submissions
+
+Extracted page text is split on section and page boundaries into chunks
+that fit a model's input budget. Each chunk is reviewed in parallel (map),
+then the per-chunk findings are merged into a single answer (reduce).
+"""
+
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from providers import estimate_tokens
+
+# Approximate input context windows (tokens); unknown models use the default
+MODEL_CONTEXT = {
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+    "gpt-4.1": 1000000,
+    "gpt-4.1-mini": 1000000,
+    "gpt-5": 400000,
+    "gpt-5-mini": 400000,
+    "gpt-5-nano": 400000,
+    "gemini-2.0-flash-exp": 1000000,
+    "gemini-2.5-flash": 1000000,
+    "gemini-2.5-pro": 1000000,
+    "grok-beta": 131072,
+    "grok-3-mini": 131072,
+    "grok-4": 256000,
+}
+DEFAULT_CONTEXT = 32000
+PROMPT_RESERVE_TOKENS = 512      # instructions and excerpt framing
+DEFAULT_CHUNK_TOKENS = 12000     # smaller chunks keep the map step parallel
+DEFAULT_MAP_WORKERS = 4
+
+SECTION_RE = re.compile(
+    r"^\s*(#{1,6}\s+\S"                      # markdown heading
+    r"|(section|part|appendix)\s+[\w.]+"     # SECTION 5 / Appendix B
+    r"|\d+(\.\d+)*[.)]?\s+[A-Z]"             # 5.2 Biocompatibility
+    r"|[A-Z][A-Z0-9 &/,()\-]{6,}$)",         # ALL CAPS HEADING
+    re.IGNORECASE | re.MULTILINE,
+)
+
+
+def model_context(model):
+    if model in MODEL_CONTEXT:
+        return MODEL_CONTEXT[model]
+    # Dated or suffixed variants, e.g. gpt-4o-mini-2024-07-18
+    for name in sorted(MODEL_CONTEXT, key=len, reverse=True):
+        if model and model.startswith(name):
+            return MODEL_CONTEXT[name]
+    return DEFAULT_CONTEXT
+
+
+def input_budget(config, max_chunk_tokens=DEFAULT_CHUNK_TOKENS):
+    """Tokens of document text one call to this agent config can carry"""
+    params = config.get("params", {})
+    budget = (model_context(config.get("model"))
+              - params.get("max_tokens", 1500)
+              - estimate_tokens(config.get("system_prompt", ""))
+              - PROMPT_RESERVE_TOKENS)
+    if max_chunk_tokens:
+        budget = min(budget, max_chunk_tokens)
+    return max(256, budget)
+
+
+def _split_sections(text):
+    """Split page text at section headings; returns [(text, starts_section)]"""
+    starts = [m.start() for m in SECTION_RE.finditer(text)]
+    if not starts or starts[0] != 0:
+        starts = [0] + starts
+    parts = []
+    for i, start in enumerate(starts):
+        end = starts[i + 1] if i + 1 < len(starts) else len(text)
+        part = text[start:end]
+        if part.strip():
+            parts.append((part, i > 0 or bool(SECTION_RE.match(part))))
+    return parts
+
+
+def _split_oversized(text, budget):
+    """Split a unit larger than the budget on paragraph, then character boundaries"""
+    max_chars = budget * 4
+    pieces, current = [], ""
+    for para in re.split(r"(\n\s*\n)", text):
+        while len(para) > max_chars:
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(para[:max_chars])
+            para = para[max_chars:]
+        if current and len(current) + len(para) > max_chars:
+            pieces.append(current)
+            current = ""
+        current += para
+    if current.strip():
+        pieces.append(current)
+    return pieces
+
+
+def chunk_pages(pages, budget_tokens):
+    """
+    Pack {page_index: text} into chunks of at most budget_tokens.
+
+    Chunks break preferably where a new section starts and always between
+    pages or sections when possible. Each chunk's text carries [Page N]
+    markers (1-based) so agents can cite pages.
+    Returns [{'index', 'pages', 'text', 'tokens'}].
+    """
+    units = []
+    for page_no in sorted(pages):
+        marker = f"[Page {page_no + 1}]\n"
+        for part, starts_section in _split_sections(pages[page_no]):
+            for piece in _split_oversized(part, budget_tokens - estimate_tokens(marker)):
+                units.append((page_no, marker + piece, starts_section))
+                starts_section = False
+
+    chunks = []
+    cur_text, cur_pages, cur_tokens = [], [], 0
+
+    def _flush():
+        if cur_text:
+            chunks.append({
+                'index': len(chunks),
+                'pages': sorted(set(cur_pages)),
+                'text': "\n".join(cur_text),
+                'tokens': cur_tokens,
+            })
+
+    for page_no, text, starts_section in units:
+        tokens = estimate_tokens(text)
+        over = cur_tokens + tokens > budget_tokens
+        soft = starts_section and cur_tokens >= 0.75 * budget_tokens
+        if cur_text and (over or soft):
+            _flush()
+            cur_text, cur_pages, cur_tokens = [], [], 0
+        cur_text.append(text)
+        cur_pages.append(page_no)
+        cur_tokens += tokens
+    _flush()
+    return chunks
+
+
+def _page_span(pages):
+    return f"{pages[0] + 1}-{pages[-1] + 1}" if len(pages) > 1 else f"{pages[0] + 1}"
+
+
+def map_prompt(instructions, chunk, total):
+    return (
+        f"{instructions}\n\n"
+        f"You are reviewing excerpt {chunk['index'] + 1} of {total} of the submission "
+        f"(pages {_page_span(chunk['pages'])}). Report findings for this excerpt only, "
+        f"citing page numbers from the [Page N] markers. If the excerpt has nothing relevant, say so briefly.\n\n"
+        f"{chunk['text']}"
+    )
+
+
+def reduce_prompt(instructions, partials):
+    parts = [
+        f"{instructions}\n\n"
+        f"The submission was reviewed in {len(partials)} excerpts. Merge the findings below into one answer: "
+        f"remove duplicates, keep page references, and order findings by severity (CRITICAL/MAJOR/MINOR)."
+    ]
+    for label, output in partials:
+        parts.append(f"### Excerpt {label}\n{output}")
+    return "\n\n".join(parts)
+
+
+def map_reduce(call, instructions, chunks, budget_tokens, max_workers=DEFAULT_MAP_WORKERS,
+               on_chunk=None, stats=None):
+    """
+    Run call(prompt, stats, on_chunk) over every chunk, then merge.
+
+    A single chunk is answered directly, and with no chunks (no page has
+    any text) the instructions are sent on their own. Reduce inputs that
+    exceed the budget are merged hierarchically. on_chunk only receives the
+    final (reduce) call's stream. Returns (output, trace) where trace lists
+    per-call timings and token counts for the run log. If a stats dict is
+    passed it receives the final call's metrics with tokens_in/out summed
+    over every call.
+    """
+    trace = []
+
+    def _run(step, label, prompt, stream=None, final=False):
+        call_stats = {}
+        start = time.time()
+        out = call(prompt, call_stats, stream)
+        trace.append({
+            'step': step,
+            'chunk': label,
+            'tokens_in': call_stats.get('tokens_in') or estimate_tokens(prompt),
+            'tokens_out': call_stats.get('tokens_out') or estimate_tokens(out or ""),
+            'elapsed_s': round(time.time() - start, 2),
+            'cache': call_stats.get('cache'),
+            'throttle_wait_s': call_stats.get('throttle_wait_s') or 0.0,
+            'retries': call_stats.get('retries') or 0,
+        })
+        if final:
+            final_stats.update(call_stats)
+        return out
+
+    final_stats = {}
+
+    def _done(out):
+        if stats is not None:
+            stats.update(final_stats)
+            stats['tokens_in'] = sum(t['tokens_in'] for t in trace)
+            stats['tokens_out'] = sum(t['tokens_out'] for t in trace)
+            stats['throttle_wait_s'] = round(sum(t['throttle_wait_s'] for t in trace), 3)
+            stats['retries'] = sum(t['retries'] for t in trace)
+        return out, sorted(trace, key=lambda t: t['step'] != 'map')
+
+    if not chunks:
+        return _done(_run('map', None, instructions, on_chunk, True))
+    if len(chunks) == 1:
+        chunk = chunks[0]
+        return _done(_run('map', _page_span(chunk['pages']), map_prompt(instructions, chunk, 1), on_chunk, True))
+
+    with ThreadPoolExecutor(max_workers=max(1, int(max_workers))) as pool:
+        futures = [
+            pool.submit(_run, 'map', _page_span(c['pages']), map_prompt(instructions, c, len(chunks)))
+            for c in chunks
+        ]
+        partials = [(f"{c['index'] + 1} (pages {_page_span(c['pages'])})", f.result())
+                    for c, f in zip(chunks, futures)]
+
+        level = 0
+        while True:
+            prompt = reduce_prompt(instructions, partials)
+            fits = estimate_tokens(prompt) <= budget_tokens
+            if fits or len(partials) <= 2:
+                return _done(_run('reduce', f"level {level}", prompt, on_chunk, True))
+            # Too many partial answers for one call: merge them in groups first
+            groups, group, size = [], [], 0
+            for item in partials:
+                tokens = estimate_tokens(item[1])
+                if group and size + tokens > budget_tokens // 2:
+                    groups.append(group)
+                    group, size = [], 0
+                group.append(item)
+                size += tokens
+            groups.append(group)
+            if len(groups) == len(partials):
+                # Partials can't be grouped any tighter; merge them in one call
+                return _done(_run('reduce', f"level {level}", prompt, on_chunk, True))
+            futures = [pool.submit(_run, 'reduce', f"level {level} group {g + 1}", reduce_prompt(instructions, grp))
+                       for g, grp in enumerate(groups)]
+            partials = [(f"group {g + 1}", f.result()) for g, f in enumerate(futures)]
+            level += 1
@@ -0,0 +1,221 @@
+"""
+Section-aligned comparison of a subject submission against its predicate
+
+Both documents are split at section headings and sections are paired by
+normalized title ("5.2 Biocompatibility" and "SECTION 7: Biocompatibility"
+match), then by title similarity, then by shared paragraphs. Paragraphs are
+fingerprinted with the whitespace-insensitive page hash, so each pair is
+diffed over short hash sequences rather than characters: identical
+paragraphs (also when moved) are skipped, and only the changed hunks plus
+whole sections present on one side are kept. comparison_document turns the
+result into a regular document record, one page per changed section, so
+agents, retrieval, chunking and the planner work on it unchanged.
+"""
+
+import re
+import hashlib
+import difflib
+
+from incremental import page_hash, section_texts
+from resource_cache import RESOURCES
+from planner import count_tokens
+
+IDENTICAL = 'identical'
+CHANGED = 'changed'
+ADDED = 'added'      # only in the subject
+REMOVED = 'removed'  # only in the predicate
+
+TITLE_MATCH = 0.5
+CONTENT_MATCH = 0.3
+# Paragraphs longer than this are split again at sentence-ending line breaks (PDF text rarely has blank lines)
+MAX_PARAGRAPH_CHARS = 1200
+
+_NUMBERING_RE = re.compile(
+    r"^\s*(?:#{1,6}\s*)?(?:(?:section|part|appendix)\s+[\w.]+\s*[:.)\-–]?\s*|\d+(?:\.\d+)*[.)]?\s+)?",
+    re.IGNORECASE
+)
+
+
+def title_key(title):
+    """Section title without numbering, markup or case; e.g. 'biocompatibility'"""
+    words = re.findall(r"[a-z0-9]+", _NUMBERING_RE.sub("", title, count=1).lower())
+    return " ".join(words) or " ".join(re.findall(r"[a-z0-9]+", title.lower()))
+
+
+def paragraphs(text):
+    """Non-empty paragraphs of a section, split the same way on both sides"""
+    result = []
+    for block in re.split(r"\n\s*\n", text):
+        block = block.strip()
+        if len(block) > MAX_PARAGRAPH_CHARS:
+            result.extend(p.strip() for p in re.split(r"(?<=[.;:])[ \t]*\n", block) if p.strip())
+        elif block:
+            result.append(block)
+    return result
+
+
+def _sections(doc):
+    out = []
+    for s in section_texts(doc):
+        # The heading line is compared as the title, so renumbering isn't a content change
+        body = s['text'].lstrip()
+        paras = paragraphs(body.split('\n', 1)[1] if s['title'] != "(front matter)" and '\n' in body else body)
+        out.append(dict(s, key=title_key(s['title']), paragraphs=paras, hashes=[page_hash(p) for p in paras]))
+    return out
+
+
+def _jaccard(a, b):
+    return len(a & b) / len(a | b) if a or b else 0.0
+
+
+def align_sections(predicate, subject):
+    """[(predicate index or None, subject index or None)] in subject order, predicate-only sections last"""
+    pairs, used = {}, set()
+    by_key = {}
+    for i, s in enumerate(predicate):
+        by_key.setdefault(s['key'], []).append(i)
+    for j, s in enumerate(subject):
+        free = [i for i in by_key.get(s['key'], ()) if i not in used]
+        if free:
+            pairs[j] = free[0]
+            used.add(free[0])
+
+    # Renamed sections: closest title, else the section sharing the most paragraphs
+    for j, s in enumerate(subject):
+        if j in pairs:
+            continue
+        words, hashes = set(s['key'].split()), set(s['hashes'])
+        best, best_score = None, 0.0
+        for i, p in enumerate(predicate):
+            if i in used:
+                continue
+            score = _jaccard(words, set(p['key'].split()))
+            if score < TITLE_MATCH:
+                shared = len(hashes & set(p['hashes']))
+                score = shared / min(len(hashes), len(p['hashes'])) if shared else 0.0
+                score = score if score >= CONTENT_MATCH else 0.0
+            if score > best_score:
+                best, best_score = i, score
+        if best is not None:
+            pairs[j] = best
+            used.add(best)
+    aligned = [(pairs.get(j), j) for j in range(len(subject))]
+    return aligned + [(i, None) for i in range(len(predicate)) if i not in used]
+
+
+def diff_section(predicate, subject):
+    """Hunks of changed paragraphs between two aligned sections; moved paragraphs count as unchanged"""
+    matcher = difflib.SequenceMatcher(None, predicate['hashes'], subject['hashes'], autojunk=False)
+    opcodes = matcher.get_opcodes()
+    removed = {h for tag, i1, i2, _, _ in opcodes if tag in ('delete', 'replace') for h in predicate['hashes'][i1:i2]}
+    inserted = {h for tag, _, _, j1, j2 in opcodes if tag in ('insert', 'replace') for h in subject['hashes'][j1:j2]}
+    moved = removed & inserted
+    hunks, unchanged = [], 0
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == 'equal':
+            unchanged += i2 - i1
+            continue
+        before = [p for p, h in zip(predicate['paragraphs'][i1:i2], predicate['hashes'][i1:i2]) if h not in moved]
+        after = [p for p, h in zip(subject['paragraphs'][j1:j2], subject['hashes'][j1:j2]) if h not in moved]
+        unchanged += sum(1 for h in subject['hashes'][j1:j2] if h in moved)
+        if before or after:
+            hunks.append({'predicate': before, 'subject': after})
+    return hunks, unchanged, round(matcher.ratio(), 3)
+
+
+def compare_documents(predicate, subject):
+    """
+    Section-by-section comparison of subject against predicate (document records).
+
+    Returns {'predicate', 'subject', 'hash', 'sections', 'stats'}; each
+    section has its titles, pages on both sides, status, similarity and the
+    changed hunks. Cached per pair of document hashes.
+    """
+    def build():
+        pred, subj = _sections(predicate), _sections(subject)
+        sections = []
+        for i, j in align_sections(pred, subj):
+            p = pred[i] if i is not None else None
+            s = subj[j] if j is not None else None
+            row = {
+                'title': (s or p)['title'],
+                'predicate_title': p['title'] if p else None,
+                'subject_pages': s['pages'] if s else [],
+                'predicate_pages': p['pages'] if p else [],
+                'paragraphs': len((s or p)['paragraphs']),
+            }
+            if p is None:
+                row.update(status=ADDED, similarity=0.0, unchanged=0,
+                           hunks=[{'predicate': [], 'subject': s['paragraphs']}])
+            elif s is None:
+                row.update(status=REMOVED, similarity=0.0, unchanged=0,
+                           hunks=[{'predicate': p['paragraphs'], 'subject': []}])
+            else:
+                hunks, unchanged, similarity = diff_section(p, s)
+                row.update(status=CHANGED if hunks else IDENTICAL, similarity=similarity, unchanged=unchanged,
+                           hunks=hunks)
+            sections.append(row)
+        counts = {status: sum(1 for r in sections if r['status'] == status)
+                  for status in (IDENTICAL, CHANGED, ADDED, REMOVED)}
+        total = sum(len(s['paragraphs']) for s in subj)
+        return {
+            'predicate': predicate['name'],
+            'subject': subject['name'],
+            'hash': hashlib.sha256(f"{predicate['hash']}:{subject['hash']}".encode()).hexdigest(),
+            'sections': sections,
+            'stats': dict(counts, sections=len(sections), paragraphs=total,
+                          paragraphs_skipped=sum(r['unchanged'] for r in sections),
+                          tokens_full=sum(count_tokens(t) for d in (predicate, subject) for t in d['pages'].values())),
+        }
+
+    return RESOURCES.get_or_build('comparison', (predicate['hash'], subject['hash']), build,
+                                  label=f"{predicate['name']} → {subject['name']}")
+
+
+def _pages(pages):
+    return f"{pages[0]}-{pages[-1]}" if len(pages) > 1 else (str(pages[0]) if pages else "-")
+
+
+def _quote(paragraphs):
+    return "\n".join("> " + p.replace("\n", "\n> ") for p in paragraphs) if paragraphs else "> (none)"
+
+
+def comparison_document(comparison):
+    """
+    Document record of only the differences: a summary page, then one page
+    per changed, added or removed section with its predicate/subject hunks.
+    """
+    sections = comparison['sections']
+    stats = comparison['stats']
+    identical = [r['title'] for r in sections if r['status'] == IDENTICAL]
+    summary = (
+        f"Substantial equivalence comparison: subject {comparison['subject']} against predicate "
+        f"{comparison['predicate']}.\n"
+        f"{stats['sections']} aligned sections: {stats[CHANGED]} changed, {stats[ADDED]} only in the subject, "
+        f"{stats[REMOVED]} only in the predicate, {stats[IDENTICAL]} identical. "
+        f"Identical content ({stats['paragraphs_skipped']} of {stats['paragraphs']} subject paragraphs) "
+        f"is omitted; the following pages show only what differs."
+    )
+    if identical:
+        summary += "\n\nIdentical in both documents:\n" + "\n".join(f"- {t}" for t in identical)
+    pages = {0: summary}
+    for r in sections:
+        if r['status'] == IDENTICAL:
+            continue
+        head = f"## {r['title']} ({r['status']})\n"
+        head += f"Subject pages {_pages(r['subject_pages'])}; predicate pages {_pages(r['predicate_pages'])}"
+        if r['predicate_title'] and r['predicate_title'] != r['title']:
+            head += f"; predicate section \"{r['predicate_title']}\""
+        if r['unchanged']:
+            head += f"; {r['unchanged']} unchanged paragraph(s) omitted"
+        body = [head]
+        for hunk in r['hunks']:
+            body.append(f"Predicate:\n{_quote(hunk['predicate'])}\nSubject:\n{_quote(hunk['subject'])}")
+        pages[len(pages)] = "\n\n".join(body)
+    return {
+        'name': f"{comparison['subject']} vs {comparison['predicate']}",
+        'hash': comparison['hash'],
+        'page_count': len(pages),
+        'pages': pages,
+        'comparison': stats,
+    }
@@ -0,0 +1,396 @@
+"""
+Synthetic 510(k) submissions of any size, for load testing the review pipeline
+
+    python corpus.py corpus/ --pages 10 100 1000 --count 3 --seed 7 --format pdf txt
+
+Each submission follows the outline a real package has: a cover page with
+its table of contents, the device sections every 510(k) carries, one test
+section per review area in agents.yaml citing the standards its agent
+checks, then the software documentation binder of checklist-102225.md with
+the checklist's items written out under their topics. A share of the items
+is left out on purpose and listed in the manifest, so coverage checks and
+agents have known gaps to find.
+
+Pages are generated one at a time from the seed and written as they are
+produced: text files separate pages with form feeds (as ingest expects) and
+PDFs are appended in batches with incremental saves, so memory stays flat
+from ten pages to a thousand. The same seed and size always give the same
+submission. manifest.jsonl in the output folder describes every file:
+device, predicate, section page ranges, standards and omitted items.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+
+from agent_library import AGENTS_FILE, load_agents
+from checklist import CHECKLIST_FILE, binder_outline, parse_checklist
+from findings import standards
+from ingest import PYMUPDF_AVAILABLE
+
+FORMATS = ('txt', 'pdf')
+# Body text per page; a letter page at 9 pt holds this with room for wrapping
+PAGE_CHARS = int(os.getenv("CORPUS_PAGE_CHARS", 2600))
+DEFAULT_PAGES = 50
+OMIT_RATE = 0.1
+PDF_BATCH_PAGES = 100
+PDF_MARGIN = 54
+PDF_FONT_SIZE = 9
+MIN_PDF_FONT_SIZE = 4
+MANIFEST_FILE = 'manifest.jsonl'
+
+DEVICE_TYPES = ("Orthopedic Implant", "Total Knee Replacement System", "Intervertebral Body Fusion Device",
+                "Metallic Bone Plate System", "Hip Resurfacing System", "Pedicle Screw System")
+BRANDS = ("Arcus", "Veritas", "Osteon", "Kinetra", "Stratum", "Meridian", "Axion", "Lumen")
+MATERIALS = ("Ti-6Al-4V ELI", "CoCrMo alloy", "316L stainless steel", "UHMWPE", "PEEK")
+
+DEVICE_SECTIONS = (
+    ("Device Description", ("Device components and materials", "Principle of operation", "Models and sizes",
+                            "Accessories")),
+    ("Indications for Use", ("Intended use", "Patient population", "Contraindications")),
+    ("Substantial Equivalence Discussion", ("Predicate device identification",
+                                            "Comparison of technological characteristics",
+                                            "Differences and their impact on safety and effectiveness")),
+    ("Labeling", ("Instructions for use", "Device labels", "Warnings and precautions")),
+)
+
+PARAGRAPHS = (
+    "{topic} for the {device} was evaluated per {standard}. Test report {report} documents {samples} samples "
+    "of the worst-case {size} configuration; all samples met the acceptance criteria defined in protocol "
+    "{protocol} before testing began.",
+    "The subject device and the predicate ({predicate}) were compared for {topic_lower} under identical "
+    "conditions. Mean results differed by {delta}% (95% CI {ci_lo}% to {ci_hi}%), within the predefined "
+    "equivalence margin of {margin}%.",
+    "Deviation {deviation} was recorded during {topic_lower}: {deviation_text}. The root cause was assessed, "
+    "the impact on results was judged negligible and the affected samples were re-tested per {standard}.",
+    "Table {table} summarizes {topic_lower}.\nTest | Standard | Samples | Result\n{rows}",
+    "{topic} is traced to requirements {req_lo}-{req_hi} and to hazards H-{hazard} and H-{hazard2} in the Risk "
+    "Management File; verification evidence is provided on page {page}.",
+    "Materials in patient contact ({material}) are unchanged from the predicate. {topic} therefore relies on "
+    "the evaluation in report {report}, supplemented by a gap assessment against {standard}.",
+    "Acceptance criteria for {topic_lower} were derived from the predicate's labeled performance and from "
+    "{standard}. Statistical analysis used a one-sided tolerance interval at 95% confidence and 90% coverage.",
+    "Testing was performed by an ISO/IEC 17025 accredited laboratory under GLP conditions. Raw data, "
+    "calibration certificates and the laboratory's quality statement are included in Appendix {appendix}.",
+)
+SOFTWARE_PARAGRAPHS = (
+    "{topic} is documented in {doc_id} revision {rev}, approved under change control record CR-{cr}. The "
+    "document applies to software version {version} of the {device}.",
+    "{topic} is traced to requirements {req_lo}-{req_hi} and to hazards H-{hazard} and H-{hazard2} in the Risk "
+    "Management File; verification evidence is provided on page {page}.",
+    "Table {table} summarizes {topic_lower}.\nTest | Standard | Samples | Result\n{rows}",
+    "The development process for {topic_lower} follows {standard}. Reviews are recorded in the design history "
+    "file and open items are tracked as anomalies with a risk rationale for each deferral.",
+    "Anomaly SW-{anomaly} affecting {topic_lower} remains unresolved in version {version}: {anomaly_text}. "
+    "Its impact on safety and effectiveness was assessed as acceptable and users are informed in the labeling.",
+)
+DEVIATIONS = ("one specimen failed prematurely at the fixture interface", "chamber humidity exceeded the "
+              "protocol range for 40 minutes", "the test frequency was reduced to 3 Hz after run-in",
+              "two samples were damaged during packaging and replaced")
+ANOMALIES = ("the report export truncates patient names longer than 64 characters", "a measurement overlay is "
+             "redrawn late after rapid zooming", "the audit log omits the workstation name after a restart")
+RESULTS = ("Pass", "Pass", "Pass", "Pass (see deviation)", "Pass, margin 2.1x")
+
+
+def review_areas(agents_path=AGENTS_FILE):
+    """One test section per library agent: its review area, the topics in its description and its standards"""
+    areas = []
+    for agent in load_agents(agents_path).get('agents', []):
+        desc = agent.get('desc', '')
+        # "Reviews ISO 10993 biological evaluation, cytotoxicity, ... for device-body contact materials"
+        scope = re.split(r"\s+(?:per|for)\s+|\s*\(", desc)[0]
+        topics = [t.strip() for t in re.split(r",\s*(?:and\s+)?|\s+and\s+", scope) if t.strip()]
+        if topics:
+            topics[0] = topics[0].split(' ', 1)[-1]  # the verb
+        topics = [t[0].upper() + t[1:] for t in topics if not standards(t)]
+        areas.append({
+            'title': f"{agent['name'].rsplit(' ', 1)[0]} Testing",
+            'topics': topics or ["Test methods and results"],
+            'standards': standards(f"{desc}\n{agent.get('system_prompt', '')}"),
+            'items': [],
+        })
+    return areas
+
+
+def _topic_title(topic):
+    title = re.split(r"[;:(]| - | vs\. ", topic.strip("“”\"' "))[0].strip().rstrip(',.')
+    return (title[0].upper() + title[1:])[:70] if title else "General"
+
+
+def submission_outline(agents_path=AGENTS_FILE, checklist_path=CHECKLIST_FILE):
+    """Sections of a synthetic submission: {'title', 'topics', 'standards', 'items' [(id, text)]}"""
+    sections = [{'title': title, 'topics': list(topics), 'standards': [], 'items': []}
+                for title, topics in DEVICE_SECTIONS]
+    sections[3:3] = review_areas(agents_path)
+    device_pool = sorted({s for sec in sections for s in sec['standards']})
+    for sec in sections:
+        sec.update(kind='device', standards=sec['standards'] or device_pool)
+    binders = binder_outline(checklist_path)
+    # Software sections without their own standards cite the ones the binder lists (ISO 14971, IEC 62304, ...)
+    software_pool = standards(" ".join(t for b in binders for t in b['topics']))
+    items = parse_checklist(checklist_path)
+    for binder in binders:
+        label = f"{binder['number']}. {binder['title']}"
+        sections.append({
+            'title': binder['title'],
+            'kind': 'software',
+            'topics': [_topic_title(t) for t in binder['topics']] or [binder['title']],
+            'standards': standards(" ".join(binder['topics'])) or software_pool,
+            'items': [(i['id'], i['text']) for i in items if i['section'] == label],
+        })
+    return sections
+
+
+def plan_submission(n_pages, seed=0, omit=OMIT_RATE, outline=None):
+    """
+    Everything about a submission except its page text: device, predicate,
+    each section's span in characters (page n covers PAGE_CHARS of them
+    after the cover page) and the checklist items left out.
+    """
+    rng = random.Random(seed)
+    outline = outline if outline is not None else submission_outline()
+    n_pages = max(1, int(n_pages))
+    device_type = rng.choice(DEVICE_TYPES)
+    pool = sorted({s for sec in outline for s in sec['standards']})
+    weights = [(1 + len(s['topics']) + len(s['items'])) * rng.uniform(0.6, 1.4) for s in outline]
+    body = (n_pages - 1) * PAGE_CHARS
+    sections, pos, omitted = [], 0, []
+    for k, (sec, w) in enumerate(zip(outline, weights)):
+        end = body if k == len(outline) - 1 else pos + round(body * w / sum(weights))
+        kept = []
+        for item in sec['items']:
+            (omitted if rng.random() < omit else kept).append(item)
+        sections.append(dict(sec, number=k + 1, span=(pos, end), items=kept))
+        pos = end
+    return {
+        'seed': seed,
+        'pages': n_pages,
+        'device_type': device_type,
+        'device_name': f"{rng.choice(BRANDS)} {device_type}",
+        'predicate_device': f"K{rng.randint(100000, 249999)}",
+        'material': rng.choice(MATERIALS),
+        'standards': pool,
+        'sections': sections,
+        'omitted': [item_id for item_id, _ in omitted],
+    }
+
+
+def _page_of(spec, pos):
+    """1-based page holding a body position (page 1 is the cover)"""
+    return min(spec['pages'], 2 + pos // PAGE_CHARS)
+
+
+def section_pages(spec):
+    """[{'number', 'title', 'pages' (first, last)}] for the manifest and table of contents"""
+    rows = []
+    for s in spec['sections']:
+        start, end = s['span']
+        if end > start:
+            rows.append({'number': s['number'], 'title': s['title'],
+                         'pages': [_page_of(spec, start), _page_of(spec, end - 1)]})
+    return rows
+
+
+def _cover(spec):
+    lines = [
+        "TRADITIONAL 510(K) PREMARKET NOTIFICATION",
+        f"Device: {spec['device_name']}",
+        f"Device type: {spec['device_type']}",
+        f"Predicate device: {spec['predicate_device']}",
+        f"Synthetic test submission, seed {spec['seed']}, {spec['pages']} pages.",
+        "",
+        "Contents",
+    ]
+    lines += [f"{r['title']} .......... page {r['pages'][0]}" for r in section_pages(spec)]
+    return "\n".join(lines)
+
+
+def _paragraph(rng, spec, section, topic):
+    standard = rng.choice(section['standards']) if section['standards'] else "the recognized consensus standard"
+    template = rng.choice(SOFTWARE_PARAGRAPHS if section['kind'] == 'software' else PARAGRAPHS)
+    # Acronyms keep their case: "OTS components", not "oTS components"
+    topic_lower = topic if topic[1:2].isupper() else topic[0].lower() + topic[1:]
+    fields = {
+        'topic': topic, 'topic_lower': topic_lower, 'device': spec['device_name'],
+        'predicate': spec['predicate_device'], 'material': spec['material'], 'standard': standard,
+        'report': f"TR-{rng.randint(1000, 9999)}", 'protocol': f"P-{rng.randint(100, 999)}",
+        'samples': rng.choice((5, 6, 10, 12, 30)), 'size': rng.choice(("smallest", "largest", "thinnest")),
+        'delta': round(rng.uniform(-4, 4), 1), 'margin': rng.choice((5, 10, 15)), 'table': None, 'rows': None,
+        'deviation': f"DEV-{rng.randint(10, 99)}", 'deviation_text': rng.choice(DEVIATIONS),
+        'req_lo': f"SRS-{rng.randint(100, 400)}", 'hazard': rng.randint(1, 60), 'hazard2': rng.randint(61, 120),
+        'page': rng.randint(2, spec['pages']), 'appendix': rng.choice("ABCDEF"),
+        'doc_id': f"SW-DOC-{rng.randint(10, 99)}", 'rev': rng.choice("ABCD"), 'cr': rng.randint(1000, 9999),
+        'version': f"{rng.randint(1, 4)}.{rng.randint(0, 9)}.{rng.randint(0, 20)}", 'anomaly': rng.randint(100, 999),
+        'anomaly_text': rng.choice(ANOMALIES),
+    }
+    fields['ci_lo'], fields['ci_hi'] = round(fields['delta'] - 1.8, 1), round(fields['delta'] + 1.8, 1)
+    fields['req_hi'] = f"SRS-{int(fields['req_lo'][4:]) + rng.randint(3, 40)}"
+    if '{rows}' in template:
+        fields['table'] = f"{section['number']}-{rng.randint(1, 20)}"
+        fields['rows'] = "\n".join(
+            f"{topic} run {r + 1} | {rng.choice(section['standards']) if section['standards'] else '-'} | "
+            f"{rng.choice((5, 6, 10))} | {rng.choice(RESULTS)}" for r in range(rng.randint(2, 5)))
+    return template.format(**fields)
+
+
+def _body(rng, spec, section, lo, hi):
+    """Text of a section between two body positions: its heading, topic headings, items and paragraphs"""
+    start, end = section['span']
+    topics = section['topics']
+    bounds = [start + (end - start) * k // len(topics) for k in range(len(topics) + 1)]
+    parts = []
+    if lo <= start:
+        parts.append(f"{section['number']}. {section['title']}")
+    for k, topic in enumerate(topics):
+        seg_lo, seg_hi = max(lo, bounds[k]), min(hi, bounds[k + 1])
+        if seg_lo >= seg_hi:
+            continue
+        budget = seg_hi - seg_lo
+        if seg_lo == bounds[k]:
+            parts.append(f"{section['number']}.{k + 1} {topic}")
+            # Each checklist item is stated once, under the topic it is dealt to
+            items = [text for n, (_, text) in enumerate(section['items']) if n % len(topics) == k]
+            if items:
+                parts.append("This subsection addresses:\n" + "\n".join(f"- {t}" for t in items))
+        while budget > 0:
+            paragraph = _paragraph(rng, spec, section, topic)
+            parts.append(paragraph)
+            budget -= len(paragraph)
+    return parts
+
+
+def page_text(spec, n):
+    """Text of page n (0-based); every page is generated independently from the seed"""
+    if n == 0:
+        return _cover(spec)
+    rng = random.Random(f"{spec['seed']}:{n}")
+    lo, hi = (n - 1) * PAGE_CHARS, n * PAGE_CHARS
+    parts = []
+    for section in spec['sections']:
+        start, end = section['span']
+        if start < hi and end > lo:
+            parts.extend(_body(rng, spec, section, lo, hi))
+    return "\n\n".join(parts)
+
+
+def iter_pages(spec):
+    """Page texts in order, generated lazily"""
+    for n in range(spec['pages']):
+        yield page_text(spec, n)
+
+
+def write_text(path, pages):
+    """Pages separated by form feeds, written as they are generated; returns the page count"""
+    count = 0
+    with open(path, 'w', encoding='utf-8', newline='\n') as f:
+        for text in pages:
+            if count:
+                f.write("\f")
+            f.write(text)
+            count += 1
+    return count
+
+
+def write_pdf(path, pages, batch_pages=PDF_BATCH_PAGES):
+    """Pages laid out PDF_BATCH_PAGES at a time, each batch appended with an incremental save"""
+    if not PYMUPDF_AVAILABLE:
+        raise RuntimeError("PyMuPDF is not installed; only txt submissions can be generated")
+    from ingest import fitz
+    if os.path.exists(path):
+        os.remove(path)
+    count = 0
+
+    def flush(batch):
+        if not os.path.exists(path):
+            batch.save(path, garbage=1)
+            return
+        out = fitz.open(path)
+        try:
+            out.insert_pdf(batch)
+            out.saveIncr()
+        finally:
+            out.close()
+
+    batch = fitz.open()
+    for text in pages:
+        page = batch.new_page()
+        box = page.rect + (PDF_MARGIN, PDF_MARGIN, -PDF_MARGIN, -PDF_MARGIN)
+        # insert_textbox writes nothing when the text overflows, so crowded pages get a smaller font
+        size = PDF_FONT_SIZE
+        while page.insert_textbox(box, text, fontsize=size) < 0 and size > MIN_PDF_FONT_SIZE:
+            size -= 1
+        count += 1
+        if batch.page_count >= batch_pages:
+            flush(batch)
+            batch.close()
+            batch = fitz.open()
+    if batch.page_count:
+        flush(batch)
+    batch.close()
+    return count
+
+
+def generate(path, n_pages, seed=0, omit=OMIT_RATE, outline=None):
+    """Write one submission to path (.pdf, else text) and return its manifest record"""
+    started = time.perf_counter()
+    spec = plan_submission(n_pages, seed, omit, outline)
+    writer = write_pdf if str(path).lower().endswith('.pdf') else write_text
+    writer(path, iter_pages(spec))
+    return {
+        'file': os.path.basename(path),
+        'seed': seed,
+        'pages': spec['pages'],
+        'bytes': os.path.getsize(path),
+        'device_name': spec['device_name'],
+        'device_type': spec['device_type'],
+        'predicate_device': spec['predicate_device'],
+        'sections': section_pages(spec),
+        'standards': spec['standards'],
+        'omitted_items': spec['omitted'],
+        'elapsed_s': round(time.perf_counter() - started, 3),
+    }
+
+
+def generate_corpus(out_dir, page_sizes, count=1, seed=0, formats=('txt',), omit=OMIT_RATE):
+    """count submissions per size and format in out_dir, appending each to manifest.jsonl as it is written"""
+    os.makedirs(out_dir, exist_ok=True)
+    outline = submission_outline()
+    records = []
+    with open(os.path.join(out_dir, MANIFEST_FILE), 'a', encoding='utf-8') as manifest:
+        for pages in page_sizes:
+            for i in range(count):
+                doc_seed = seed * 1000003 + pages * 1009 + i
+                for fmt in formats:
+                    path = os.path.join(out_dir, f"synthetic-{pages}p-{i + 1:03d}.{fmt}")
+                    record = generate(path, pages, doc_seed, omit, outline)
+                    manifest.write(json.dumps(record) + "\n")
+                    manifest.flush()
+                    records.append(record)
+                    print(f"{record['file']:<32} {record['bytes'] / 1e6:7.2f} MB  {record['elapsed_s']:.2f}s",
+                          file=sys.stderr)
+    return records
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic 510(k) submissions for load testing.")
+    parser.add_argument('out', help="output folder; reviewable with batch_review.py")
+    parser.add_argument('--pages', type=int, nargs='+', default=[10, 100, 1000], help="submission sizes")
+    parser.add_argument('--count', type=int, default=1, help="submissions per size")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--format', nargs='+', default=['txt'], choices=FORMATS, dest='formats')
+    parser.add_argument('--omit', type=float, default=OMIT_RATE, help="share of checklist items left out")
+    args = parser.parse_args(argv)
+    if 'pdf' in args.formats and not PYMUPDF_AVAILABLE:
+        parser.error("PyMuPDF is not installed; use --format txt")
+    records = generate_corpus(args.out, args.pages, args.count, args.seed, args.formats, args.omit)
+    total = sum(r['pages'] for r in records)
+    print(f"{len(records)} submissions, {total} pages written to {args.out} (see {MANIFEST_FILE})")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,242 @@
+"""
+Structured findings parsed from agent outputs, deduplicated across agents
+
+Agents are asked for CRITICAL/MAJOR/MINOR findings with page references.
+parse_findings turns one output into records (severity, standards, pages,
+text), whether the severity is an inline tag ("MAJOR: ...", "[MINOR] ...")
+or a heading over a bulleted list. consolidate merges near-duplicate
+findings from different agents: each finding's content words are MinHashed
+in one vectorized pass, LSH banding proposes candidate pairs, and pairs
+whose estimated Jaccard similarity clears the threshold are merged unless
+they cite different standards. A merged finding keeps the highest severity
+and the union of its pages, standards and agents.
+"""
+
+import io
+import re
+import csv
+import zlib
+from itertools import combinations
+
+import numpy as np
+
+SEVERITIES = ('CRITICAL', 'MAJOR', 'MINOR')
+SEVERITY_RANK = {s: i for i, s in enumerate(SEVERITIES)}
+
+DEDUP_THRESHOLD = 0.5
+NUM_PERM = 64
+# 32 bands of 2 rows: pairs at the threshold become candidates with near certainty
+BAND_ROWS = 2
+MAX_PAGE_SPAN = 50
+
+_BULLET_RE = re.compile(r"^(\s*)(?:[-*•+]|\d{1,3}[.)])\s+")
+# A severity tag is "[Major]", "Major:" / "Major — ", an uppercase "MAJOR ..." or a heading such as
+# "Major findings"; prose like "Major portions of ..." or "Critical thinking ..." is not
+_TAG_RE = re.compile(
+    r"^(?:\[(?i:(critical|major|minor))\]"
+    r"|(?i:(critical|major|minor))(?=\s*[:–—]|\s+-\s|\s*$)"
+    r"|(CRITICAL|MAJOR|MINOR)\b"
+    r"|(?i:(critical|major|minor))(?=\s+(?i:findings?|issues?|deficienc(?:y|ies))\s*:?\s*$))"
+    r"(?:\s*[:\-–—]\s*|\s+|$)"
+)
+_SECTION_WORDS = {'finding', 'findings', 'issue', 'issues', 'deficiency', 'deficiencies', 'severity', ''}
+_STANDARD_RE = re.compile(
+    r"\b(ISO(?:/IEC)?|IEC|ASTM|ANSI(?:/AAMI)?|AAMI|UL|IEEE)\s*([A-Z]?\s?\d[\d.]*(?:-\d+)*)"
+    r"|\b21\s*CFR\s*(?:Part\s*)?(\d+(?:\.\d+)?)"
+)
+_PAGE_RE = re.compile(
+    r"\b(?:pages?|pgs?\.?|pp?\.?)\s*(\d+(?:\s*[-–]\s*\d+)?(?:\s*(?:,|and|&)\s*\d+(?:\s*[-–]\s*\d+)?)*)",
+    re.IGNORECASE
+)
+_WORD_RE = re.compile(r"[a-z0-9]+(?:[-.][a-z0-9]+)*")
+_STOPWORDS = {
+    'a', 'an', 'the', 'and', 'or', 'of', 'to', 'in', 'on', 'for', 'with', 'by', 'per', 'is', 'are', 'was', 'be',
+    'been', 'not', 'no', 'as', 'at', 'from', 'this', 'that', 'it', 'its', 'page', 'pages', 'p', 'pp', 'see',
+    'critical', 'major', 'minor', 'section',
+    # Nearly every finding reports something absent; these don't tell findings apart
+    'missing', 'lack', 'lacks', 'lacking', 'absent', 'provided', 'omit', 'omits', 'omitted', 'without',
+}
+_YEAR_RE = re.compile(r":(?:19|20)\d\d\b")
+
+# Fixed seed so signatures agree across processes (batch reviews, app workers)
+_rng = np.random.default_rng(10993)
+_PERM_A = _rng.integers(1, 2 ** 63, NUM_PERM, dtype=np.uint64) | np.uint64(1)
+_PERM_B = _rng.integers(0, 2 ** 63, NUM_PERM, dtype=np.uint64)
+
+
+def standards(text):
+    """Normalized standard references in text, e.g. 'ISO 10993-5', '21 CFR 820.30'"""
+    found = []
+    for org, number, cfr in _STANDARD_RE.findall(text):
+        ref = f"21 CFR {cfr}" if cfr else f"{org} {number.replace(' ', '').rstrip('.')}"
+        if ref not in found:
+            found.append(ref)
+    return found
+
+
+def pages(text):
+    """Page numbers referenced in text; short ranges are expanded"""
+    found = set()
+    for refs in _PAGE_RE.findall(text):
+        for start, end in re.findall(r"(\d+)(?:\s*[-–]\s*(\d+))?", refs):
+            lo, hi = int(start), int(end or start)
+            if hi < lo:
+                continue  # "page 10993-5" is a standard, not a range
+            found.update(range(lo, hi + 1) if hi - lo <= MAX_PAGE_SPAN else (lo, hi))
+    return sorted(found)
+
+
+def _severity(tag):
+    return next(g for g in tag.groups() if g).upper()
+
+
+def _finding(severity, text, agent):
+    return {'agent': agent, 'severity': severity, 'standards': [], 'pages': [], 'text': text}
+
+
+def parse_findings(output, agent=None):
+    """
+    Findings in one agent output, in order of appearance.
+
+    A line is a finding when it starts with a severity tag, or is a bullet
+    under a severity heading; indented lines and sub-bullets continue it.
+    """
+    results, section, current, indent = [], None, None, 0
+    for line in (output or "").splitlines():
+        if not line.strip():
+            current = None
+            continue
+        bullet = _BULLET_RE.match(line)
+        body = line[bullet.end():] if bullet else line.strip()
+        plain = re.sub(r"[*_`#]+", "", body).strip()
+        line_indent = len(line) - len(line.lstrip())
+        if current is not None and line_indent > indent and not _TAG_RE.match(plain):
+            current['text'] += " " + plain
+            continue
+        tag = _TAG_RE.match(plain)
+        rest = plain[tag.end():].strip() if tag else plain
+        if tag and rest.rstrip(':').lower() in _SECTION_WORDS:
+            section, current = _severity(tag), None
+            continue
+        if tag:
+            current = _finding(_severity(tag), rest, agent)
+        elif bullet and section:
+            current = _finding(section, rest, agent)
+        else:
+            if not bullet and (line.lstrip().startswith('#') or plain.endswith(':')):
+                section = None  # a heading outside the severity lists, e.g. "Conclusion:"
+            current = None
+            continue
+        indent = line_indent
+        results.append(current)
+    for f in results:
+        f['standards'] = standards(f['text'])
+        f['pages'] = pages(f['text'])
+    return results
+
+
+def _stem(word):
+    for suffix in ('ing', 'ed', 'es', 's'):
+        if len(word) > len(suffix) + 3 and word.endswith(suffix):
+            return word[:-len(suffix)]
+    return word
+
+
+def shingles(text):
+    """Content-word stems of a finding, the set its MinHash signature estimates"""
+    text = _YEAR_RE.sub("", _PAGE_RE.sub("", text))
+    return {_stem(w) for w in _WORD_RE.findall(text.lower()) if w not in _STOPWORDS}
+
+
+def signatures(texts):
+    """(len(texts), NUM_PERM) MinHash signatures, computed in one vectorized pass"""
+    sets = [sorted(shingles(t)) or [""] for t in texts]
+    lengths = [len(s) for s in sets]
+    flat = np.fromiter((zlib.crc32(w.encode('utf-8')) for s in sets for w in s), dtype=np.uint64,
+                       count=sum(lengths))
+    # Multiply-shift hashing of the 32-bit word hashes, one column per permutation
+    with np.errstate(over='ignore'):
+        hashed = (flat[:, None] * _PERM_A + _PERM_B) >> np.uint64(32)
+    offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    return np.minimum.reduceat(hashed, offsets, axis=0)
+
+
+def _compatible(a, b):
+    """Groups citing standards must share one; ISO 10993-5 and -10 are different tests"""
+    return a is None or b is None or bool(a & b)
+
+
+def consolidate(findings, threshold=DEDUP_THRESHOLD):
+    """
+    Merge near-duplicate findings, most severe and most reported first.
+
+    Each consolidated finding has the highest member severity, a
+    representative text, the union of standards, pages and agents, the
+    member count and the members themselves.
+    """
+    if not findings:
+        return []
+    sigs = signatures([f['text'] for f in findings])
+    parent = list(range(len(findings)))
+    # Per group root: the standards every citing member shares (None while no member cites any),
+    # so a chain of pairwise-similar findings can't bridge two different standards
+    cited = [set(f['standards']) or None for f in findings]
+
+    def root(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    candidates = set()
+    for start in range(0, NUM_PERM, BAND_ROWS):
+        buckets = {}
+        for i, band in enumerate(sigs[:, start:start + BAND_ROWS]):
+            buckets.setdefault(band.tobytes(), []).append(i)
+        for members in buckets.values():
+            candidates.update(combinations(members, 2))
+    if candidates:
+        pairs = np.array(sorted(candidates))
+        similar = (sigs[pairs[:, 0]] == sigs[pairs[:, 1]]).mean(axis=1) >= threshold
+        for i, j in pairs[similar].tolist():
+            ri, rj = root(i), root(j)
+            if ri != rj and _compatible(cited[ri], cited[rj]):
+                parent[rj] = ri
+                if cited[ri] is None or cited[rj] is None:
+                    cited[ri] = cited[ri] or cited[rj]
+                else:
+                    cited[ri] &= cited[rj]
+
+    groups = {}
+    for i in range(len(findings)):
+        groups.setdefault(root(i), []).append(findings[i])
+    merged = []
+    for members in groups.values():
+        severity = min((m['severity'] for m in members), key=SEVERITY_RANK.get)
+        lead = max((m for m in members if m['severity'] == severity), key=lambda m: len(m['text']))
+        merged.append({
+            'severity': severity,
+            'text': lead['text'],
+            'standards': sorted({s for m in members for s in m['standards']}),
+            'pages': sorted({p for m in members for p in m['pages']}),
+            'agents': sorted({m['agent'] for m in members if m['agent']}),
+            'count': len(members),
+            'members': [{'agent': m['agent'], 'severity': m['severity'], 'text': m['text']} for m in members],
+        })
+    merged.sort(key=lambda c: (SEVERITY_RANK[c['severity']], -c['count']))
+    return merged
+
+
+def severity_counts(items):
+    return {s: sum(1 for f in items if f['severity'] == s) for s in SEVERITIES}
+
+
+def findings_csv(consolidated):
+    """Yields CSV text for consolidated findings, one row each"""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(('severity', 'finding', 'standards', 'pages', 'agents', 'count'))
+    for c in consolidated:
+        writer.writerow((c['severity'], c['text'], "; ".join(c['standards']), ", ".join(map(str, c['pages'])),
+                         "; ".join(c['agents']), c['count']))
+    yield buf.getvalue()
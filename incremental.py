@@ -0,0 +1,176 @@
+"""
+Incremental re-review of revised submissions
+
+Pages and sections are content-hashed. Each agent run records the hashes
+of the pages it was given. When a revised document comes in, an agent's
+prior result is reused if it would be fed exactly the same page content
+again (the same retrieval selection, even if the pages moved). Otherwise
+it re-runs. Unchanged chunks of a re-run still hit the response cache.
+"""
+
+import hashlib
+
+from chunking import SECTION_RE
+from retrieval import select_pages
+
+REUSE = 'reuse'
+RERUN = 'rerun'
+
+
+def page_hash(text):
+    """Hash of page text, insensitive to whitespace-only changes"""
+    return hashlib.sha256(" ".join(text.split()).encode('utf-8')).hexdigest()[:16]
+
+
+def page_hashes(doc):
+    """{page_index: hash}, computed once and kept on the document record"""
+    if 'page_hashes' not in doc:
+        doc['page_hashes'] = {n: page_hash(text) for n, text in doc['pages'].items()}
+    return doc['page_hashes']
+
+
+def section_texts(doc):
+    """[{'title', 'pages' (1-based), 'text'}] split at section headings; text before the first is front matter"""
+    sections, current = [], None
+    for n in sorted(doc['pages']):
+        text = doc['pages'][n]
+        pos = 0
+        for m in SECTION_RE.finditer(text):
+            if current is not None:
+                current['parts'].append(text[pos:m.start()])
+            current = {'title': text[m.start():].lstrip().split('\n', 1)[0].strip()[:80], 'pages': [], 'parts': []}
+            sections.append(current)
+            pos = m.start()
+            if n + 1 not in current['pages']:
+                current['pages'].append(n + 1)
+        if current is None:
+            current = {'title': "(front matter)", 'pages': [], 'parts': []}
+            sections.append(current)
+        current['parts'].append(text[pos:])
+        if n + 1 not in current['pages']:
+            current['pages'].append(n + 1)
+    return [{'title': s['title'], 'pages': s['pages'], 'text': "".join(s['parts'])} for s in sections]
+
+
+def document_sections(doc):
+    """[{'title', 'pages' (1-based), 'hash'}] split at section headings, computed once per document"""
+    if 'sections' not in doc:
+        doc['sections'] = [{'title': s['title'], 'pages': s['pages'], 'hash': page_hash(s['text'])}
+                           for s in section_texts(doc)]
+    return doc['sections']
+
+
+def agent_pages(cfg, doc, top_k):
+    """({page_index: text}, ranked) that run_agent will feed this agent; ranked is empty without top_k"""
+    if not top_k:
+        return doc['pages'], []
+    return select_pages(doc, cfg, top_k)
+
+
+def input_record(doc, pages):
+    """Dependency record stored with a run: {1-based page: content hash}"""
+    hashes = page_hashes(doc)
+    return {str(n + 1): hashes.get(n) or page_hash(pages[n]) for n in sorted(pages)}
+
+
+def diff_documents(old_hashes, old_sections, doc):
+    """
+    What changed between a prior version (its page hashes and sections) and doc.
+
+    Pages are matched by content, so moved pages aren't reported as changed.
+    """
+    new_hashes = page_hashes(doc)
+    old_by_hash = {}
+    for n, h in old_hashes.items():
+        old_by_hash.setdefault(h, int(n))
+    new_set = set(new_hashes.values())
+    moved = []
+    new_content = []
+    for n in sorted(new_hashes):
+        old_n = old_by_hash.get(new_hashes[n])
+        if old_n is None:
+            new_content.append(n + 1)
+        elif old_n != n:
+            moved.append((old_n + 1, n + 1))
+    removed = sorted(int(n) + 1 for n, h in old_hashes.items() if h not in new_set)
+
+    old_titles = {s['title']: s for s in old_sections or []}
+    new_sections = document_sections(doc)
+    new_titles = {s['title'] for s in new_sections}
+    sections = []
+    for s in new_sections:
+        old = old_titles.get(s['title'])
+        if old is None:
+            sections.append({'title': s['title'], 'change': 'added', 'pages': s['pages']})
+        elif old['hash'] != s['hash']:
+            sections.append({'title': s['title'], 'change': 'modified', 'pages': s['pages']})
+    for title, s in old_titles.items():
+        if title not in new_titles:
+            sections.append({'title': title, 'change': 'removed', 'pages': s['pages']})
+    return {
+        'pages_unchanged': len(new_hashes) - len(new_content),
+        'pages_new_content': new_content,
+        'pages_removed': removed,
+        'pages_moved': moved,
+        'sections': sections,
+    }
+
+
+def plan_rereview(prior_entries, configs, fingerprints, doc, top_k, deps=None):
+    """
+    Decide per agent whether a prior result can be reused on doc.
+
+    prior_entries are run-store entries (with 'fingerprint', 'input_pages',
+    'output'); configs and fingerprints are keyed alike. Returns
+    {key: {'action', 'reason', 'prior', 'changed_pages'}}; agents downstream
+    of a re-run are re-run too.
+    """
+    hashes = page_hashes(doc)
+    by_fingerprint, by_agent = {}, {}
+    for e in prior_entries:
+        if 'output' in e and e.get('input_pages') and e.get('fingerprint'):
+            by_fingerprint[e['fingerprint']] = e
+            by_agent[e.get('agent')] = e
+
+    plan = {}
+    for key, cfg in configs.items():
+        prior = by_fingerprint.get(fingerprints[key])
+        if prior is None:
+            reason = "configuration changed" if cfg.get('name') in by_agent else "no prior result"
+            plan[key] = {'action': RERUN, 'reason': reason, 'prior': None, 'changed_pages': []}
+            continue
+        old = set(prior['input_pages'].values())
+        pages, _ = agent_pages(cfg, doc, top_k)
+        changed = [n + 1 for n in sorted(pages) if hashes[n] not in old]
+        dropped = len(old - {hashes[n] for n in pages})
+        if not changed and not dropped:
+            plan[key] = {'action': REUSE, 'reason': "input pages unchanged", 'prior': prior, 'changed_pages': []}
+        else:
+            reason = (f"{len(changed)} new or changed page(s)" if changed
+                      else f"{dropped} prior page(s) no longer selected")
+            plan[key] = {'action': RERUN, 'reason': reason, 'prior': prior, 'changed_pages': changed}
+
+    # An upstream re-run changes the downstream prompt
+    for key in _topological(deps or {}):
+        if plan.get(key, {}).get('action') != REUSE:
+            continue
+        upstream = [u for u in (deps or {}).get(key, []) if plan.get(u, {}).get('action') == RERUN]
+        if upstream:
+            plan[key].update(action=RERUN, reason=f"upstream {', '.join(map(str, upstream))} re-runs")
+    return plan
+
+
+def _topological(deps):
+    order, seen = [], set()
+
+    def visit(node):
+        if node in seen:
+            return
+        seen.add(node)
+        for u in deps.get(node, []):
+            visit(u)
+        order.append(node)
+
+    for node in deps:
+        visit(node)
+    return order
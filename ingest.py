@@ -0,0 +1,245 @@
+"""
+PDF ingestion for the Document Review tab
+
+Uploads are opened straight from the uploaded bytes object (no second copy of
+the buffer) and text is extracted page by page as a generator. Large
+documents are split into page batches across a process pool, and extracted
+page text is cached by document content hash in the shared resource cache,
+so reruns and other sessions don't re-parse.
+"""
+
+import os
+import sys
+import time
+import hashlib
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from metrics import METRICS
+from resource_cache import RESOURCES
+
+try:
+    import pymupdf as fitz
+    PYMUPDF_AVAILABLE = True
+except ImportError:
+    try:
+        import fitz  # PyMuPDF < 1.24.3
+        PYMUPDF_AVAILABLE = True
+    except ImportError:
+        PYMUPDF_AVAILABLE = False
+
+# Documents with more pages than this are extracted in a process pool
+PARALLEL_MIN_PAGES = 64
+PAGES_PER_TASK = 32
+INGEST_WORKERS = max(1, min(4, (os.cpu_count() or 2) - 1))
+
+
+def content_hash(data):
+    """SHA-256 of an uploaded document's bytes"""
+    return hashlib.sha256(memoryview(data)).hexdigest()
+
+
+def parse_page_range(spec, page_count):
+    """
+    Parse a 1-based page spec like "1-5, 8, 12-" into sorted 0-based indices.
+    An empty spec selects every page.
+    """
+    if not spec or not spec.strip():
+        return list(range(page_count))
+    pages = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            lo, hi = part.split("-", 1)
+            lo = int(lo) if lo.strip() else 1
+            hi = int(hi) if hi.strip() else page_count
+        else:
+            lo = hi = int(part)
+        if lo < 1 or hi < lo:
+            raise ValueError(f"Invalid page range: {part}")
+        pages.update(range(lo - 1, min(hi, page_count)))
+    return sorted(pages)
+
+
+class SharedPageCache:
+    """Extracted page text keyed on (document hash, page index), held in the process-wide resource cache"""
+
+    def __contains__(self, key):
+        return ('page', key) in RESOURCES
+
+    def get(self, doc_hash, page_no):
+        return RESOURCES.get('page', (doc_hash, page_no))
+
+    def put(self, doc_hash, page_no, text):
+        RESOURCES.put('page', (doc_hash, page_no), text, size=sys.getsizeof(text),
+                      label=f"{doc_hash[:12]} • page {page_no + 1}")
+
+    def stats(self):
+        kind = RESOURCES.stats()['by_kind'].get('page', {})
+        return {"pages": kind.get('entries', 0), "bytes": kind.get('bytes', 0), "hits": kind.get('hits', 0)}
+
+
+PAGE_CACHE = SharedPageCache()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Forking a process with live threads (Streamlit, job workers) can deadlock the child
+            _pool = ProcessPoolExecutor(max_workers=INGEST_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def open_pdf(data):
+    """Open PDF bytes with PyMuPDF; pass bytes (e.g. UploadedFile.getvalue()) to avoid a copy"""
+    if not PYMUPDF_AVAILABLE:
+        raise RuntimeError("PyMuPDF not installed. PDF ingestion disabled.")
+    return fitz.open(stream=data, filetype="pdf")
+
+
+def _extract_pages(path, page_nos):
+    """Process-pool worker: extract text for page_nos from the PDF at path"""
+    with fitz.open(path) as doc:
+        return [(n, doc[n].get_text("text")) for n in page_nos]
+
+
+def iter_page_text(data, pages=None, doc_hash=None, cache=None, parallel=None):
+    """
+    Yield (page_index, text) for each requested page in order.
+
+    pages is a list of 0-based indices (default: all). Cached pages are served
+    without opening the document; the rest are extracted in-process or, for
+    large documents, across the ingestion process pool. Each pass is
+    recorded in METRICS (pages, pages with a text layer, time).
+    """
+    start = time.time()
+    yielded = with_text = cached = 0
+    try:
+        for page_no, text, from_cache in _iter_page_text(data, pages, doc_hash, cache, parallel):
+            yielded += 1
+            with_text += bool(text.strip())
+            cached += from_cache
+            yield page_no, text
+    finally:
+        # Fully cached passes are just reruns re-reading the cache
+        if yielded and cached < yielded:
+            METRICS.record_ingest(yielded, with_text, cached, time.time() - start)
+
+
+def _iter_page_text(data, pages, doc_hash, cache, parallel):
+    """iter_page_text body; yields (page_index, text, served_from_cache)"""
+    cache = cache or PAGE_CACHE
+    doc_hash = doc_hash or content_hash(data)
+    doc = None
+    if pages is None:
+        doc = open_pdf(data)
+        pages = list(range(doc.page_count))
+
+    missing = [n for n in pages if (doc_hash, n) not in cache]
+    if parallel is None:
+        parallel = len(missing) >= PARALLEL_MIN_PAGES and INGEST_WORKERS > 1
+
+    try:
+        if not missing:
+            for n in pages:
+                yield n, cache.get(doc_hash, n), True
+            return
+
+        if not parallel:
+            doc = doc or open_pdf(data)
+            for n in pages:
+                text = cache.get(doc_hash, n)
+                hit = text is not None
+                if not hit:
+                    text = doc[n].get_text("text")
+                    cache.put(doc_hash, n, text)
+                yield n, text, hit
+            return
+
+        # Workers open the document from a spill file instead of each
+        # receiving a pickled copy of the upload
+        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+            tmp.write(data)
+            spill = tmp.name
+        try:
+            pool = _get_pool()
+            batches = [missing[i:i + PAGES_PER_TASK] for i in range(0, len(missing), PAGES_PER_TASK)]
+            futures = [pool.submit(_extract_pages, spill, batch) for batch in batches]
+            extracted = {}
+            next_future = 0
+            for n in pages:
+                text = cache.get(doc_hash, n)
+                hit = text is not None
+                while text is None and n not in extracted and next_future < len(futures):
+                    for page_no, page_text in futures[next_future].result():
+                        cache.put(doc_hash, page_no, page_text)
+                        extracted[page_no] = page_text
+                    next_future += 1
+                if text is None:
+                    if n not in extracted:
+                        # Evicted between the cache check and now
+                        doc = doc or open_pdf(data)
+                        extracted[n] = doc[n].get_text("text")
+                        cache.put(doc_hash, n, extracted[n])
+                    text = extracted.pop(n)
+                yield n, text, hit
+        finally:
+            os.unlink(spill)
+    finally:
+        if doc is not None:
+            doc.close()
+
+
+def pdf_page_count(data):
+    with open_pdf(data) as doc:
+        return doc.page_count
+
+
+TEXT_PAGE_CHARS = 3000
+TEXT_SUFFIXES = ('.txt', '.md', '.csv', '.json')
+SAMPLED_SUFFIXES = ('.csv', '.json')
+
+
+def split_text_pages(text, page_chars=TEXT_PAGE_CHARS):
+    """Split plain text into pseudo-pages on form feeds, else on line boundaries"""
+    if "\f" in text:
+        return {n: page for n, page in enumerate(text.split("\f"))}
+    pages, current, size = {}, [], 0
+    for line in text.splitlines(keepends=True):
+        if current and size + len(line) > page_chars:
+            pages[len(pages)] = "".join(current)
+            current, size = [], 0
+        current.append(line)
+        size += len(line)
+    if current:
+        pages[len(pages)] = "".join(current)
+    return pages
+
+
+def load_document(path):
+    """Read a submission file into {'name', 'hash', 'page_count', 'pages'}"""
+    name = os.path.basename(path)
+    if name.lower().endswith(SAMPLED_SUFFIXES):
+        # Test-data files can be huge; agents get a bounded sample with its totals
+        from previews import read_sample, sample_document
+        with open(path, 'rb') as f:
+            return sample_document(name, read_sample(name, f))
+    with open(path, 'rb') as f:
+        data = f.read()
+    doc_hash = content_hash(data)
+    if name.lower().endswith('.pdf'):
+        # Batch workers already run in their own processes
+        pages = dict(iter_page_text(data, doc_hash=doc_hash, parallel=False))
+    elif name.lower().endswith(TEXT_SUFFIXES):
+        pages = split_text_pages(data.decode('utf-8', errors='replace'))
+    else:
+        raise ValueError(f"Unsupported document type: {name}")
+    return {'name': name, 'hash': doc_hash, 'page_count': len(pages), 'pages': pages}
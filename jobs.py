@@ -0,0 +1,180 @@
+"""
+Background job queue for agent runs
+
+Runs are submitted as jobs to a process-wide worker pool, so they keep going
+through Streamlit reruns, tab switches and browser refreshes, and every
+session's jobs share the same workers. The job table keeps status, progress
+and partial (streamed) output for each agent until the UI polls it; finished
+results are also persisted in the run store.
+"""
+
+import os
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+DEFAULT_JOB_WORKERS = 2
+MAX_JOBS_KEPT = 200
+# Seconds between UI polls of a running job
+JOB_POLL_S = 1.0
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    """One submitted run: agent states, streamed partial output and the result log"""
+
+    def __init__(self, title, labels, owner=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.title = title
+        self.owner = owner
+        self.status = QUEUED
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.error = None
+        self.run_id = None
+        self.summary = {}
+        self.cancel_requested = False
+        self._lock = threading.Lock()
+        self._agents = OrderedDict(
+            (key, {'label': label, 'state': 'pending', 'output': None, 'error': None, 'partial': []})
+            for key, label in labels.items()
+        )
+
+    def buffer(self, key):
+        """List the agent's streamed chunks can be appended to from any thread"""
+        return self._agents[key]['partial']
+
+    def check_cancelled(self):
+        if self.cancel_requested:
+            raise JobCancelled("Job cancelled")
+
+    def agent_started(self, key):
+        with self._lock:
+            self._agents[key]['state'] = 'running'
+
+    def agent_done(self, key, output=None, error=None, skipped=False, cancelled=False):
+        with self._lock:
+            agent = self._agents[key]
+            agent['output'], agent['error'] = output, error
+            if cancelled:
+                agent['state'] = 'cancelled'
+            else:
+                agent['state'] = 'skipped' if skipped else ('failed' if error else 'complete')
+
+    def running_agents(self):
+        with self._lock:
+            return sum(1 for a in self._agents.values() if a['state'] == 'running')
+
+    def snapshot(self):
+        """Point-in-time copy for rendering"""
+        with self._lock:
+            agents = {
+                key: dict(a, partial="".join(list(a['partial'])) if a['state'] == 'running' else "")
+                for key, a in self._agents.items()
+            }
+            done = sum(1 for a in self._agents.values()
+                       if a['state'] in ('complete', 'failed', 'skipped', 'cancelled'))
+        end = self.finished or time.time()
+        return {
+            'id': self.id,
+            'title': self.title,
+            'owner': self.owner,
+            'status': self.status,
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished,
+            'elapsed_s': (end - self.started) if self.started else None,
+            'progress': done / len(agents) if agents else 1.0,
+            'done': done,
+            'total': len(agents),
+            'error': self.error,
+            'run_id': self.run_id,
+            'summary': dict(self.summary),
+            'agents': agents,
+        }
+
+
+class JobQueue:
+    """Process-wide worker pool plus a bounded table of recent jobs"""
+
+    def __init__(self, workers=DEFAULT_JOB_WORKERS, keep=MAX_JOBS_KEPT):
+        self.workers = workers
+        self.keep = keep
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self._pool = None
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+            return self._pool
+
+    def submit(self, title, work, labels, owner=None):
+        """Queue work(job) to run in the background; labels maps agent keys to display names"""
+        job = Job(title, labels, owner)
+        with self._lock:
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.keep:
+                oldest = next((k for k, j in self._jobs.items() if j.status in FINISHED_STATES), None)
+                if oldest is None:
+                    break
+                del self._jobs[oldest]
+        self._executor().submit(self._run, job, work)
+        return job.id
+
+    def _run(self, job, work):
+        if job.cancel_requested:
+            job.status, job.finished = CANCELLED, time.time()
+            return
+        job.status, job.started = RUNNING, time.time()
+        try:
+            work(job)
+            job.status = CANCELLED if job.cancel_requested else DONE
+        except JobCancelled:
+            job.status = CANCELLED
+        except Exception as e:
+            job.status, job.error = FAILED, str(e)
+        finally:
+            job.finished = time.time()
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """Ask a job to stop; agents already running finish, queued agents are skipped"""
+        job = self.get(job_id)
+        if job is not None and job.status not in FINISHED_STATES:
+            job.cancel_requested = True
+
+    def jobs(self, limit=20):
+        """Snapshots of the most recent jobs, newest first"""
+        with self._lock:
+            recent = list(self._jobs.values())[-limit:]
+        return [j.snapshot() for j in reversed(recent)]
+
+    def stats(self):
+        """Job counts per status, plus 'agents_running' across every running job"""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        states = [j.status for j in jobs]
+        counts = {s: states.count(s) for s in (QUEUED, RUNNING, DONE, FAILED, CANCELLED)}
+        counts['agents_running'] = sum(j.running_agents() for j in jobs if j.status == RUNNING)
+        return counts
+
+
+JOBS = JobQueue(int(os.getenv("JOB_WORKERS", DEFAULT_JOB_WORKERS)))
@@ -0,0 +1,155 @@
+"""
+In-memory instrumentation for provider calls, document ingestion and reviews
+
+Events go into a bounded ring buffer shared by every session in the process.
+Aggregates (latency percentiles, error rates, tokens, throughput) are
+computed on demand over a rolling window for the Dashboard.
+"""
+
+import math
+import time
+import threading
+from collections import deque
+
+RING_SIZE = 5000
+DEFAULT_WINDOW_S = 3600
+# Health thresholds for the Model Health chips
+DEGRADED_ERROR_RATE = 0.2
+DEGRADED_P95_S = 60.0
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class Metrics:
+    """Ring buffer of timestamped events with rolling aggregates"""
+
+    def __init__(self, size=RING_SIZE):
+        self._lock = threading.Lock()
+        self._events = deque(maxlen=size)
+
+    def record(self, kind, **fields):
+        fields['kind'] = kind
+        fields.setdefault('ts', time.time())
+        with self._lock:
+            self._events.append(fields)
+
+    def record_call(self, provider, model, latency_s, ok, tokens_in=None, tokens_out=None, ttft_s=None):
+        self.record('provider', provider=provider, model=model, latency_s=latency_s, ok=ok,
+                    tokens_in=tokens_in, tokens_out=tokens_out, ttft_s=ttft_s)
+
+    def record_ingest(self, pages, pages_with_text, cached, elapsed_s):
+        self.record('ingest', pages=pages, pages_with_text=pages_with_text, cached=cached, elapsed_s=elapsed_s)
+
+    def record_review(self, agents, errors, elapsed_s):
+        self.record('review', agents=agents, errors=errors, elapsed_s=elapsed_s)
+
+    def events(self, kind=None, window_s=DEFAULT_WINDOW_S):
+        cutoff = time.time() - window_s if window_s else 0
+        with self._lock:
+            return [e for e in self._events if e['ts'] >= cutoff and (kind is None or e['kind'] == kind)]
+
+    def provider_stats(self, window_s=DEFAULT_WINDOW_S):
+        """Per (provider, model): calls, error rate, p50/p95/p99 latency, TTFT, tokens and throughput"""
+        groups = {}
+        for e in self.events('provider', window_s):
+            groups.setdefault((e['provider'], e['model']), []).append(e)
+        rows = []
+        for (provider, model), evs in sorted(groups.items(), key=lambda kv: (kv[0][0], str(kv[0][1]))):
+            ok = [e for e in evs if e['ok']]
+            lat = sorted(e['latency_s'] for e in ok)
+            ttft = sorted(e['ttft_s'] for e in ok if e.get('ttft_s') is not None)
+            tokens_in = sum(e.get('tokens_in') or 0 for e in ok)
+            tokens_out = sum(e.get('tokens_out') or 0 for e in ok)
+            span = max(1.0, evs[-1]['ts'] - evs[0]['ts'] + (evs[0]['latency_s'] or 0))
+            rows.append({
+                'provider': provider,
+                'model': model,
+                'calls': len(evs),
+                'error_rate': round(1 - len(ok) / len(evs), 3),
+                'p50_s': percentile(lat, 50),
+                'p95_s': percentile(lat, 95),
+                'p99_s': percentile(lat, 99),
+                'ttft_p50_s': percentile(ttft, 50),
+                'tokens_in': tokens_in,
+                'tokens_out': tokens_out,
+                'tokens_out_per_s': round(tokens_out / sum(lat), 1) if lat and sum(lat) > 0 else None,
+                'calls_per_min': round(len(evs) / span * 60, 2),
+            })
+        return rows
+
+    def provider_health(self, provider, window_s=DEFAULT_WINDOW_S):
+        """'unknown', 'healthy', 'degraded' or 'down' from recent calls to any of the provider's models"""
+        evs = [e for e in self.events('provider', window_s) if e['provider'] == provider]
+        if not evs:
+            return 'unknown', {}
+        ok = sorted(e['latency_s'] for e in evs if e['ok'])
+        error_rate = 1 - len(ok) / len(evs)
+        p95 = percentile(ok, 95)
+        detail = {'calls': len(evs), 'error_rate': round(error_rate, 3), 'p50_s': percentile(ok, 50), 'p95_s': p95}
+        recent = evs[-3:]
+        if not ok or (len(recent) == 3 and not any(e['ok'] for e in recent)):
+            return 'down', detail
+        if error_rate > DEGRADED_ERROR_RATE or (p95 is not None and p95 > DEGRADED_P95_S):
+            return 'degraded', detail
+        return 'healthy', detail
+
+    def latency_percentile(self, provider, model, pct, field='latency_s', min_calls=5, window_s=DEFAULT_WINDOW_S):
+        """Percentile of a successful-call timing field for one model, or None with too little history"""
+        values = sorted(e[field] for e in self.events('provider', window_s)
+                        if e['provider'] == provider and e['model'] == model and e['ok'] and e.get(field) is not None)
+        return percentile(values, pct) if len(values) >= min_calls else None
+
+    def record_hedge(self, provider, model, hedged, failover, winner, added_cost_usd):
+        self.record('hedge', provider=provider, model=model, hedged=hedged, failover=failover, winner=winner,
+                    added_cost_usd=added_cost_usd)
+
+    def hedge_stats(self, window_s=None):
+        """Routed calls, hedge rate, secondary wins, failovers and cost added by hedged duplicates"""
+        evs = self.events('hedge', window_s)
+        hedged = [e for e in evs if e['hedged']]
+        return {
+            'calls': len(evs),
+            'hedged': len(hedged),
+            'hedge_rate': (len(hedged) / len(evs)) if evs else None,
+            'secondary_wins': sum(1 for e in hedged if e['winner'] == 'secondary'),
+            'failovers': sum(1 for e in evs if e['failover']),
+            'added_cost_usd': round(sum(e['added_cost_usd'] or 0 for e in evs), 5),
+        }
+
+    def ingest_stats(self, window_s=None):
+        evs = self.events('ingest', window_s)
+        pages = sum(e['pages'] for e in evs)
+        parsed = sum(e['pages'] - e['cached'] for e in evs)
+        parse_s = sum(e['elapsed_s'] for e in evs if e['pages'] > e['cached'])
+        return {
+            'documents': len(evs),
+            'pages': pages,
+            'text_coverage': (sum(e['pages_with_text'] for e in evs) / pages) if pages else None,
+            'pages_per_s': round(parsed / parse_s, 1) if parse_s > 0 else None,
+        }
+
+    def review_stats(self, window_s=None):
+        evs = self.events('review', window_s)
+        return {
+            'reviews': len(evs),
+            'avg_elapsed_s': (sum(e['elapsed_s'] for e in evs) / len(evs)) if evs else None,
+        }
+
+
+METRICS = Metrics()
+
+
+def format_duration(seconds):
+    if seconds is None:
+        return "—"
+    if seconds < 60:
+        return f"{seconds:.1f}s"
+    if seconds < 3600:
+        return f"{seconds / 60:.1f}m"
+    return f"{seconds / 3600:.1f}h"
@@ -0,0 +1,132 @@
+"""
+On-demand PDF page rendering for the Document Viewer and Grok image input
+
+Pages are only rendered when they are about to be shown: the viewer asks
+for the thumbnails in its visible window, and one document open serves the
+whole window. Rendered images are kept in a byte-bounded LRU keyed on
+(document hash, page, width, format). Images sent to Grok are downscaled to
+a maximum side and JPEG-compressed under a byte budget, never full-resolution
+renders.
+"""
+
+import os
+import base64
+import threading
+from collections import OrderedDict
+
+from ingest import PYMUPDF_AVAILABLE, open_pdf
+
+if PYMUPDF_AVAILABLE:
+    from ingest import fitz
+
+PIXMAP_CACHE_MAX_BYTES = int(os.getenv("PIXMAP_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+THUMB_WIDTH = 160
+VIEW_WIDTH = 900
+THUMBS_PER_VIEW = 8
+# Grok image input: longest side in pixels, JPEG quality steps and size budget
+IMAGE_MAX_SIDE = 1024
+IMAGE_QUALITIES = (75, 60, 45, 30)
+IMAGE_MAX_BYTES = 300 * 1024
+
+
+class PixmapCache:
+    """LRU of encoded page images, bounded by total bytes"""
+
+    def __init__(self, max_bytes=PIXMAP_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._images = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            image = self._images.get(key)
+            if image is None:
+                self.misses += 1
+                return None
+            self._images.move_to_end(key)
+            self.hits += 1
+            return image
+
+    def put(self, key, image):
+        with self._lock:
+            if key in self._images:
+                self._bytes -= len(self._images.pop(key))
+            if len(image) > self.max_bytes:
+                return
+            self._images[key] = image
+            self._bytes += len(image)
+            while self._bytes > self.max_bytes:
+                _, old = self._images.popitem(last=False)
+                self._bytes -= len(old)
+
+    def stats(self):
+        with self._lock:
+            return {"images": len(self._images), "bytes": self._bytes, "hits": self.hits, "misses": self.misses}
+
+
+PIXMAP_CACHE = PixmapCache()
+
+
+def _pixmap(page, width=None, max_side=None):
+    """Render a page at a target width, or so its longest side is at most max_side"""
+    rect = page.rect
+    if width:
+        zoom = width / rect.width
+    else:
+        zoom = min(1.0, max_side / max(rect.width, rect.height)) if max_side else 1.0
+    return page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+
+
+def render_pages(data, doc_hash, page_nos, width=THUMB_WIDTH, cache=None):
+    """{page_index: PNG bytes} for just the requested pages; the document is opened once for the misses"""
+    cache = cache or PIXMAP_CACHE
+    images, missing = {}, []
+    for n in page_nos:
+        image = cache.get((doc_hash, n, width, 'png'))
+        if image is None:
+            missing.append(n)
+        else:
+            images[n] = image
+    if missing:
+        with open_pdf(data) as doc:
+            for n in missing:
+                image = _pixmap(doc[n], width=width).tobytes("png")
+                cache.put((doc_hash, n, width, 'png'), image)
+                images[n] = image
+    return images
+
+
+def render_page(data, doc_hash, page_no, width=VIEW_WIDTH, cache=None):
+    return render_pages(data, doc_hash, [page_no], width, cache)[page_no]
+
+
+def page_jpeg(data, doc_hash, page_no, max_side=IMAGE_MAX_SIDE, max_bytes=IMAGE_MAX_BYTES, cache=None):
+    """Downscaled JPEG of a page, stepping quality down until it fits max_bytes"""
+    cache = cache or PIXMAP_CACHE
+    key = (doc_hash, page_no, max_side, 'jpeg')
+    image = cache.get(key)
+    if image is not None:
+        return image
+    with open_pdf(data) as doc:
+        pix = _pixmap(doc[page_no], max_side=max_side)
+    for quality in IMAGE_QUALITIES:
+        image = pix.tobytes("jpeg", jpg_quality=quality)
+        if len(image) <= max_bytes:
+            break
+    cache.put(key, image)
+    return image
+
+
+def page_image_url(data, doc_hash, page_no, max_side=IMAGE_MAX_SIDE, max_bytes=IMAGE_MAX_BYTES):
+    """data: URL of the page's downscaled JPEG, for providers that take image input"""
+    image = page_jpeg(data, doc_hash, page_no, max_side, max_bytes)
+    return "data:image/jpeg;base64," + base64.b64encode(image).decode("ascii")
+
+
+def visible_window(page_count, start, size=THUMBS_PER_VIEW):
+    """0-based page indices in the thumbnail strip's window, clamped to the document"""
+    start = max(0, min(start, max(0, page_count - size)))
+    return list(range(start, min(page_count, start + size)))
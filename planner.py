@@ -0,0 +1,253 @@
+"""
+Pre-flight token, cost and latency planning for runner configs
+
+Before a run, each agent's system prompt, user prompt (plus forecast
+upstream outputs) and document chunks are counted with a local tokenizer.
+Output length, time to first token and generation speed are forecast from
+the model's recent runs in the run store, falling back to defaults for
+models with no history. Agents whose prompt can't fit the model's context
+are routed to a larger-context model of the same provider, or trimmed when
+none fits. Estimates are stored with each run so their accuracy can be
+reported afterward.
+"""
+
+import re
+import math
+import statistics
+
+from chunking import (
+    MODEL_CONTEXT, PROMPT_RESERVE_TOKENS, DEFAULT_MAP_WORKERS, model_context, input_budget, chunk_pages,
+)
+from incremental import agent_pages
+from resource_cache import RESOURCES
+
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+# Approximate list prices in USD per million (input, output) tokens; prefix-matched like MODEL_CONTEXT
+MODEL_PRICES = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4.1": (2.00, 8.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-5": (1.25, 10.00),
+    "gpt-5-mini": (0.25, 2.00),
+    "gpt-5-nano": (0.05, 0.40),
+    "gemini-2.0-flash": (0.10, 0.40),
+    "gemini-2.5-flash": (0.30, 2.50),
+    "gemini-2.5-pro": (1.25, 10.00),
+    "grok-beta": (5.00, 15.00),
+    "grok-3-mini": (0.30, 0.50),
+    "grok-4": (3.00, 15.00),
+}
+# Larger-context models to route to, cheapest first
+ROUTES = {
+    "openai": ("gpt-5-nano", "gpt-5-mini", "gpt-4.1-mini", "gpt-4.1"),
+    "gemini": ("gemini-2.5-flash", "gemini-2.5-pro"),
+    "grok": ("grok-3-mini", "grok-4"),
+}
+
+# Used until a model has run history
+DEFAULT_TTFT_S = 1.0
+DEFAULT_TOKENS_PER_S = 50.0
+DEFAULT_OUTPUT_SHARE = 0.5
+HISTORY_RUNS = 200
+
+OK = 'ok'
+ROUTE = 'route'
+TRIM = 'trim'
+
+# Words, numbers and punctuation runs, as a BPE pre-tokenizer would split them
+_PIECE_RE = re.compile(r"[A-Za-z]+|\d{1,3}|[^\sA-Za-z\d]+")
+_encoding = None
+
+
+def _tiktoken_encoding():
+    global _encoding
+    if _encoding is None:
+        try:
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            _encoding = False  # encoding files unavailable offline
+    return _encoding
+
+
+def count_tokens(text):
+    """Input tokens for text: tiktoken when available, else a local pre-tokenizer estimate"""
+    if not text:
+        return 0
+    if TIKTOKEN_AVAILABLE and _tiktoken_encoding():
+        return len(_encoding.encode(text, disallowed_special=()))
+    # Common words are one token; longer ones split into ~4-character pieces
+    return sum(1 if len(p) <= 4 or not p.isalpha() else math.ceil(len(p) / 4)
+               for p in _PIECE_RE.findall(text))
+
+
+def trim_to_tokens(text, max_tokens):
+    """Keep the head of text within max_tokens, marking the cut"""
+    if count_tokens(text) <= max_tokens:
+        return text
+    marker = "\n\n[... prompt trimmed to fit the model's context ...]"
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count_tokens(text[:mid]) + count_tokens(marker) <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo] + marker
+
+
+def model_price(model):
+    if model in MODEL_PRICES:
+        return MODEL_PRICES[model]
+    for name in sorted(MODEL_PRICES, key=len, reverse=True):
+        if model and model.startswith(name):
+            return MODEL_PRICES[name]
+    return None
+
+
+def prompt_limit(cfg):
+    """Most user-prompt tokens one call to this config can take"""
+    return (model_context(cfg.get('model')) - cfg.get('params', {}).get('max_tokens', 1500)
+            - count_tokens(cfg.get('system_prompt', '')) - PROMPT_RESERVE_TOKENS)
+
+
+def fit_prompt(cfg, prompt):
+    """Prompt trimmed to the config's context; applied at run time, when upstream outputs are known"""
+    return trim_to_tokens(prompt, max(256, prompt_limit(cfg)))
+
+
+def model_history(store, provider, model, limit=HISTORY_RUNS):
+    """Median TTFT, generation speed and output length over the model's recent single-call runs"""
+    ttfts, speeds, outputs = [], [], []
+    for r in store.provider_calls(provider, model, limit):
+        if r.get('chunks') and len(r['chunks']) > 1:
+            continue  # map-reduce runs mix several calls
+        if r.get('ttft_s') is not None:
+            ttfts.append(r['ttft_s'])
+        if r.get('tokens_out'):
+            outputs.append(r['tokens_out'])
+            gen_s = (r.get('elapsed_s') or 0) - (r.get('ttft_s') or 0)
+            if gen_s > 0:
+                speeds.append(r['tokens_out'] / gen_s)
+    return {
+        'runs': len(outputs),
+        'ttft_s': statistics.median(ttfts) if ttfts else None,
+        'tokens_per_s': statistics.median(speeds) if speeds else None,
+        'tokens_out': statistics.median(outputs) if outputs else None,
+    }
+
+
+def plan_agent(cfg, prompt_tokens, doc=None, top_k=0, chunk_budget=None, history=None):
+    """
+    Estimate one agent run: calls, tokens in/out, cost and latency.
+
+    prompt_tokens counts the user prompt including forecast upstream outputs.
+    Returns a plan dict whose 'action' is ok, route (with the new 'model')
+    or trim.
+    """
+    history = history or {}
+    params = cfg.get('params', {})
+    max_tokens = params.get('max_tokens', 1500)
+    model, action, note = cfg.get('model'), OK, ""
+    system_tokens = count_tokens(cfg.get('system_prompt', ''))
+    needed = system_tokens + prompt_tokens + max_tokens + PROMPT_RESERVE_TOKENS
+    if needed > model_context(model):
+        bigger = next((m for m in ROUTES.get(cfg.get('provider'), ()) if MODEL_CONTEXT[m] >= needed), None)
+        if bigger:
+            action, note = ROUTE, f"{needed:,} tokens exceed {model}'s {model_context(model):,}; routed to {bigger}"
+            model = bigger
+        else:
+            action, note = TRIM, f"{needed:,} tokens exceed {model_context(model):,}; the prompt will be trimmed"
+            prompt_tokens = max(256, model_context(model) - system_tokens - max_tokens - PROMPT_RESERVE_TOKENS)
+
+    out_per_call = min(max_tokens, history.get('tokens_out') or max_tokens * DEFAULT_OUTPUT_SHARE)
+    ttft = history.get('ttft_s') or DEFAULT_TTFT_S
+    speed = history.get('tokens_per_s') or DEFAULT_TOKENS_PER_S
+    call_s = ttft + out_per_call / speed
+
+    calls = [system_tokens + prompt_tokens]
+    waves = 1
+    if doc:
+        pages, _ = agent_pages(cfg, doc, top_k)
+        budget = input_budget(dict(cfg, model=model), chunk_budget)
+        # Re-planned on every rerun, so chunk token counts are shared per document, page set and budget
+        chunk_tokens = RESOURCES.get_or_build(
+            'chunk_tokens', (doc['hash'], tuple(sorted(pages)), budget),
+            lambda: [count_tokens(c['text']) for c in chunk_pages(pages, budget)],
+            label=f"{doc['hash'][:12]} • {len(pages)} pages • {budget} tokens"
+        )
+        calls = [system_tokens + prompt_tokens + n for n in chunk_tokens]
+        if len(chunk_tokens) > 1:
+            # Map calls run DEFAULT_MAP_WORKERS at a time, then one reduce over the partial answers
+            calls.append(system_tokens + prompt_tokens + int(len(chunk_tokens) * out_per_call))
+            waves = math.ceil(len(chunk_tokens) / DEFAULT_MAP_WORKERS) + 1
+    tokens_in = sum(calls)
+    tokens_out = int(out_per_call * len(calls))
+    price = model_price(model)
+    return {
+        'model': model,
+        'action': action,
+        'note': note,
+        'calls': len(calls),
+        'tokens_in': tokens_in,
+        'tokens_out': tokens_out,
+        'cost_usd': round((tokens_in * price[0] + tokens_out * price[1]) / 1e6, 5) if price else None,
+        'latency_s': round(waves * call_s, 1),
+        'history_runs': history.get('runs', 0),
+    }
+
+
+def plan_run(configs, user_prompt, deps, store, doc=None, top_k=0, chunk_budget=None):
+    """
+    {key: plan} for every agent config, in dependency order, plus the run's
+    total cost and critical-path latency under 'total'.
+    """
+    base_tokens = count_tokens(user_prompt)
+    histories, plans, finish = {}, {}, {}
+    pending = dict(deps)
+    while pending:
+        ready = [k for k, ups in pending.items() if all(u in plans for u in ups)]
+        if not ready:
+            break  # cycles are reported by validate_dag
+        for key in ready:
+            ups = pending.pop(key)
+            cfg = configs[key]
+            hkey = (cfg.get('provider'), cfg.get('model'))
+            if hkey not in histories:
+                histories[hkey] = model_history(store, *hkey)
+            # Each upstream output is appended to the prompt (build_prompt)
+            prompt_tokens = base_tokens + sum(plans[u]['tokens_out'] // plans[u]['calls'] + 16 for u in ups)
+            plans[key] = plan_agent(cfg, prompt_tokens, doc, top_k, chunk_budget, histories[hkey])
+            finish[key] = max((finish[u] for u in ups), default=0.0) + plans[key]['latency_s']
+    costs = [p['cost_usd'] for p in plans.values()]
+    plans['total'] = {
+        'tokens_in': sum(p['tokens_in'] for p in plans.values()),
+        'tokens_out': sum(p['tokens_out'] for p in plans.values()),
+        'cost_usd': round(sum(costs), 4) if costs and None not in costs else None,
+        'latency_s': round(max(finish.values(), default=0.0), 1),
+    }
+    return plans
+
+
+def estimate_record(plan):
+    """The part of a plan stored with the run, for accuracy tracking"""
+    return {k: plan[k] for k in ('tokens_in', 'tokens_out', 'cost_usd', 'latency_s')}
+
+
+def accuracy(store, limit=HISTORY_RUNS):
+    """Median absolute percentage error of recent estimates against actual runs"""
+    errors = {'tokens_in': [], 'tokens_out': [], 'latency_s': []}
+    actual_field = {'tokens_in': 'tokens_in', 'tokens_out': 'tokens_out', 'latency_s': 'elapsed_s'}
+    runs = store.estimated_runs(limit)
+    for r in runs:
+        estimate = r.get('estimate') or {}
+        for field, values in errors.items():
+            actual = r.get(actual_field[field])
+            if actual and estimate.get(field) is not None:
+                values.append(abs(estimate[field] - actual) / actual)
+    return {'runs': len(runs), **{f: (statistics.median(v) if v else None) for f, v in errors.items()}}
@@ -0,0 +1,269 @@
+"""
+Bounded-memory previews of text, CSV and JSON uploads
+
+Readers take a binary file object and stop after SAMPLE_BYTES, so a
+multi-hundred-MB test-data upload costs about the same as a small one.
+Each returns the preview shown in the Document Review tab, the sample text
+agents are given, and totals extrapolated from the bytes actually read.
+"""
+
+import os
+import csv
+import json
+import codecs
+import hashlib
+
+from ingest import split_text_pages
+
+SAMPLE_BYTES = 1024 * 1024
+READ_CHUNK = 64 * 1024
+PREVIEW_CHARS = 1000
+PREVIEW_ROWS = 20
+PREVIEW_RECORDS = 5
+MAX_KEYS = 50
+
+
+class _Sampler:
+    """Reads f up to a byte budget, decoding incrementally and hashing what it consumed"""
+
+    def __init__(self, f, budget):
+        self.f = f
+        self.budget = budget
+        self.size = _size(f)
+        self.bytes_read = 0
+        self.parts = []
+        self.eof = False
+        self._sha = hashlib.sha256()
+        self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+    def _take(self, raw):
+        if not raw:
+            self.eof = True
+            return self._decoder.decode(b"", final=True)
+        self.bytes_read += len(raw)
+        self._sha.update(raw)
+        text = self._decoder.decode(raw)
+        self.parts.append(text)
+        return text
+
+    def chunks(self):
+        while self.bytes_read < self.budget and not self.eof:
+            text = self._take(self.f.read(min(READ_CHUNK, self.budget - self.bytes_read)))
+            if text:
+                yield text
+
+    def lines(self):
+        # readline's limit keeps one enormous line from blowing the budget
+        while self.bytes_read < self.budget and not self.eof:
+            text = self._take(self.f.readline(self.budget - self.bytes_read))
+            if text:
+                yield text
+
+    @property
+    def truncated(self):
+        return self.bytes_read < self.size
+
+    def text(self):
+        return "".join(self.parts)
+
+    def extrapolate(self, count):
+        """Approximate total for the whole file from a count over the bytes read so far"""
+        if not self.truncated or not self.bytes_read:
+            return count
+        return int(count * self.size / self.bytes_read)
+
+    def result(self, kind, preview, records, record_label, **extra):
+        # The hash covers the sample plus the file size, not bytes never read
+        self._sha.update(str(self.size).encode())
+        return dict({
+            'kind': kind,
+            'size': self.size,
+            'bytes_read': self.bytes_read,
+            'truncated': self.truncated,
+            'hash': self._sha.hexdigest(),
+            'text': self.text(),
+            'preview': preview,
+            'records': records,
+            'approx_records': self.extrapolate(records),
+            'record_label': record_label,
+        }, **extra)
+
+
+def _size(f):
+    pos = f.tell()
+    f.seek(0, os.SEEK_END)
+    size = f.tell()
+    f.seek(pos)
+    return size
+
+
+def text_sample(f, budget=SAMPLE_BYTES):
+    """Head of a text file; only the first budget bytes are read and decoded"""
+    s = _Sampler(f, budget)
+    lines = sum(chunk.count("\n") for chunk in s.chunks())
+    text = s.text()
+    if text and not text.endswith("\n") and not s.truncated:
+        lines += 1
+    return s.result('text', text[:PREVIEW_CHARS], lines, "lines")
+
+
+def _number(value):
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def csv_sample(f, budget=SAMPLE_BYTES):
+    """Header, first rows and per-column statistics over the first budget bytes of a CSV"""
+    s = _Sampler(f, budget)
+    lines = s.lines()
+    head = next(lines, "")
+    try:
+        dialect = csv.Sniffer().sniff(head, delimiters=",;\t|")
+    except csv.Error:
+        dialect = csv.excel
+
+    def complete_lines():
+        yield head
+        for line in lines:
+            # A row cut off by the byte budget would skew the statistics
+            if line.endswith("\n") or not s.truncated:
+                yield line
+
+    reader = csv.reader(complete_lines(), dialect)
+    header = next(reader, [])
+    columns = [{'column': name, 'filled': 0, 'empty': 0, 'numeric': 0, 'min': None, 'max': None, '_sum': 0.0}
+               for name in header]
+    rows = []
+    count = 0
+    for row in reader:
+        count += 1
+        if len(rows) < PREVIEW_ROWS:
+            rows.append(dict(zip(header, row)))
+        for col, value in zip(columns, row):
+            if not value.strip():
+                col['empty'] += 1
+                continue
+            col['filled'] += 1
+            x = _number(value)
+            if x is None:
+                continue
+            col['numeric'] += 1
+            col['_sum'] += x
+            col['min'] = x if col['min'] is None else min(col['min'], x)
+            col['max'] = x if col['max'] is None else max(col['max'], x)
+    stats = []
+    for col in columns:
+        numeric = col['numeric'] and col['numeric'] == col['filled']
+        stats.append({
+            'column': col['column'],
+            'type': 'numeric' if numeric else 'text',
+            'filled': col['filled'],
+            'empty': col['empty'],
+            'min': col['min'] if numeric else None,
+            'max': col['max'] if numeric else None,
+            'mean': round(col['_sum'] / col['numeric'], 6) if numeric else None,
+        })
+    return s.result('csv', rows, count, "rows", header=header, columns=stats)
+
+
+def _skip(text, pos, chars=" \t\r\n"):
+    while pos < len(text) and text[pos] in chars:
+        pos += 1
+    return pos
+
+
+def json_sample(f, budget=SAMPLE_BYTES):
+    """
+    Records from the first budget bytes of a JSON array, JSON-lines file or
+    object, decoded one value at a time so a truncated tail is simply dropped.
+    """
+    s = _Sampler(f, budget)
+    text = "".join(s.chunks())
+    decoder = json.JSONDecoder()
+    pos = _skip(text, 0)
+    records, keys, count = [], {}, 0
+    layout = 'array' if text[pos:pos + 1] == "[" else 'object' if text[pos:pos + 1] == "{" else 'value'
+    if layout == 'array':
+        pos += 1
+    elif layout == 'object':
+        # A second top-level value after the first object means JSON lines
+        try:
+            _, end = decoder.raw_decode(text, pos)
+            end = _skip(text, end)
+            if text[end:end + 1] == "{":
+                layout = 'lines'
+        except ValueError:
+            pass
+        if layout == 'object':
+            pos += 1
+    while pos < len(text):
+        pos = _skip(text, pos, " \t\r\n,")
+        if pos >= len(text) or text[pos] in "]}":
+            break
+        try:
+            if layout == 'object':
+                key, pos = decoder.raw_decode(text, pos)
+                pos = _skip(text, pos, " \t\r\n:")
+                value, pos = decoder.raw_decode(text, pos)
+                record = {key: value}
+            else:
+                record, pos = decoder.raw_decode(text, pos)
+        except ValueError:
+            break
+        count += 1
+        if len(records) < PREVIEW_RECORDS:
+            records.append(record)
+        if isinstance(record, dict):
+            for key in record:
+                if key in keys or len(keys) < MAX_KEYS:
+                    keys[key] = keys.get(key, 0) + 1
+    preview = json.dumps(records if layout != 'object' else {k: v for r in records for k, v in r.items()},
+                         indent=2, default=str)[:PREVIEW_CHARS]
+    label = "keys" if layout == 'object' else "records"
+    return s.result('json', preview, count, label, layout=layout, keys=keys)
+
+
+def read_sample(name, f, budget=SAMPLE_BYTES):
+    """Sample f with the reader for its file type"""
+    lower = name.lower()
+    if lower.endswith('.csv'):
+        return csv_sample(f, budget)
+    if lower.endswith('.json'):
+        return json_sample(f, budget)
+    return text_sample(f, budget)
+
+
+def _bytes(n):
+    if n >= 1e6:
+        return f"{n / 1e6:.1f} MB"
+    return f"{n / 1e3:.1f} KB" if n >= 1e3 else f"{n} bytes"
+
+
+def describe(sample):
+    """One-line summary, e.g. '~1,200,000 rows • 512.0 MB • first 1.0 MB sampled'"""
+    approx = "~" if sample['truncated'] else ""
+    parts = [f"{approx}{sample['approx_records']:,} {sample['record_label']}", _bytes(sample['size'])]
+    if sample['truncated']:
+        parts.append(f"first {_bytes(sample['bytes_read'])} sampled ({sample['records']:,} {sample['record_label']})")
+    return " • ".join(parts)
+
+
+def sample_document(name, sample):
+    """Document record for agents built from the sample, headed by what it covers"""
+    header = f"[{name}: {describe(sample)}]\n"
+    if sample['kind'] == 'csv' and sample['columns']:
+        header += "Column statistics over the sample:\n" + "\n".join(
+            f"- {c['column']}: {c['type']}, {c['filled']} filled, {c['empty']} empty"
+            + (f", min {c['min']:g}, max {c['max']:g}, mean {c['mean']:g}" if c['type'] == 'numeric' else "")
+            for c in sample['columns']
+        ) + "\n"
+    pages = split_text_pages(header + "\n" + sample['text'])
+    return {
+        'name': name,
+        'hash': sample['hash'],
+        'page_count': len(pages),
+        'pages': pages,
+        'sample': {k: v for k, v in sample.items() if k not in ('text', 'preview')},
+    }
@@ -0,0 +1,605 @@
+"""
+Provider clients and call wrappers for the FDA 510(k) Agentic Review System
+
+Clients live in a process-wide registry so they survive Streamlit reruns and
+are shared by every session: each (provider, API key hash) pair gets one
+client, validated once per TTL and dropped after it has been idle for a while.
+The Gemini SDK (genai) holds a single module-level API key, so Gemini calls
+on different keys take turns rather than overlap (see gemini_call).
+
+Provider SDKs are slow to import, so availability is probed from import
+metadata and each SDK is imported the first time its provider is used.
+"""
+
+import time
+import hashlib
+import threading
+import importlib
+import importlib.util
+from contextlib import contextmanager
+
+from ratelimit import LIMITS, classify_error
+from metrics import METRICS
+
+SDK_MODULES = {
+    "gemini": "google.generativeai",
+    "openai": "openai",
+    "grok": "xai_sdk",
+}
+
+
+def _installed(module):
+    """True if module can be imported, without importing it (parent packages excepted)"""
+    try:
+        return importlib.util.find_spec(module) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+GEMINI_AVAILABLE = _installed("google.generativeai")
+OPENAI_AVAILABLE = _installed("openai")
+GROK_AVAILABLE = _installed("xai_sdk")
+
+_sdk_lock = threading.Lock()
+_sdks = {}
+# Seconds spent importing each provider SDK, for the startup profile
+IMPORT_TIMES = {}
+
+
+def load_sdk(provider):
+    """Import a provider's SDK on first use; later calls return the cached module"""
+    module = _sdks.get(provider)
+    if module is not None:
+        return module
+    with _sdk_lock:
+        if provider not in _sdks:
+            start = time.perf_counter()
+            _sdks[provider] = importlib.import_module(SDK_MODULES[provider])
+            IMPORT_TIMES[provider] = time.perf_counter() - start
+        return _sdks[provider]
+
+# Registry tuning
+VALIDATE_TTL_S = 15 * 60      # re-check a good key after this long
+FAILED_VALIDATE_TTL_S = 60    # retry a rejected key after this long
+IDLE_EVICT_S = 30 * 60        # drop clients nobody has used for this long
+
+
+def key_fingerprint(api_key):
+    """Short, non-reversible identifier for an API key"""
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16]
+
+
+class ClientRegistry:
+    """Process-wide pool of provider clients keyed on provider + key hash"""
+
+    def __init__(self, validate_ttl=VALIDATE_TTL_S, failed_ttl=FAILED_VALIDATE_TTL_S, idle_ttl=IDLE_EVICT_S):
+        self.validate_ttl = validate_ttl
+        self.failed_ttl = failed_ttl
+        self.idle_ttl = idle_ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+        # genai keeps a single module-level API key, so calls on different keys can't overlap:
+        # calls on the configured key run concurrently, another key waits until they have finished
+        self._gemini_gate = threading.Condition()
+        self._gemini_configured = None
+        self._gemini_active = 0
+
+    def _build(self, provider, api_key, timeout=None):
+        if provider == "openai":
+            if not OPENAI_AVAILABLE:
+                raise RuntimeError("OpenAI not available")
+            # Retries are handled by the shared rate limiter
+            return load_sdk("openai").OpenAI(api_key=api_key, max_retries=0)
+        if provider == "grok":
+            if not GROK_AVAILABLE:
+                raise RuntimeError("Grok not available")
+            return load_sdk("grok").Client(api_key=api_key, timeout=timeout or 3600)
+        if provider == "gemini":
+            if not GEMINI_AVAILABLE:
+                raise RuntimeError("Gemini not available")
+            return load_sdk("gemini")
+        raise ValueError(f"Unsupported provider: {provider}")
+
+    def _entry(self, provider, api_key):
+        """Return the registry entry for this key, building the client if needed"""
+        now = time.time()
+        key = (provider, key_fingerprint(api_key))
+        with self._lock:
+            self._evict_idle_locked(now)
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = {
+                    'client': self._build(provider, api_key),
+                    'created': now,
+                    'last_used': now,
+                    'validated_at': None,
+                    'valid': None,
+                    'error': None,
+                    'calls': 0,
+                    # xAI clients with a shorter timeout, by timeout
+                    'timed': {},
+                }
+                self._entries[key] = entry
+            entry['last_used'] = now
+            return entry
+
+    def get(self, provider, api_key, timeout=None):
+        """
+        Pooled client for provider/api_key; Gemini calls go through gemini_call instead.
+
+        With a timeout, the client's calls give up after that many seconds.
+        """
+        entry = self._entry(provider, api_key)
+        entry['calls'] += 1
+        if timeout is None:
+            return entry['client']
+        if provider == "openai":
+            return entry['client'].with_options(timeout=timeout)
+        # xAI sets its timeout on the channel, so each timeout needs a client of its own
+        with self._lock:
+            client = entry['timed'].get(timeout)
+            if client is None:
+                client = entry['timed'][timeout] = self._build(provider, api_key, timeout)
+            return client
+
+    @contextmanager
+    def gemini_call(self, api_key, cancel=None):
+        """
+        genai configured with api_key for the duration of the block.
+
+        Hold it from building the model until the response has been fully
+        consumed: the key is read when requests are sent, including each
+        streamed chunk, so no other key may be configured in between. A
+        cancelled call (see CancelToken) gives the key up straight away.
+        """
+        client = self.get("gemini", api_key)
+        fp = key_fingerprint(api_key)
+        with self._gemini_gate:
+            self._gemini_gate.wait_for(lambda: self._gemini_active == 0 or self._gemini_configured == fp)
+            if self._gemini_configured != fp:
+                client.configure(api_key=api_key)
+                self._gemini_configured = fp
+            self._gemini_active += 1
+        held = [True]
+
+        def release():
+            with self._gemini_gate:
+                if held[0]:
+                    held[0] = False
+                    self._gemini_active -= 1
+                    self._gemini_gate.notify_all()
+
+        if cancel is not None:
+            cancel.on_cancel(release)
+        try:
+            yield client
+        finally:
+            release()
+
+    def validate(self, provider, api_key):
+        """Check the key against the provider at most once per TTL; returns (ok, error)"""
+        entry = self._entry(provider, api_key)
+        now = time.time()
+        if entry['validated_at'] is not None:
+            ttl = self.validate_ttl if entry['valid'] else self.failed_ttl
+            if now - entry['validated_at'] < ttl:
+                return entry['valid'], entry['error']
+        try:
+            if provider == "gemini":
+                with self.gemini_call(api_key) as client:
+                    next(iter(client.list_models()), None)
+            elif provider == "openai":
+                client = self.get(provider, api_key)
+                client.models.list()
+            # xAI clients are validated lazily on first call
+            entry['valid'], entry['error'] = True, None
+        except Exception as e:
+            entry['valid'], entry['error'] = False, str(e)
+        entry['validated_at'] = now
+        return entry['valid'], entry['error']
+
+    def _evict_idle_locked(self, now):
+        stale = [k for k, e in self._entries.items() if now - e['last_used'] > self.idle_ttl]
+        for k in stale:
+            entry = self._entries.pop(k)
+            # The Gemini "client" is the genai module itself
+            if k[0] == "gemini":
+                continue
+            for client in [entry['client'], *entry['timed'].values()]:
+                close = getattr(client, 'close', None)
+                if callable(close):
+                    try:
+                        close()
+                    except Exception:
+                        pass
+
+    def evict_idle(self):
+        with self._lock:
+            self._evict_idle_locked(time.time())
+
+    def stats(self):
+        """Snapshot of pooled clients (no key material)"""
+        now = time.time()
+        with self._lock:
+            return [
+                {
+                    'provider': provider,
+                    'key_hash': fp,
+                    'calls': e['calls'],
+                    'valid': e['valid'],
+                    'age_s': round(now - e['created'], 1),
+                    'idle_s': round(now - e['last_used'], 1),
+                }
+                for (provider, fp), e in self._entries.items()
+            ]
+
+
+CLIENTS = ClientRegistry()
+
+
+# Provider call wrappers with robust error handling
+def _gemini_request(client, model_name, system_prompt, user_prompt, params):
+    model = client.GenerativeModel(model_name)
+    full_prompt = f"System: {system_prompt}\n\nUser: {user_prompt}"
+    generation_config = {
+        "temperature": params.get("temperature", 0.2),
+        "top_p": params.get("top_p", 1.0),
+        "max_output_tokens": params.get("max_tokens", 1500),
+    }
+    return model, full_prompt, generation_config
+
+def call_gemini(gemini_api_key, model_name, system_prompt, user_prompt, params, timeout=None, cancel=None):
+    if not GEMINI_AVAILABLE:
+        raise RuntimeError("Gemini not available")
+    with CLIENTS.gemini_call(gemini_api_key, cancel) as client:
+        model, full_prompt, generation_config = _gemini_request(
+            client, model_name, system_prompt, user_prompt, params)
+        resp = model.generate_content(full_prompt, generation_config=generation_config,
+                                      request_options={"timeout": timeout} if timeout else None)
+        return resp.text
+
+def stream_gemini(gemini_api_key, model_name, system_prompt, user_prompt, params, usage=None,
+                  timeout=None, cancel=None):
+    """Yield Gemini text chunks as they arrive"""
+    if not GEMINI_AVAILABLE:
+        raise RuntimeError("Gemini not available")
+    # Held until the stream is exhausted, closed or cancelled (a lost hedge)
+    with CLIENTS.gemini_call(gemini_api_key, cancel) as client:
+        model, full_prompt, generation_config = _gemini_request(
+            client, model_name, system_prompt, user_prompt, params)
+        resp = model.generate_content(full_prompt, generation_config=generation_config, stream=True,
+                                      request_options={"timeout": timeout} if timeout else None)
+        for chunk in resp:
+            meta = getattr(chunk, "usage_metadata", None)
+            if usage is not None and meta is not None:
+                usage["input_tokens"] = getattr(meta, "prompt_token_count", None)
+                usage["output_tokens"] = getattr(meta, "candidates_token_count", None)
+            try:
+                text = chunk.text
+            except ValueError:
+                # Chunks without parts (e.g. the final finish-reason chunk)
+                text = ""
+            if text:
+                yield text
+
+def _openai_request(model, system_prompt, user_prompt, params):
+    return dict(
+        model=model,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ],
+        temperature=params.get("temperature", 0.2),
+        top_p=params.get("top_p", 1.0),
+        max_tokens=params.get("max_tokens", 1500),
+    )
+
+def call_openai_direct(openai_api_key, model, system_prompt, user_prompt, params, timeout=None):
+    if not OPENAI_AVAILABLE:
+        raise RuntimeError("OpenAI not available")
+    client = CLIENTS.get("openai", openai_api_key, timeout)
+    response = client.chat.completions.create(**_openai_request(model, system_prompt, user_prompt, params))
+    return response.choices[0].message.content
+
+def stream_openai_direct(openai_api_key, model, system_prompt, user_prompt, params, usage=None, timeout=None):
+    """Yield OpenAI text deltas as they arrive"""
+    if not OPENAI_AVAILABLE:
+        raise RuntimeError("OpenAI not available")
+    client = CLIENTS.get("openai", openai_api_key, timeout)
+    stream = client.chat.completions.create(
+        stream=True,
+        stream_options={"include_usage": True},
+        **_openai_request(model, system_prompt, user_prompt, params)
+    )
+    for chunk in stream:
+        if usage is not None and getattr(chunk, "usage", None):
+            usage["input_tokens"] = chunk.usage.prompt_tokens
+            usage["output_tokens"] = chunk.usage.completion_tokens
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+def call_openai_with_pmpt(openai_api_key, pmpt_id, user_prompt, override_model=None, params=None, timeout=None):
+    if not OPENAI_AVAILABLE:
+        raise RuntimeError("OpenAI not available")
+    # Fallback to direct call if prompt API not available
+    return call_openai_direct(
+        openai_api_key,
+        override_model or "gpt-4o-mini",
+        f"Use prompt ID: {pmpt_id}",
+        user_prompt,
+        params or {},
+        timeout=timeout
+    )
+
+def stream_openai_with_pmpt(openai_api_key, pmpt_id, user_prompt, override_model=None, params=None, usage=None,
+                            timeout=None):
+    if not OPENAI_AVAILABLE:
+        raise RuntimeError("OpenAI not available")
+    return stream_openai_direct(
+        openai_api_key,
+        override_model or "gpt-4o-mini",
+        f"Use prompt ID: {pmpt_id}",
+        user_prompt,
+        params or {},
+        usage=usage,
+        timeout=timeout
+    )
+
+def retrieve_openai_prompt(openai_api_key, pmpt_id):
+    """Retrieve prompt metadata - graceful fallback"""
+    return {
+        "id": pmpt_id,
+        "name": pmpt_id,
+        "description": "Prompt configuration",
+        "system_prompt": "",
+        "model": None,
+        "params": {}
+    }
+
+def _grok_chat(xai_api_key, model, system_prompt, user_prompt, image_url=None, timeout=None):
+    client = CLIENTS.get("grok", xai_api_key, timeout)
+    from xai_sdk.chat import user as xai_user, system as xai_system, image as xai_image
+    chat = client.chat.create(model=model)
+    chat.append(xai_system(system_prompt))
+    if image_url:
+        chat.append(xai_user(user_prompt, xai_image(image_url)))
+    else:
+        chat.append(xai_user(user_prompt))
+    return chat
+
+def call_grok(xai_api_key, model, system_prompt, user_prompt, params, image_url=None, timeout=None):
+    if not GROK_AVAILABLE:
+        raise RuntimeError("Grok not available")
+    chat = _grok_chat(xai_api_key, model, system_prompt, user_prompt, image_url, timeout)
+    response = chat.sample()
+    return response.content
+
+def stream_grok(xai_api_key, model, system_prompt, user_prompt, params, image_url=None, usage=None, timeout=None):
+    """Yield Grok text chunks as they arrive"""
+    if not GROK_AVAILABLE:
+        raise RuntimeError("Grok not available")
+    chat = _grok_chat(xai_api_key, model, system_prompt, user_prompt, image_url, timeout)
+    response = None
+    for response, chunk in chat.stream():
+        if chunk.content:
+            yield chunk.content
+    resp_usage = getattr(response, "usage", None)
+    if usage is not None and resp_usage is not None:
+        usage["input_tokens"] = getattr(resp_usage, "prompt_tokens", None)
+        usage["output_tokens"] = getattr(resp_usage, "completion_tokens", None)
+
+_PROVIDER_NAMES = {"gemini": ("Gemini", "Gemini"), "openai": ("OpenAI", "OpenAI"), "grok": ("xAI", "Grok")}
+
+def _check_config(provider, keys):
+    """Raise the errors no call could get past (unknown provider, missing key or SDK)"""
+    if provider not in _PROVIDER_NAMES:
+        raise ValueError(f"Unsupported provider: {provider}")
+    key_name, sdk_name = _PROVIDER_NAMES[provider]
+    if not keys.get(provider):
+        raise ValueError(f"Missing {key_name} API key")
+    available = {"gemini": GEMINI_AVAILABLE, "openai": OPENAI_AVAILABLE, "grok": GROK_AVAILABLE}
+    if not available[provider]:
+        raise RuntimeError(f"{sdk_name} not available")
+
+def _provider_call(provider, config, user_prompt, keys, stream=False, usage=None, timeout=None, cancel=None):
+    """Dispatch to the provider wrapper; returns text, or a chunk generator when stream=True"""
+    extra = {"usage": usage, "timeout": timeout} if stream else {"timeout": timeout}
+    if provider == "gemini":
+        if not keys.get("gemini"):
+            raise ValueError("Missing Gemini API key")
+        return (stream_gemini if stream else call_gemini)(
+            gemini_api_key=keys["gemini"],
+            model_name=config.get("model", "gemini-2.0-flash-exp"),
+            system_prompt=config.get("system_prompt", ""),
+            user_prompt=user_prompt,
+            params=config.get("params", {}),
+            cancel=cancel,
+            **extra
+        )
+    elif provider == "openai":
+        if not keys.get("openai"):
+            raise ValueError("Missing OpenAI API key")
+        pmpt_id = config.get("pmpt_id")
+        if pmpt_id:
+            return (stream_openai_with_pmpt if stream else call_openai_with_pmpt)(
+                openai_api_key=keys["openai"],
+                pmpt_id=pmpt_id,
+                user_prompt=user_prompt,
+                override_model=config.get("model"),
+                params=config.get("params", {}),
+                **extra
+            )
+        else:
+            return (stream_openai_direct if stream else call_openai_direct)(
+                openai_api_key=keys["openai"],
+                model=config.get("model", "gpt-4o-mini"),
+                system_prompt=config.get("system_prompt", ""),
+                user_prompt=user_prompt,
+                params=config.get("params", {}),
+                **extra
+            )
+    elif provider == "grok":
+        if not keys.get("grok"):
+            raise ValueError("Missing xAI API key")
+        return (stream_grok if stream else call_grok)(
+            xai_api_key=keys["grok"],
+            model=config.get("model", "grok-beta"),
+            system_prompt=config.get("system_prompt", "You are Grok."),
+            user_prompt=user_prompt,
+            params=config.get("params", {}),
+            image_url=config.get("image_url"),
+            **extra
+        )
+    else:
+        raise ValueError(f"Unsupported provider: {provider}")
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token) when the SDK reports no usage"""
+    return max(1, len(text) // 4) if text else 0
+
+def _record_stats(stats, start, first_chunk_at, end, text, usage):
+    tokens_out = usage.get("output_tokens")
+    estimated = tokens_out is None
+    if estimated:
+        tokens_out = estimate_tokens(text)
+    gen_window = end - (first_chunk_at or start)
+    stats.update({
+        'elapsed_s': round(end - start, 2),
+        'ttft_s': round(first_chunk_at - start, 3) if first_chunk_at else None,
+        'tokens_in': usage.get("input_tokens"),
+        'tokens_out': tokens_out,
+        'tokens_estimated': estimated,
+        'tokens_per_s': round(tokens_out / gen_window, 1) if gen_window > 0 else None,
+    })
+
+class CallCancelled(Exception):
+    """Raised from on_chunk to abandon a streamed call, e.g. the loser of a hedged pair"""
+
+
+class CancelToken:
+    """
+    Lets another thread abandon a call, e.g. the loser of a hedged pair.
+
+    cancel() runs the release callbacks the call registered, so its
+    concurrency slot and Gemini key are freed even while the request is
+    still blocked waiting for the provider; the request itself ends at its
+    timeout or next chunk.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self.cancelled = False
+
+    def on_cancel(self, fn):
+        """Run fn() when the call is cancelled (at once if it already has been)"""
+        with self._lock:
+            if not self.cancelled:
+                self._callbacks.append(fn)
+                return
+        fn()
+
+    def cancel(self):
+        with self._lock:
+            if self.cancelled:
+                return
+            self.cancelled = True
+            callbacks, self._callbacks = self._callbacks, []
+        for fn in callbacks:
+            try:
+                fn()
+            except Exception:
+                pass
+
+
+def run_provider(provider, config, user_prompt, keys, on_chunk=None, stats=None, cancel=None, timeout=None):
+    """
+    Unified provider execution with error handling.
+
+    Calls go through the per-provider/model rate limiter, which retries 429s
+    and transient errors with backoff. With on_chunk set, the response is
+    streamed and on_chunk(text) is called for every chunk (a streamed call
+    is only retried before its first chunk); the full text is still
+    returned. If a stats dict is passed it is filled with elapsed_s, ttft_s,
+    tokens_in/out, tokens_per_s, throttle_wait_s and retries.
+
+    timeout caps each request in seconds (default: the client's own), and a
+    CancelToken lets another thread abandon the call; it then raises
+    CallCancelled. Configuration errors (unknown provider, missing key or
+    SDK) are raised before the call starts, and only provider errors count
+    as failed calls in METRICS.
+    """
+    _check_config(provider, keys)
+    usage = {}
+    limit_stats = {}
+    start = time.time()
+    first_chunk_at = None
+
+    def cancelled():
+        return cancel is not None and cancel.cancelled
+
+    def attempt():
+        try:
+            return request()
+        except CallCancelled:
+            raise
+        except Exception as e:
+            # Whatever a cancelled request died of, it was not the provider's doing
+            if cancelled():
+                raise CallCancelled(f"{provider} call was cancelled") from e
+            raise
+
+    def request():
+        nonlocal first_chunk_at
+        if cancelled():
+            raise CallCancelled(f"{provider} call was cancelled")
+        usage.clear()
+        if on_chunk is None:
+            text = _provider_call(provider, config, user_prompt, keys, timeout=timeout, cancel=cancel)
+        else:
+            parts = []
+            stream = _provider_call(provider, config, user_prompt, keys, stream=True, usage=usage,
+                                    timeout=timeout, cancel=cancel)
+            try:
+                for chunk in stream:
+                    if first_chunk_at is None:
+                        first_chunk_at = time.time()
+                    parts.append(chunk)
+                    on_chunk(chunk)
+            finally:
+                # Releases the provider's resources (e.g. the Gemini key) at once when on_chunk cancels
+                close = getattr(stream, 'close', None)
+                if callable(close):
+                    close()
+            text = "".join(parts)
+        if usage.get("output_tokens") is not None:
+            limit_stats["actual_tokens"] = (usage.get("input_tokens") or 0) + usage["output_tokens"]
+        return text
+
+    est_tokens = (estimate_tokens(config.get("system_prompt", "")) + estimate_tokens(user_prompt)
+                  + config.get("params", {}).get("max_tokens", 1500))
+    try:
+        text = LIMITS.call(provider, config.get("model"), attempt, est_tokens, limit_stats,
+                           retryable=lambda: first_chunk_at is None and not cancelled(),
+                           on_slot=cancel.on_cancel if cancel is not None else None)
+    except CallCancelled:
+        # A hedged call that lost the race; not a provider failure
+        if stats is not None:
+            stats.update(limit_stats)
+        raise
+    except Exception as e:
+        # Throttling, 5xx, timeouts and dropped connections; a rejected request is the caller's problem
+        if classify_error(e) is not None:
+            METRICS.record_call(provider, config.get("model"), time.time() - start, ok=False)
+        if stats is not None:
+            stats.update(limit_stats)
+        raise RuntimeError(f"{provider} execution failed: {str(e)}") from e
+    call_stats = {}
+    _record_stats(call_stats, start, first_chunk_at, time.time(), text or "", usage)
+    METRICS.record_call(provider, config.get("model"), call_stats['elapsed_s'], ok=True,
+                        tokens_in=call_stats['tokens_in'], tokens_out=call_stats['tokens_out'],
+                        ttft_s=call_stats['ttft_s'])
+    if stats is not None:
+        stats.update(call_stats)
+        stats.update(limit_stats)
+    return text
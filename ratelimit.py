@@ -0,0 +1,319 @@
+"""
+Per-provider rate limiting, adaptive concurrency and retry with backoff
+
+Each (provider, model) pair gets a requests/min bucket, a tokens/min bucket
+and an AIMD concurrency limit that halves on 429s and creeps back up as
+calls succeed. Throttled and transient failures are retried with jittered
+exponential backoff, bounded per provider by a retry budget so an outage
+doesn't multiply load.
+"""
+
+import os
+import json
+import time
+import random
+import threading
+
+# Defaults per provider; override with configure() or RATE_LIMITS='{"openai": {"rpm": 60}}'
+DEFAULT_LIMITS = {
+    "openai": {"rpm": 500, "tpm": 200000},
+    "gemini": {"rpm": 300, "tpm": 1000000},
+    "grok": {"rpm": 240, "tpm": 200000},
+}
+FALLBACK_LIMITS = {"rpm": 60, "tpm": 100000}
+INITIAL_CONCURRENCY = 4
+MAX_CONCURRENCY = 16
+MAX_RETRIES = 4
+BACKOFF_BASE_S = 1.0
+BACKOFF_CAP_S = 30.0
+RETRY_BUDGET_MIN = 10.0     # retries always available
+RETRY_BUDGET_RATIO = 0.2    # retry tokens earned per successful call
+
+THROTTLED = "throttled"
+TRANSIENT = "transient"
+
+_TRANSIENT_NAMES = ("APIConnectionError", "APITimeoutError", "Timeout", "ConnectionError",
+                    "ServiceUnavailable", "InternalServerError", "DeadlineExceeded")
+_GRPC_STATUS = {"RESOURCE_EXHAUSTED": 429, "UNAVAILABLE": 503, "DEADLINE_EXCEEDED": 504, "INTERNAL": 500}
+
+
+def classify_error(exc):
+    """THROTTLED for 429s, TRANSIENT for 5xx/timeouts/connection errors, else None"""
+    status = getattr(exc, "status_code", None)              # openai
+    code = getattr(exc, "code", None)
+    if status is None and isinstance(code, int):            # google.api_core
+        status = code
+    if status is None and callable(code):                   # grpc (xai_sdk)
+        try:
+            status = _GRPC_STATUS.get(code().name)
+        except Exception:
+            status = None
+    if status == 429:
+        return THROTTLED
+    if isinstance(status, int) and (status >= 500 or status == 408):
+        return TRANSIENT
+    if type(exc).__name__ in _TRANSIENT_NAMES or isinstance(exc, (TimeoutError, ConnectionError)):
+        return TRANSIENT
+    text = str(exc).lower()
+    if "429" in text or "rate limit" in text or "resource_exhausted" in text or "resource exhausted" in text:
+        return THROTTLED
+    return None
+
+
+def retry_after(exc):
+    """Server-suggested delay in seconds, if the error carries one"""
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, suggested=None):
+    """Full-jitter exponential backoff, never shorter than a server's Retry-After"""
+    delay = random.uniform(0, min(BACKOFF_CAP_S, BACKOFF_BASE_S * (2 ** attempt)))
+    return max(delay, suggested or 0.0)
+
+
+class TokenBucket:
+    """Refills at per_minute/60 per second; reservations may go negative and return the wait"""
+
+    def __init__(self, per_minute):
+        self._lock = threading.Lock()
+        self.set_rate(per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def set_rate(self, per_minute):
+        self.per_minute = max(1, per_minute)
+        self.rate = self.per_minute / 60.0
+        self.capacity = float(self.per_minute)
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount):
+        """Take amount now; returns seconds to wait before using it"""
+        with self._lock:
+            self._refill()
+            self.tokens -= min(amount, self.capacity)
+            return max(0.0, -self.tokens / self.rate)
+
+    def adjust(self, delta):
+        """Charge (positive) or refund (negative) the difference once actual usage is known"""
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens - delta)
+
+
+class AdaptiveConcurrency:
+    """AIMD limit on in-flight calls: halve on throttling, +1/limit per success"""
+
+    def __init__(self, initial=INITIAL_CONCURRENCY, maximum=MAX_CONCURRENCY):
+        self.limit = float(initial)
+        self.maximum = maximum
+        self.inflight = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self.inflight >= max(1, int(self.limit)):
+                self._cond.wait()
+            self.inflight += 1
+
+    def release(self, outcome):
+        with self._cond:
+            self.inflight -= 1
+            if outcome == THROTTLED:
+                self.limit = max(1.0, self.limit / 2)
+            elif outcome == "ok":
+                self.limit = min(float(self.maximum), self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+
+
+class _Slot:
+    """One acquired concurrency slot, released exactly once"""
+
+    def __init__(self, concurrency):
+        self._concurrency = concurrency
+        self._lock = threading.Lock()
+        self._held = True
+
+    def release(self, outcome):
+        with self._lock:
+            if not self._held:
+                return
+            self._held = False
+        self._concurrency.release(outcome)
+
+
+class RetryBudget:
+    """Caps retries at a fraction of successful calls plus a small floor"""
+
+    def __init__(self, floor=RETRY_BUDGET_MIN, ratio=RETRY_BUDGET_RATIO):
+        self.floor = floor
+        self.ratio = ratio
+        self.tokens = floor
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self.tokens = min(self.floor * 10, self.tokens + self.ratio)
+
+    def try_spend(self):
+        with self._lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class ModelLimiter:
+    def __init__(self, rpm, tpm):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.concurrency = AdaptiveConcurrency()
+        self.calls = 0
+        self.throttled = 0
+        self.retries = 0
+        self.wait_s = 0.0
+
+
+class RateLimiter:
+    """Registry of per-(provider, model) limiters and per-provider retry budgets"""
+
+    def __init__(self, limits=None):
+        self._lock = threading.Lock()
+        self._settings = {p: dict(v) for p, v in (limits or DEFAULT_LIMITS).items()}
+        self._limiters = {}
+        self._budgets = {}
+
+    def settings(self, provider, model=None):
+        with self._lock:
+            return dict(self._settings.get((provider, model))
+                        or self._settings.get(provider)
+                        or FALLBACK_LIMITS)
+
+    def configure(self, provider, model=None, rpm=None, tpm=None):
+        """Set requests/min and tokens/min for a provider (or one of its models)"""
+        key = (provider, model) if model else provider
+        with self._lock:
+            current = dict(self._settings.get(key) or self._settings.get(provider) or FALLBACK_LIMITS)
+            if rpm:
+                current["rpm"] = int(rpm)
+            if tpm:
+                current["tpm"] = int(tpm)
+            self._settings[key] = current
+            for (p, m), lim in self._limiters.items():
+                if p == provider and (model is None or m == model):
+                    lim.requests.set_rate(current["rpm"])
+                    lim.tokens.set_rate(current["tpm"])
+
+    def limiter(self, provider, model):
+        with self._lock:
+            lim = self._limiters.get((provider, model))
+            if lim is not None:
+                return lim
+        s = self.settings(provider, model)
+        with self._lock:
+            return self._limiters.setdefault((provider, model), ModelLimiter(s["rpm"], s["tpm"]))
+
+    def budget(self, provider):
+        with self._lock:
+            return self._budgets.setdefault(provider, RetryBudget())
+
+    def call(self, provider, model, fn, est_tokens, stats=None, retryable=None, max_retries=MAX_RETRIES,
+             on_slot=None):
+        """
+        Run fn() under the provider/model limits, retrying throttled and transient failures.
+
+        fn may put the real token usage in stats['actual_tokens'] so the
+        tokens/min bucket is corrected; retryable() lets the caller veto a
+        retry (e.g. once streamed output has been shown). on_slot(free) is
+        handed a function that gives the concurrency slot back early, for a
+        caller that abandons fn() while it is still blocked. stats receives
+        throttle_wait_s, retries, retry_wait_s and throttled.
+        """
+        lim = self.limiter(provider, model)
+        budget = self.budget(provider)
+        stats = stats if stats is not None else {}
+        throttle_wait = retry_wait = 0.0
+        attempt = throttled = 0
+        try:
+            while True:
+                wait = max(lim.requests.reserve(1), lim.tokens.reserve(est_tokens))
+                t0 = time.monotonic()
+                if wait:
+                    time.sleep(wait)
+                lim.concurrency.acquire()
+                throttle_wait += time.monotonic() - t0
+                slot = _Slot(lim.concurrency)
+                if on_slot is not None:
+                    # An abandoned call says nothing about the provider's capacity
+                    on_slot(lambda: slot.release(None))
+                try:
+                    result = fn()
+                except Exception as e:
+                    kind = classify_error(e)
+                    slot.release(kind)
+                    throttled += kind == THROTTLED
+                    if (kind and attempt < max_retries and (retryable is None or retryable())
+                            and budget.try_spend()):
+                        delay = backoff_delay(attempt, retry_after(e))
+                        time.sleep(delay)
+                        retry_wait += delay
+                        attempt += 1
+                        continue
+                    raise
+                slot.release("ok")
+                budget.deposit()
+                actual = stats.pop("actual_tokens", None)
+                if actual:
+                    lim.tokens.adjust(actual - est_tokens)
+                return result
+        finally:
+            with self._lock:
+                lim.calls += 1
+                lim.throttled += throttled
+                lim.retries += attempt
+                lim.wait_s += throttle_wait + retry_wait
+            stats.update({
+                "throttle_wait_s": round(throttle_wait, 3),
+                "retry_wait_s": round(retry_wait, 3),
+                "retries": attempt,
+                "throttled": throttled,
+            })
+
+    def snapshot(self):
+        """Per-(provider, model) limiter state for display"""
+        with self._lock:
+            return [
+                {
+                    "provider": p,
+                    "model": m,
+                    "rpm": lim.requests.per_minute,
+                    "tpm": lim.tokens.per_minute,
+                    "concurrency": round(lim.concurrency.limit, 2),
+                    "inflight": lim.concurrency.inflight,
+                    "calls": lim.calls,
+                    "throttled": lim.throttled,
+                    "retries": lim.retries,
+                    "wait_s": round(lim.wait_s, 2),
+                }
+                for (p, m), lim in self._limiters.items()
+            ]
+
+
+def _env_limits():
+    limits = {p: dict(v) for p, v in DEFAULT_LIMITS.items()}
+    try:
+        for provider, values in json.loads(os.getenv("RATE_LIMITS", "{}")).items():
+            limits.setdefault(provider, dict(FALLBACK_LIMITS)).update(values)
+    except ValueError:
+        pass
+    return limits
+
+
+LIMITS = RateLimiter(_env_limits())
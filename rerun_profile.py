@@ -0,0 +1,320 @@
+"""
+Per-rerun profiling of app.py: wall time and tracemalloc memory per section
+
+With RERUN_PROFILE=1 every script rerun is split into sections: the app
+marks where each top-level block starts (page config and CSS, sidebar, each
+tab, ...) and wraps smaller blocks such as provider initialization. Each
+section records its wall time, the memory it left allocated and its peak;
+the rerun also records the source lines whose allocations grew the most
+since the session's previous rerun. Each session keeps a bounded history,
+shown in a debug panel and exported as JSON summarized per section, which
+diffs between releases:
+
+    python rerun_profile.py diff before.json after.json
+
+tracemalloc slows the whole process down while tracing, so this is opt-in.
+Traced memory is process-wide, so figures are approximate while other
+sessions rerun or jobs run at the same time. Provider calls run on job
+workers, outside any rerun, and are kept in one process-wide list.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+import threading
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager, nullcontext
+
+ENABLED = os.getenv("RERUN_PROFILE") == "1"
+MAX_RERUNS = int(os.getenv("RERUN_PROFILE_HISTORY", 50))
+MAX_CALLS = 200
+TOP_GROWTH = 10
+# Allocation sites kept per rerun for the growth comparison
+TRACKED_LINES = 500
+TRACE_FRAMES = 1
+EXPORT_VERSION = 1
+
+_IGNORED_FILES = (tracemalloc.__file__, "<frozen importlib._bootstrap>", "<frozen importlib._bootstrap_external>",
+                  "<unknown>")
+
+PROVIDER_CALLS = deque(maxlen=MAX_CALLS)
+_calls_lock = threading.Lock()
+
+
+def _kb(n):
+    return round(n / 1024, 1)
+
+
+class RerunProfiler:
+    """One session's rerun history; begin() and end() bracket each script run"""
+
+    def __init__(self, max_reruns=MAX_RERUNS):
+        self.history = deque(maxlen=max_reruns)
+        self.reruns = 0
+        self._current = None
+        self._stack = []
+        self._phase = None
+        self._lines = {}
+
+    def begin(self, script_start=None):
+        """Start a rerun; one left unfinished by st.rerun() or st.stop() is dropped"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACE_FRAMES)
+        self.reruns += 1
+        self._stack, self._phase = [], None
+        now = time.perf_counter()
+        self._current = {
+            'rerun': self.reruns,
+            'ts': time.time(),
+            'start': script_start or now,
+            'traced_start': tracemalloc.get_traced_memory()[0],
+            'sections': [],
+        }
+
+    def _open(self, name):
+        current, peak = tracemalloc.get_traced_memory()
+        if self._stack:
+            # Resetting the peak below would hide the enclosing section's own peak so far
+            outer = self._stack[-1]
+            outer['peak_seen'] = max(outer['peak_seen'], peak)
+        tracemalloc.reset_peak()
+        # Recorded when opened so nested sections follow their phase
+        record = {'section': name, 'depth': len(self._stack)}
+        self._current['sections'].append(record)
+        frame = {'record': record, 'started': time.perf_counter(), 'traced': current, 'peak_seen': current}
+        self._stack.append(frame)
+        return frame
+
+    def _close(self, frame):
+        current, peak = tracemalloc.get_traced_memory()
+        peak = max(peak, frame['peak_seen'])
+        self._stack.remove(frame)
+        if self._stack:
+            outer = self._stack[-1]
+            outer['peak_seen'] = max(outer['peak_seen'], peak)
+        frame['record'].update(
+            ms=round((time.perf_counter() - frame['started']) * 1000, 2),
+            alloc_kb=_kb(current - frame['traced']),
+            peak_kb=_kb(peak - frame['traced']),
+        )
+
+    def phase(self, name):
+        """End the current top-level section and start the next one"""
+        if self._current is None:
+            return
+        if self._phase is not None:
+            self._close(self._phase)
+        self._phase = self._open(name)
+
+    def section(self, name):
+        """Context manager timing a block nested inside the current phase"""
+        if self._current is None:
+            return nullcontext()
+        return self._section(name)
+
+    @contextmanager
+    def _section(self, name):
+        frame = self._open(name)
+        try:
+            yield
+        finally:
+            if self._current is not None and frame in self._stack:
+                self._close(frame)
+
+    def end(self):
+        """Finish the rerun and add it to the history; returns its record"""
+        if self._current is None:
+            return None
+        while self._stack:
+            self._close(self._stack[-1])
+        self._phase = None
+        run, self._current = self._current, None
+        traced, _ = tracemalloc.get_traced_memory()
+        run['total_ms'] = round((time.perf_counter() - run.pop('start')) * 1000, 2)
+        run['traced_kb'] = _kb(traced)
+        run['alloc_kb'] = _kb(traced - run.pop('traced_start'))
+        run['top_growth'] = self._growth()
+        self.history.append(run)
+        return run
+
+    def _growth(self):
+        """Allocation sites that grew most since this session's previous rerun"""
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, name) for name in _IGNORED_FILES])
+        lines = {}
+        for stat in snapshot.statistics('lineno')[:TRACKED_LINES]:
+            frame = stat.traceback[0]
+            lines[f"{os.path.basename(frame.filename)}:{frame.lineno}"] = (stat.size, stat.count)
+        previous, self._lines = self._lines, lines
+        if not previous:
+            return []
+        growth = [
+            {'where': where, 'size_kb': _kb(size), 'growth_kb': _kb(size - previous.get(where, (0, 0))[0]),
+             'blocks': count}
+            for where, (size, count) in lines.items()
+        ]
+        growth.sort(key=lambda g: g['growth_kb'], reverse=True)
+        return [g for g in growth[:TOP_GROWTH] if g['growth_kb'] > 0]
+
+    def summary(self):
+        """Per-section timing and memory over the history, in first-seen order"""
+        rows = {}
+        for run in self.history:
+            for s in run['sections']:
+                rows.setdefault(s['section'], []).append(s)
+        return [_summarize(name, samples) for name, samples in rows.items()]
+
+    def export(self):
+        """JSON-ready profile: environment, per-section summary and the raw reruns"""
+        return {
+            'version': EXPORT_VERSION,
+            'release': _release(),
+            'python': platform.python_version(),
+            'generated': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'reruns': len(self.history),
+            'total_ms_median': _median([r['total_ms'] for r in self.history]),
+            'sections': {row['section']: {k: v for k, v in row.items() if k != 'section'} for row in self.summary()},
+            'provider_calls': provider_call_summary(),
+            'history': list(self.history),
+        }
+
+
+def _median(values):
+    return round(statistics.median(values), 2) if values else None
+
+
+def _p95(values):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(0.95 * (len(values) - 1))))] if values else None
+
+
+def _summarize(name, samples):
+    ms = [s['ms'] for s in samples]
+    return {
+        'section': name,
+        'depth': samples[0]['depth'],
+        'runs': len(samples),
+        'ms_median': _median(ms),
+        'ms_p95': _p95(ms),
+        'alloc_kb_median': _median([s['alloc_kb'] for s in samples]),
+        'peak_kb_max': max(s['peak_kb'] for s in samples),
+    }
+
+
+def _release():
+    """APP_RELEASE, else the git revision of the working tree, else None"""
+    if os.getenv("APP_RELEASE"):
+        return os.getenv("APP_RELEASE")
+    try:
+        proc = subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5)
+        return proc.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+# Never begun, so its phases and sections are no-ops
+_INERT = RerunProfiler(max_reruns=0)
+
+
+def start_rerun(state, script_start=None, key='rerun_profiler'):
+    """The session's profiler with a rerun begun, or an inert one unless profiling is enabled"""
+    if not ENABLED:
+        return _INERT
+    if key not in state:
+        state[key] = RerunProfiler()
+    state[key].begin(script_start)
+    return state[key]
+
+
+@contextmanager
+def provider_call(label):
+    """Time a provider call on a job worker; a no-op unless profiling is enabled"""
+    if not ENABLED or not tracemalloc.is_tracing():
+        yield
+        return
+    started = time.perf_counter()
+    traced = tracemalloc.get_traced_memory()[0]
+    ok = False
+    try:
+        yield
+        ok = True
+    finally:
+        with _calls_lock:
+            PROVIDER_CALLS.append({
+                'call': label,
+                'ts': time.time(),
+                'ms': round((time.perf_counter() - started) * 1000, 1),
+                'alloc_kb': _kb(tracemalloc.get_traced_memory()[0] - traced),
+                'ok': ok,
+            })
+
+
+def provider_call_summary():
+    with _calls_lock:
+        calls = list(PROVIDER_CALLS)
+    rows = {}
+    for c in calls:
+        rows.setdefault(c['call'], []).append(c)
+    return {
+        label: {'calls': len(cs), 'ms_median': _median([c['ms'] for c in cs]),
+                'ms_p95': _p95([c['ms'] for c in cs]), 'errors': sum(1 for c in cs if not c['ok'])}
+        for label, cs in rows.items()
+    }
+
+
+def diff_exports(before, after):
+    """Per-section rows comparing two exports' median time and memory"""
+    rows = []
+    names = list(before['sections']) + [n for n in after['sections'] if n not in before['sections']]
+    for name in names:
+        b, a = before['sections'].get(name), after['sections'].get(name)
+        row = {'section': name}
+        for field in ('ms_median', 'ms_p95', 'alloc_kb_median', 'peak_kb_max'):
+            old, new = (b or {}).get(field), (a or {}).get(field)
+            row[field] = (old, new)
+        old, new = row['ms_median']
+        row['change'] = ("added" if b is None else "removed" if a is None
+                         else f"{(new - old) / old:+.0%}" if old else "—")
+        rows.append(row)
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare rerun profiles exported from the app's debug panel.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    d = sub.add_parser('diff', help="per-section changes between two exported profiles")
+    d.add_argument('before')
+    d.add_argument('after')
+    d.add_argument('--json', action='store_true')
+    args = parser.parse_args(argv)
+
+    with open(args.before, 'r', encoding='utf-8') as f:
+        before = json.load(f)
+    with open(args.after, 'r', encoding='utf-8') as f:
+        after = json.load(f)
+    rows = diff_exports(before, after)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return 0
+
+    def fmt(pair):
+        return " → ".join("—" if v is None else f"{v:g}" for v in pair)
+
+    print(f"{before.get('release') or 'before'} → {after.get('release') or 'after'} • median rerun "
+          f"{fmt((before.get('total_ms_median'), after.get('total_ms_median')))} ms\n")
+    print("| section | median ms | p95 ms | alloc KB (median) | peak KB (max) | change |\n|---|---|---|---|---|---|")
+    for r in rows:
+        print(f"| {r['section']} | {fmt(r['ms_median'])} | {fmt(r['ms_p95'])} | {fmt(r['alloc_kb_median'])} | "
+              f"{fmt(r['peak_kb_max'])} | {r['change']} |")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,158 @@
+"""
+Process-wide cache of parsed resources shared by every session
+
+Parsed documents, page text, retrieval indexes, the agent library and the
+checklist are cached once per server process, keyed by content hash (or by
+path with the file's mtime as the entry version). Entries are evicted
+least-recently-used first once their approximate total size exceeds the
+memory cap. Concurrent requests for the same missing entry wait for a single
+build, so ten sessions opening one submission parse it once.
+"""
+
+import os
+import sys
+import time
+import threading
+from collections import OrderedDict
+
+RESOURCE_CACHE_MAX_BYTES = int(os.getenv("RESOURCE_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+
+
+def approx_size(obj, _seen=None):
+    """Rough deep size in bytes of containers, strings and plain objects"""
+    seen = _seen if _seen is not None else set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (str, bytes, bytearray, int, float, bool)) or obj is None:
+        return size
+    if isinstance(obj, dict):
+        return size + sum(approx_size(k, seen) + approx_size(v, seen) for k, v in obj.items())
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return size + sum(approx_size(v, seen) for v in obj)
+    if hasattr(obj, '__dict__'):
+        return size + approx_size(vars(obj), seen)
+    return size
+
+
+class ResourceCache:
+    """LRU of (kind, key) -> value bounded by approximate bytes, with per-entry hit counts"""
+
+    def __init__(self, max_bytes=RESOURCE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._building = {}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, full_key):
+        with self._lock:
+            return full_key in self._entries
+
+    def get(self, kind, key, version=None):
+        """Cached value, or None when missing or built for another version"""
+        with self._lock:
+            entry = self._entries.get((kind, key))
+            if entry is None or entry['version'] != version:
+                self.misses += 1
+                return None
+            return self._hit_locked(entry)
+
+    def _hit_locked(self, entry):
+        self._entries.move_to_end((entry['kind'], entry['key']))
+        entry['hits'] += 1
+        entry['last_used'] = time.time()
+        self.hits += 1
+        return entry['value']
+
+    def put(self, kind, key, value, version=None, size=None, build_s=0.0, label=None):
+        """Store value; one larger than the whole cap is not kept"""
+        size = approx_size(value) if size is None else size
+        with self._lock:
+            old = self._entries.pop((kind, key), None)
+            if old is not None:
+                self._bytes -= old['bytes']
+            if size > self.max_bytes:
+                return value
+            now = time.time()
+            self._entries[(kind, key)] = {
+                'kind': kind, 'key': key, 'label': label or str(key), 'version': version, 'value': value,
+                'bytes': size, 'hits': 0, 'build_s': build_s, 'created': now, 'last_used': now,
+            }
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted['bytes']
+                self.evictions += 1
+        return value
+
+    def get_or_build(self, kind, key, build, version=None, size=None, label=None):
+        """Cached value, else build() it once even if several sessions ask at the same time"""
+        while True:
+            with self._lock:
+                entry = self._entries.get((kind, key))
+                if entry is not None and entry['version'] == version:
+                    return self._hit_locked(entry)
+                building = self._building.get((kind, key))
+                if building is None:
+                    self._building[(kind, key)] = threading.Event()
+                    self.misses += 1
+                    break
+            # Another session is building it; if that build fails we try ourselves
+            building.wait()
+        try:
+            started = time.perf_counter()
+            value = build()
+            return self.put(kind, key, value, version=version, size=size,
+                            build_s=time.perf_counter() - started, label=label)
+        finally:
+            with self._lock:
+                self._building.pop((kind, key)).set()
+
+    def discard(self, kind=None):
+        """Drop every entry, or only those of one kind"""
+        with self._lock:
+            for full in [k for k in self._entries if kind is None or k[0] == kind]:
+                self._bytes -= self._entries.pop(full)['bytes']
+
+    def entries(self, limit=50):
+        """Per-entry statistics, most recently used first"""
+        with self._lock:
+            recent = list(self._entries.values())[-limit:]
+        return [
+            {
+                'kind': e['kind'],
+                'entry': e['label'],
+                'size_mb': round(e['bytes'] / 1e6, 3),
+                'hits': e['hits'],
+                'build_s': round(e['build_s'], 3),
+                'saved_s': round(e['hits'] * e['build_s'], 2),
+                'last_used': e['last_used'],
+            }
+            for e in reversed(recent)
+        ]
+
+    def stats(self):
+        with self._lock:
+            by_kind = {}
+            for e in self._entries.values():
+                k = by_kind.setdefault(e['kind'], {'entries': 0, 'bytes': 0, 'hits': 0})
+                k['entries'] += 1
+                k['bytes'] += e['bytes']
+                k['hits'] += e['hits']
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'by_kind': by_kind,
+            }
+
+
+RESOURCES = ResourceCache()
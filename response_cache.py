@@ -0,0 +1,187 @@
+"""
+Content-addressed response cache in front of run_provider
+
+Entries are keyed on a SHA-256 of provider, model, system prompt, user prompt
+and sampling params, stored as one JSON file per key on local disk, and
+evicted least-recently-used first once the cache exceeds its byte budget or
+an entry is older than the max age.
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from routing import run_routed
+
+CACHE_DIR = os.getenv("RESPONSE_CACHE_DIR", ".cache/responses")
+CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+CACHE_MAX_AGE_S = int(os.getenv("RESPONSE_CACHE_MAX_AGE_S", 7 * 24 * 3600))
+
+# Cache modes for cached_run_provider
+CACHE_USE = "use"          # serve hits, store misses
+CACHE_REFRESH = "refresh"  # always call the provider, overwrite the entry
+CACHE_BYPASS = "bypass"    # never read or write the cache
+CACHE_MODES = (CACHE_USE, CACHE_REFRESH, CACHE_BYPASS)
+
+# Config fields that change the response
+KEY_FIELDS = ("model", "system_prompt", "params", "pmpt_id", "image_url")
+
+
+def cache_key(provider, config, user_prompt):
+    """Stable SHA-256 over everything that determines a response"""
+    material = {"provider": provider, "user_prompt": user_prompt}
+    for field in KEY_FIELDS:
+        material[field] = config.get(field)
+    blob = json.dumps(material, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Disk-backed LRU bounded by total bytes and entry age"""
+
+    def __init__(self, root=CACHE_DIR, max_bytes=CACHE_MAX_BYTES, max_age_s=CACHE_MAX_AGE_S):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.max_age_s = max_age_s
+        self._lock = threading.Lock()
+        self._index = None  # key -> (size, written_at), oldest use first
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _path(self, key):
+        return self.root / key[:2] / f"{key}.json"
+
+    def _load_index_locked(self):
+        if self._index is not None:
+            return
+        found = []
+        if self.root.exists():
+            for path in self.root.glob("*/*.json"):
+                try:
+                    st = path.stat()
+                except OSError:
+                    continue
+                found.append((st.st_mtime, path.stem, st.st_size))
+        found.sort()
+        self._index = OrderedDict((key, (size, mtime)) for mtime, key, size in found)
+        self._bytes = sum(size for size, _ in self._index.values())
+
+    def _drop_locked(self, key):
+        size, _ = self._index.pop(key)
+        self._bytes -= size
+        try:
+            self._path(key).unlink()
+        except OSError:
+            pass
+
+    def _evict_locked(self):
+        now = time.time()
+        expired = [k for k, (_, written) in self._index.items() if now - written > self.max_age_s]
+        for key in expired:
+            self._drop_locked(key)
+            self.evictions += 1
+        while self._bytes > self.max_bytes and self._index:
+            self._drop_locked(next(iter(self._index)))
+            self.evictions += 1
+
+    def get(self, key):
+        """Cached entry dict or None; counts a hit or miss"""
+        with self._lock:
+            self._load_index_locked()
+            meta = self._index.get(key)
+            if meta is None or time.time() - meta[1] > self.max_age_s:
+                if meta is not None:
+                    self._drop_locked(key)
+                self.misses += 1
+                return None
+            try:
+                with open(self._path(key), "r", encoding="utf-8") as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                self._drop_locked(key)
+                self.misses += 1
+                return None
+            self._index.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, output, meta=None):
+        entry = {"key": key, "output": output, "meta": meta or {}, "written_at": time.time()}
+        data = json.dumps(entry, ensure_ascii=False).encode("utf-8")
+        path = self._path(key)
+        with self._lock:
+            self._load_index_locked()
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(f".tmp{threading.get_ident()}")
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+            if key in self._index:
+                self._bytes -= self._index.pop(key)[0]
+            self._index[key] = (len(data), entry["written_at"])
+            self._bytes += len(data)
+            self._evict_locked()
+
+    def clear(self):
+        with self._lock:
+            self._load_index_locked()
+            for key in list(self._index):
+                self._drop_locked(key)
+
+    def stats(self):
+        with self._lock:
+            self._load_index_locked()
+            return {
+                "entries": len(self._index),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+RESPONSE_CACHE = ResponseCache()
+
+
+def cached_run_provider(provider, config, user_prompt, keys, mode=CACHE_USE, cache=None,
+                        on_chunk=None, stats=None):
+    """
+    run_provider behind the response cache, with the config's hedging/failover
+    routing applied to misses (keyed on the primary model).
+
+    stats (if given) receives run_provider's metrics plus 'cache' set to
+    'hit', 'miss', 'refresh' or 'bypass'. Hits are delivered to on_chunk as one chunk.
+    """
+    cache = cache or RESPONSE_CACHE
+    if mode not in CACHE_MODES:
+        raise ValueError(f"Unknown cache mode: {mode}")
+    stats = stats if stats is not None else {}
+
+    if mode == CACHE_BYPASS:
+        stats["cache"] = "bypass"
+        return run_routed(provider, config, user_prompt, keys, on_chunk=on_chunk, stats=stats)
+
+    key = cache_key(provider, config, user_prompt)
+    if mode == CACHE_USE:
+        start = time.time()
+        entry = cache.get(key)
+        if entry is not None:
+            if on_chunk:
+                on_chunk(entry["output"])
+            stats.update(entry.get("meta", {}))
+            stats.update({"cache": "hit", "elapsed_s": round(time.time() - start, 3), "ttft_s": None,
+                          "tokens_per_s": None})
+            return entry["output"]
+
+    stats["cache"] = "miss" if mode == CACHE_USE else "refresh"
+    output = run_routed(provider, config, user_prompt, keys, on_chunk=on_chunk, stats=stats)
+    meta = {k: stats.get(k) for k in ("tokens_in", "tokens_out", "tokens_estimated")}
+    meta["source_elapsed_s"] = stats.get("elapsed_s")
+    cache.put(key, output, meta)
+    return output
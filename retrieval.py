@@ -0,0 +1,109 @@
+"""
+In-process inverted index and BM25 retrieval over extracted page text
+
+One index is built per document (keyed by content hash) and shared across
+agents, sessions and reruns. Each agent's system prompt and description are
+turned into a weighted query so the agent only receives its top-k pages.
+"""
+
+import re
+import math
+from collections import Counter
+
+from resource_cache import RESOURCES
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+DEFAULT_TOP_K = 12
+
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[.\-/][a-z0-9]+)*")
+
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have in into is it its of on or that the their this to was were
+will with within without any all each per not no if but than then such these those your you our we
+can may must should would could also other including include includes based using use used
+""".split())
+
+# Words every reviewer prompt shares; they carry no signal for page selection
+QUERY_STOPWORDS = STOPWORDS | frozenset("""
+fda 510 k review reviewer reviews reviewing expert role focus assess evaluate verify check identify
+flag data device devices submission specializing specialist conducting meticulously insufficient
+missing incomplete proper current all
+""".split())
+
+
+def tokenize(text):
+    """Lowercased terms; keeps standard numbers like 10993-5 and f1800 intact"""
+    terms = []
+    for tok in TOKEN_RE.findall(text.lower()):
+        if tok in STOPWORDS or len(tok) < 2:
+            continue
+        terms.append(tok)
+        # Index the parts of compound tokens too, so "10993-5" also matches "10993"
+        if "-" in tok or "/" in tok or "." in tok:
+            terms.extend(p for p in re.split(r"[.\-/]", tok) if len(p) > 1 and p not in STOPWORDS)
+    return terms
+
+
+class PageIndex:
+    """Inverted index with BM25 scoring over {page_index: text}"""
+
+    def __init__(self, pages):
+        self.postings = {}
+        self.lengths = {}
+        for page_no, text in pages.items():
+            counts = Counter(tokenize(text))
+            self.lengths[page_no] = sum(counts.values())
+            for term, tf in counts.items():
+                self.postings.setdefault(term, {})[page_no] = tf
+        self.n_pages = len(self.lengths)
+        self.avg_len = (sum(self.lengths.values()) / self.n_pages) if self.n_pages else 0.0
+
+    def idf(self, term):
+        df = len(self.postings.get(term, ()))
+        return math.log(1 + (self.n_pages - df + 0.5) / (df + 0.5))
+
+    def search(self, query, k=DEFAULT_TOP_K):
+        """
+        Top-k (page_index, score) for query, a string or {term: weight}.
+        Pages with no matching terms are never returned.
+        """
+        weights = Counter(tokenize(query)) if isinstance(query, str) else query
+        scores = {}
+        for term, qw in weights.items():
+            plist = self.postings.get(term)
+            if not plist:
+                continue
+            idf = self.idf(term)
+            for page_no, tf in plist.items():
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[page_no] / (self.avg_len or 1))
+                scores[page_no] = scores.get(page_no, 0.0) + qw * idf * tf * (BM25_K1 + 1) / (tf + norm)
+        ranked = sorted(scores.items(), key=lambda kv: (-kv[1], kv[0]))
+        return ranked[:k] if k else ranked
+
+
+def agent_query(config):
+    """Weighted query terms from an agent's system prompt and description"""
+    text = " ".join(filter(None, [config.get("desc"), config.get("system_prompt")]))
+    return Counter(t for t in tokenize(text) if t not in QUERY_STOPWORDS)
+
+
+def get_index(doc_hash, pages):
+    """Shared PageIndex for a document; built once per content hash and page set"""
+    key = (doc_hash, hash(tuple(sorted(pages))))
+    return RESOURCES.get_or_build('index', key, lambda: PageIndex(pages),
+                                  label=f"{doc_hash[:12]} • {len(pages)} pages")
+
+
+def select_pages(doc, config, k=DEFAULT_TOP_K):
+    """
+    Restrict a document's pages to the agent's top-k by BM25.
+
+    Returns ({page_index: text}, ranked [(page_index, score)]). Falls back to
+    every page when nothing in the document matches the agent's terms.
+    """
+    index = get_index(doc['hash'], doc['pages'])
+    ranked = index.search(agent_query(config), k)
+    if not ranked:
+        return doc['pages'], []
+    return {page_no: doc['pages'][page_no] for page_no, _ in ranked}, ranked
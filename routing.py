@@ -0,0 +1,172 @@
+"""
+Hedged requests and latency-aware failover between providers
+
+An agent config may carry a routing policy ({'provider', 'model',
+'percentile'}) naming an equivalent secondary provider/model. A call still
+pending past the primary model's recent latency percentile (time to first
+token when streaming) gets a hedged duplicate on the secondary; whichever
+answers first wins and the other is cancelled: its rate-limiter slot and
+Gemini key are released at once, and since routed requests run under
+HEDGE_CALL_TIMEOUT_S a loser stalled before its first chunk is torn down
+by its client rather than left on the SDK's default timeout.
+When the primary provider is down, or its call fails before the hedge
+fires, the call fails over to the secondary straight away. Every routed
+call records whether it hedged, which side won and what the duplicate cost.
+"""
+
+import os
+import threading
+
+from providers import CallCancelled, CancelToken, run_provider
+from metrics import METRICS
+from planner import count_tokens, model_price
+
+HEDGE_PERCENTILE = 95
+# Hedge delay while the primary model has too little history for a percentile
+DEFAULT_HEDGE_DELAY_S = 30.0
+MIN_HEDGE_DELAY_S = 1.0
+# Client timeout for every request of a routed call
+HEDGE_CALL_TIMEOUT_S = float(os.getenv("HEDGE_CALL_TIMEOUT_S", 300))
+PRIMARY = 'primary'
+SECONDARY = 'secondary'
+
+
+def secondary_config(config, policy):
+    """The agent config re-targeted at the policy's secondary model"""
+    cfg = {k: v for k, v in config.items() if k not in ('routing', 'pmpt_id')}
+    cfg['model'] = policy['model']
+    if policy['provider'] != 'grok':
+        cfg.pop('image_url', None)
+    return cfg
+
+
+class _Race:
+    """Attempts at the same prompt; the first to commit wins and the rest are cancelled"""
+
+    def __init__(self, user_prompt, keys, on_chunk):
+        self.user_prompt = user_prompt
+        self.keys = keys
+        self.on_chunk = on_chunk
+        self.attempts = {}
+        self.winner = None
+        self._cond = threading.Condition()
+
+    def start(self, name, provider, config):
+        attempt = {'provider': provider, 'config': config, 'stats': {}, 'chars_out': 0,
+                   'done': False, 'output': None, 'error': None, 'cancel': CancelToken()}
+
+        def forward(chunk):
+            with self._cond:
+                # Streaming commits on the first chunk, since it is already on screen
+                if self.winner is None and self.on_chunk is not None:
+                    self._commit(name)
+                if self.winner not in (None, name):
+                    raise CallCancelled(f"{name} call lost the hedge")
+                attempt['chars_out'] += len(chunk)
+            if self.on_chunk is not None:
+                self.on_chunk(chunk)
+
+        def run():
+            try:
+                # Always streamed internally, so a losing call can be abandoned
+                output = run_provider(provider, config, self.user_prompt, self.keys, on_chunk=forward,
+                                      stats=attempt['stats'], cancel=attempt['cancel'],
+                                      timeout=HEDGE_CALL_TIMEOUT_S)
+                error = None
+            except Exception as e:
+                output, error = None, e
+            with self._cond:
+                attempt.update(output=output, error=error, done=True)
+                if error is None and self.winner is None:
+                    self._commit(name)
+                self._cond.notify_all()
+
+        with self._cond:
+            self.attempts[name] = attempt
+            if self.winner is not None:
+                # The race was decided while this attempt was being set up
+                attempt['cancel'].cancel()
+        threading.Thread(target=run, name=f"hedge-{name}", daemon=True).start()
+
+    def _commit(self, name):
+        self.winner = name
+        for other, attempt in self.attempts.items():
+            if other != name:
+                attempt['cancel'].cancel()
+        self._cond.notify_all()
+
+    def wait(self, timeout=None):
+        """True once a winner is committed or every attempt has failed; False on timeout"""
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: self.winner is not None or all(a['done'] for a in self.attempts.values()), timeout)
+
+    def finish(self):
+        """The winning attempt once it has completed, or None if every attempt failed"""
+        self.wait()
+        with self._cond:
+            if self.winner is None:
+                return None
+            attempt = self.attempts[self.winner]
+            self._cond.wait_for(lambda: attempt['done'])
+            return attempt
+
+
+def _attempt_cost(attempt, system_tokens, prompt_tokens):
+    price = model_price(attempt['config'].get('model'))
+    if price is None:
+        return None
+    tokens_out = attempt['stats'].get('tokens_out') or attempt['chars_out'] // 4
+    return ((system_tokens + prompt_tokens) * price[0] + tokens_out * price[1]) / 1e6
+
+
+def run_routed(provider, config, user_prompt, keys, on_chunk=None, stats=None):
+    """run_provider under the config's routing policy; stats gains 'routing' for routed calls"""
+    policy = config.get('routing')
+    if not policy or not policy.get('provider'):
+        return run_provider(provider, config, user_prompt, keys, on_chunk=on_chunk, stats=stats)
+    stats = stats if stats is not None else {}
+    model = config.get('model')
+    race = _Race(user_prompt, keys, on_chunk)
+    hedged = failover = False
+    delay = None
+
+    primary_down = METRICS.provider_health(provider)[0] == 'down'
+    if primary_down and METRICS.provider_health(policy['provider'])[0] != 'down':
+        failover = True
+        race.start(SECONDARY, policy['provider'], secondary_config(config, policy))
+    else:
+        field = 'ttft_s' if on_chunk else 'latency_s'
+        delay = METRICS.latency_percentile(provider, model, policy.get('percentile', HEDGE_PERCENTILE), field)
+        delay = max(MIN_HEDGE_DELAY_S, DEFAULT_HEDGE_DELAY_S if delay is None else delay)
+        race.start(PRIMARY, provider, config)
+        if not race.wait(delay):
+            hedged = True
+            race.start(SECONDARY, policy['provider'], secondary_config(config, policy))
+        elif race.winner is None:
+            failover = True  # the primary failed outright
+            race.start(SECONDARY, policy['provider'], secondary_config(config, policy))
+
+    winner = race.finish()
+    added_cost = 0.0
+    if hedged:
+        system_tokens = count_tokens(config.get('system_prompt', ''))
+        prompt_tokens = count_tokens(user_prompt)
+        # The duplicate is whichever call didn't win; its partial output still cost something
+        loser = race.attempts[PRIMARY if race.winner == SECONDARY else SECONDARY]
+        added_cost = _attempt_cost(loser, system_tokens, prompt_tokens) or 0.0
+    METRICS.record_hedge(provider, model, hedged, failover, race.winner, round(added_cost, 6))
+    if winner is None or winner['error'] is not None:
+        failed = winner or race.attempts.get(PRIMARY) or race.attempts[SECONDARY]
+        stats.update(failed['stats'])
+        raise failed['error']
+    stats.update(winner['stats'])
+    stats['routing'] = {
+        'hedged': hedged,
+        'failover': failover,
+        'winner': race.winner,
+        'served_by': f"{winner['provider']}:{winner['config'].get('model')}",
+        'hedge_delay_s': round(delay, 2) if delay is not None else None,
+        'added_cost_usd': round(added_cost, 6),
+    }
+    return winner['output']
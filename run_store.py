@@ -0,0 +1,348 @@
+"""
+Persistent store of every agent run (SQLite, WAL)
+
+Runs from the Streamlit app and batch_review.py land in one table indexed by
+submission, agent, provider/model and timestamp. History views page through
+it with keyset cursors; exports stream rows in batches so the full history is
+never held in memory.
+
+    python run_store.py export --format csv --agent "Biocompatibility Assessor" > runs.csv
+"""
+
+import os
+import io
+import csv
+import sys
+import json
+import time
+import uuid
+import sqlite3
+import argparse
+import tempfile
+import threading
+
+RUN_STORE_PATH = os.getenv("RUN_STORE_PATH", os.path.join(".cache", "runs.sqlite3"))
+PAGE_SIZE = 25
+EXPORT_BATCH = 500
+
+# Columns promoted out of the entry dict; everything else is kept in `extra`
+COLUMNS = ("run_id", "ts", "submission", "doc_hash", "agent", "provider", "model", "ok", "status", "elapsed_s",
+           "ttft_s", "tokens_in", "tokens_out", "cache", "retries", "output", "error")
+SUMMARY_COLUMNS = ("id", "run_id", "ts", "submission", "agent", "provider", "model", "ok", "status", "elapsed_s",
+                   "tokens_in", "tokens_out", "cache", "error")
+# Agent run statuses; rows written before the status column have only ok
+OK = "ok"
+ERROR = "error"
+SKIPPED = "skipped"
+CANCELLED = "cancelled"
+CSV_COLUMNS = ("id",) + COLUMNS
+# Columns added after the first release, created on open for older databases
+MIGRATIONS = {
+    'runs': {'doc_meta': "TEXT", 'findings': "TEXT"},
+    'agent_runs': {'status': "TEXT"},
+}
+
+
+def run_status(row):
+    """ok, error, skipped or cancelled for a stored agent run"""
+    return row.get('status') or (OK if row['ok'] else ERROR)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    source TEXT,
+    started REAL,
+    finished REAL,
+    submission TEXT,
+    user_prompt TEXT,
+    agents INTEGER,
+    errors INTEGER,
+    elapsed_s REAL,
+    doc_meta TEXT,
+    findings TEXT
+);
+CREATE TABLE IF NOT EXISTS agent_runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT,
+    ts REAL NOT NULL,
+    submission TEXT,
+    doc_hash TEXT,
+    agent TEXT,
+    provider TEXT,
+    model TEXT,
+    ok INTEGER,
+    status TEXT,
+    elapsed_s REAL,
+    ttft_s REAL,
+    tokens_in INTEGER,
+    tokens_out INTEGER,
+    cache TEXT,
+    retries INTEGER,
+    output TEXT,
+    error TEXT,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_agent_runs_ts ON agent_runs (ts, id);
+CREATE INDEX IF NOT EXISTS idx_agent_runs_submission ON agent_runs (submission, ts, id);
+CREATE INDEX IF NOT EXISTS idx_agent_runs_agent ON agent_runs (agent, ts, id);
+CREATE INDEX IF NOT EXISTS idx_agent_runs_model ON agent_runs (provider, model, ts, id);
+CREATE INDEX IF NOT EXISTS idx_agent_runs_run ON agent_runs (run_id, id);
+CREATE INDEX IF NOT EXISTS idx_runs_started ON runs (started);
+"""
+
+FILTERS = {
+    'run_id': "run_id = ?",
+    'submission': "submission = ?",
+    'agent': "agent = ?",
+    'provider': "provider = ?",
+    'model': "model = ?",
+    'since': "ts >= ?",
+    'until': "ts < ?",
+}
+
+
+def _where(filters):
+    clauses, params = [], []
+    for name, value in filters.items():
+        if name not in FILTERS:
+            raise ValueError(f"Unknown filter: {name}")
+        if value is not None and value != "":
+            clauses.append(FILTERS[name])
+            params.append(value)
+    return clauses, params
+
+
+class RunStore:
+    """Thread-safe handle on the run database; one connection per thread"""
+
+    def __init__(self, path=RUN_STORE_PATH):
+        self.path = path
+        self._local = threading.local()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._conn() as conn:
+            conn.executescript(SCHEMA)
+            for table, columns in MIGRATIONS.items():
+                existing = {r['name'] for r in conn.execute(f"PRAGMA table_info({table})")}
+                for column, decl in columns.items():
+                    if column not in existing:
+                        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def start_run(self, source, submission=None, user_prompt=None, agents=None, doc_meta=None):
+        """New run record; doc_meta holds the document's page and section hashes for later diffs"""
+        run_id = uuid.uuid4().hex
+        meta = json.dumps(doc_meta, default=str) if doc_meta is not None else None
+        with self._conn() as conn:
+            conn.execute("INSERT INTO runs (run_id, source, started, submission, user_prompt, agents, doc_meta) "
+                         "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         (run_id, source, time.time(), submission, user_prompt, agents, meta))
+        return run_id
+
+    def run(self, run_id):
+        row = self._conn().execute("SELECT * FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+        if row is None:
+            return None
+        run = dict(row)
+        for field in ('doc_meta', 'findings'):
+            run[field] = json.loads(run[field]) if run[field] else None
+        return run
+
+    def finish_run(self, run_id, errors, elapsed_s, findings=None):
+        """Close a run; findings are its consolidated findings across agents (see findings.py)"""
+        with self._conn() as conn:
+            conn.execute("UPDATE runs SET finished = ?, errors = ?, elapsed_s = ?, findings = ? WHERE run_id = ?",
+                         (time.time(), errors, elapsed_s,
+                          json.dumps(findings, ensure_ascii=False) if findings is not None else None, run_id))
+
+    def record(self, run_id, entry, submission=None, doc_hash=None):
+        """
+        Append one agent result (the run_log entry dict); returns its row id.
+
+        The entry's 'status' defaults to error when it has one, else ok.
+        """
+        extra = {k: v for k, v in entry.items() if k not in COLUMNS}
+        status = entry.get('status') or (ERROR if 'error' in entry else OK)
+        row = {
+            'run_id': run_id,
+            'ts': time.time(),
+            'submission': submission if submission is not None else entry.get('document'),
+            'doc_hash': doc_hash,
+            'agent': entry.get('agent'),
+            'provider': entry.get('provider'),
+            'model': entry.get('model'),
+            'ok': int(status == OK),
+            'status': status,
+            'elapsed_s': entry.get('elapsed_s'),
+            'ttft_s': entry.get('ttft_s'),
+            'tokens_in': entry.get('tokens_in'),
+            'tokens_out': entry.get('tokens_out'),
+            'cache': entry.get('cache'),
+            'retries': entry.get('retries'),
+            'output': entry.get('output'),
+            'error': entry.get('error'),
+        }
+        cols = COLUMNS + ("extra",)
+        values = [row[c] for c in COLUMNS] + [json.dumps(extra, ensure_ascii=False, default=str)]
+        with self._conn() as conn:
+            cur = conn.execute(f"INSERT INTO agent_runs ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})",
+                               values)
+        return cur.lastrowid
+
+    def query(self, limit=PAGE_SIZE, cursor=None, **filters):
+        """
+        One page of agent runs, newest first, without output bodies.
+
+        Returns (rows, next_cursor); pass next_cursor back to get the following
+        page (None when there are no more rows).
+        """
+        clauses, params = _where(filters)
+        if cursor:
+            clauses.append("(ts < ? OR (ts = ? AND id < ?))")
+            params += [cursor[0], cursor[0], cursor[1]]
+        sql = f"SELECT {', '.join(SUMMARY_COLUMNS)} FROM agent_runs"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY ts DESC, id DESC LIMIT ?"
+        rows = [dict(r) for r in self._conn().execute(sql, params + [limit + 1])]
+        next_cursor = (rows[limit - 1]['ts'], rows[limit - 1]['id']) if len(rows) > limit else None
+        return rows[:limit], next_cursor
+
+    def count(self, **filters):
+        clauses, params = _where(filters)
+        sql = "SELECT COUNT(*) FROM agent_runs" + (" WHERE " + " AND ".join(clauses) if clauses else "")
+        return self._conn().execute(sql, params).fetchone()[0]
+
+    def distinct(self, column):
+        """Distinct values of an indexed column, for filter pickers"""
+        if column not in ("submission", "agent", "provider", "model"):
+            raise ValueError(f"Not an indexed column: {column}")
+        sql = f"SELECT DISTINCT {column} FROM agent_runs WHERE {column} IS NOT NULL ORDER BY {column}"
+        return [r[0] for r in self._conn().execute(sql)]
+
+    def get(self, entry_id):
+        row = self._conn().execute("SELECT * FROM agent_runs WHERE id = ?", (entry_id,)).fetchone()
+        return _full(row) if row else None
+
+    def recent_runs(self, limit=PAGE_SIZE, with_document=False):
+        """Latest runs, without doc_meta; with_document keeps only runs over a document"""
+        sql = ("SELECT run_id, source, started, finished, submission, user_prompt, agents, errors, elapsed_s "
+               "FROM runs" + (" WHERE doc_meta IS NOT NULL" if with_document else "") +
+               " ORDER BY started DESC LIMIT ?")
+        return [dict(r) for r in self._conn().execute(sql, (limit,))]
+
+    def provider_calls(self, provider, model, limit=200):
+        """Latest successful, uncached runs of a model with their timing and token counts"""
+        sql = ("SELECT elapsed_s, ttft_s, tokens_in, tokens_out, extra FROM agent_runs "
+               "WHERE provider = ? AND model = ? AND ok = 1 AND (cache IS NULL OR cache NOT IN ('hit', 'reused')) "
+               "ORDER BY id DESC LIMIT ?")
+        return [_full(r) for r in self._conn().execute(sql, (provider, model, limit))]
+
+    def estimated_runs(self, limit=200):
+        """Latest successful, uncached runs that carry a pre-flight estimate"""
+        sql = ("SELECT provider, model, elapsed_s, tokens_in, tokens_out, extra FROM agent_runs "
+               "WHERE ok = 1 AND (cache IS NULL OR cache NOT IN ('hit', 'reused')) AND extra LIKE '%\"estimate\"%' "
+               "ORDER BY id DESC LIMIT ?")
+        return [_full(r) for r in self._conn().execute(sql, (limit,))]
+
+    def iter_entries(self, batch=EXPORT_BATCH, **filters):
+        """Every matching agent run in insertion order, fetched batch rows at a time"""
+        clauses, params = _where(filters)
+        last_id = 0
+        while True:
+            sql = "SELECT * FROM agent_runs WHERE " + " AND ".join(clauses + ["id > ?"]) + " ORDER BY id LIMIT ?"
+            rows = self._conn().execute(sql, params + [last_id, batch]).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield _full(row)
+            last_id = rows[-1]['id']
+
+    def export_ndjson(self, **filters):
+        """Yields one JSON line per agent run"""
+        for entry in self.iter_entries(**filters):
+            yield json.dumps(entry, ensure_ascii=False, default=str) + "\n"
+
+    def export_csv(self, **filters):
+        """Yields CSV text: a header line, then one line per agent run"""
+        buf = io.StringIO()
+        writer = csv.DictWriter(buf, fieldnames=CSV_COLUMNS, extrasaction="ignore")
+        writer.writeheader()
+        for entry in self.iter_entries(**filters):
+            writer.writerow(entry)
+            if buf.tell() > 64 * 1024:
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+        yield buf.getvalue()
+
+
+def spool(chunks, max_memory=8 * 1024 * 1024):
+    """Write text chunks to a spooled temp file (on disk past max_memory), rewound for reading"""
+    f = tempfile.SpooledTemporaryFile(max_size=max_memory)
+    for chunk in chunks:
+        f.write(chunk.encode('utf-8'))
+    f.seek(0)
+    return f
+
+
+def _full(row):
+    entry = dict(row)
+    extra = entry.pop('extra', None)
+    if extra:
+        entry.update(json.loads(extra))
+    return entry
+
+
+_STORE = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_store():
+    """Process-wide RunStore, opened on first use"""
+    global _STORE
+    with _STORE_LOCK:
+        if _STORE is None:
+            _STORE = RunStore()
+        return _STORE
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query and export the agent run history.")
+    parser.add_argument('--db', default=RUN_STORE_PATH)
+    sub = parser.add_subparsers(dest='command', required=True)
+    for name in ('list', 'export'):
+        p = sub.add_parser(name)
+        for f in ('run_id', 'submission', 'agent', 'provider', 'model'):
+            p.add_argument(f"--{f.replace('_', '-')}", dest=f)
+        if name == 'list':
+            p.add_argument('--limit', type=int, default=PAGE_SIZE)
+        else:
+            p.add_argument('--format', choices=['ndjson', 'csv'], default='ndjson')
+    args = parser.parse_args(argv)
+
+    store = RunStore(args.db)
+    filters = {f: getattr(args, f) for f in ('run_id', 'submission', 'agent', 'provider', 'model')}
+    if args.command == 'list':
+        rows, _ = store.query(limit=args.limit, **filters)
+        for r in rows:
+            print(f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(r['ts']))}  {run_status(r):9s}  "
+                  f"{r['agent'] or '-'}  {r['provider']}:{r['model']}  {r['submission'] or '-'}")
+        return 0
+    export = store.export_csv if args.format == 'csv' else store.export_ndjson
+    for chunk in export(**filters):
+        sys.stdout.write(chunk)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
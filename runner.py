@@ -0,0 +1,196 @@
+"""
+DAG execution engine for the Prompt ID Runner
+
+Agents declare which other agents they depend on. Independent agents run
+concurrently on a bounded thread pool; an agent starts as soon as all of its
+upstream agents have finished, and their outputs are appended to its prompt.
+Callbacks fire on the calling thread so Streamlit elements can be updated
+from them.
+"""
+
+import json
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from response_cache import CACHE_USE, cached_run_provider
+from chunking import DEFAULT_CHUNK_TOKENS, input_budget, chunk_pages, map_reduce
+from incremental import agent_pages, input_record
+
+DEFAULT_MAX_WORKERS = 4
+
+
+def validate_dag(deps):
+    """Check deps ({node: [upstream, ...]}) for unknown nodes and cycles; returns a topological order"""
+    for node, ups in deps.items():
+        for up in ups:
+            if up not in deps:
+                raise ValueError(f"{node} depends on unknown agent {up}")
+            if up == node:
+                raise ValueError(f"{node} cannot depend on itself")
+
+    indegree = {n: len(set(ups)) for n, ups in deps.items()}
+    downstream = {n: [] for n in deps}
+    for node, ups in deps.items():
+        for up in set(ups):
+            downstream[up].append(node)
+
+    order = []
+    ready = [n for n in deps if indegree[n] == 0]
+    while ready:
+        node = ready.pop(0)
+        order.append(node)
+        for down in downstream[node]:
+            indegree[down] -= 1
+            if indegree[down] == 0:
+                ready.append(down)
+    if len(order) != len(deps):
+        cyclic = sorted(str(n) for n in deps if n not in order)
+        raise ValueError(f"Dependency cycle between agents: {', '.join(cyclic)}")
+    return order
+
+
+def build_prompt(user_prompt, upstream_outputs, labels=None):
+    """Append upstream agent outputs to the user prompt"""
+    if not upstream_outputs:
+        return user_prompt
+    labels = labels or {}
+    parts = [user_prompt]
+    for node, output in upstream_outputs.items():
+        parts.append(f"--- Output from {labels.get(node, node)} ---\n{output}")
+    return "\n\n".join(parts)
+
+
+def run_dag(deps, execute, max_workers=DEFAULT_MAX_WORKERS, on_start=None, on_done=None,
+            on_tick=None, tick_s=0.25):
+    """
+    Run execute(node, upstream_outputs) for every node in deps, respecting dependencies.
+
+    upstream_outputs maps each direct upstream node to its output. Nodes whose
+    upstream failed are not executed and are reported with a 'skipped' error.
+    on_start(node) and on_done(node, result) are invoked on the calling thread,
+    as is on_tick() roughly every tick_s seconds while agents are running
+    (used to render streamed output).
+    Returns {node: result} where result has 'output' or 'error', plus
+    'elapsed_s', 'queued_s' and 'skipped'.
+    """
+    validate_dag(deps)
+    results = {}
+    pending = dict(deps)
+    running = {}
+    t0 = time.time()
+
+    def _timed(node, upstream):
+        start = time.time()
+        try:
+            return execute(node, upstream), None, start, time.time()
+        except Exception as e:
+            return None, e, start, time.time()
+
+    def _finish(node, result):
+        results[node] = result
+        if on_done:
+            on_done(node, result)
+
+    with ThreadPoolExecutor(max_workers=max(1, int(max_workers))) as pool:
+        while pending or running:
+            # Submit everything whose upstream is settled
+            for node in list(pending):
+                ups = pending[node]
+                if not all(up in results for up in ups):
+                    continue
+                del pending[node]
+                failed = [up for up in ups if 'error' in results[up]]
+                if failed:
+                    _finish(node, {
+                        'error': f"Skipped: upstream {', '.join(str(u) for u in failed)} failed",
+                        'skipped': True,
+                        'elapsed_s': 0.0,
+                        'queued_s': round(time.time() - t0, 2),
+                    })
+                    continue
+                upstream = {up: results[up]['output'] for up in ups}
+                if on_start:
+                    on_start(node)
+                running[pool.submit(_timed, node, upstream)] = (node, time.time())
+
+            if not running:
+                continue
+
+            done, _ = wait(list(running), timeout=tick_s if on_tick else None,
+                           return_when=FIRST_COMPLETED)
+            if on_tick:
+                on_tick()
+            for fut in done:
+                node, submitted = running.pop(fut)
+                out, err, started, ended = fut.result()
+                result = {
+                    'skipped': False,
+                    'elapsed_s': round(ended - started, 2),
+                    'queued_s': round(started - submitted, 2),
+                }
+                if err is None:
+                    result['output'] = out
+                else:
+                    result['error'] = str(err)
+                _finish(node, result)
+    return results
+
+
+def dag_to_dot(deps, labels=None):
+    """Graphviz source for the dependency graph"""
+    labels = labels or {}
+    lines = ["digraph agents {", "  rankdir=LR;", '  node [shape=box, style="rounded,filled", fillcolor="#FEF3C7", color="#D97706"];']
+    for node in deps:
+        lines.append(f'  "{node}" [label="{labels.get(node, node)}"];')
+    for node, ups in deps.items():
+        for up in ups:
+            lines.append(f'  "{up}" -> "{node}";')
+    lines.append("}")
+    return "\n".join(lines)
+
+
+def config_fingerprint(cfg, prompt, **settings):
+    """Identifies an agent run (config, prompt and any run settings) so prior results can be reused"""
+    blob = {'cfg': cfg, 'prompt': prompt}
+    if settings:
+        blob['settings'] = settings
+    return hashlib.sha256(json.dumps(blob, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:16]
+
+
+def run_agent(cfg, prompt, keys, doc=None, cache_mode=CACHE_USE, top_k=0,
+              chunk_budget=DEFAULT_CHUNK_TOKENS, on_chunk=None, stats=None):
+    """
+    Run one agent config on prompt, optionally over an extracted document.
+
+    With a document, the agent's top_k pages are picked by BM25 (0 = all
+    pages), chunked to the model's input budget and reviewed map-reduce.
+    stats receives provider metrics plus 'retrieved_pages', 'chunks' and
+    'input_pages' ({page: content hash}, the dependency record used for
+    incremental re-review).
+    """
+    stats = stats if stats is not None else {}
+
+    def call(p, call_stats, stream):
+        return cached_run_provider(
+            provider=cfg['provider'],
+            config=cfg,
+            user_prompt=p,
+            keys=keys,
+            mode=cache_mode,
+            on_chunk=stream,
+            stats=call_stats
+        )
+
+    if not doc:
+        return call(prompt, stats, on_chunk)
+    pages, ranked = agent_pages(cfg, doc, top_k)
+    if top_k:
+        # An empty ranking means the agent's terms matched nothing; all pages are sent
+        stats['retrieved_pages'] = [p + 1 for p, _ in ranked] or None
+    stats['input_pages'] = input_record(doc, pages)
+    budget = input_budget(cfg, chunk_budget)
+    chunks = chunk_pages(pages, budget)
+    out, trace = map_reduce(call, prompt, chunks, budget, on_chunk=on_chunk, stats=stats)
+    stats['chunks'] = trace
+    return out
@@ -0,0 +1,127 @@
+"""
+Startup-time measurement: per-module import cost and first-render time
+
+    python startup_profile.py [--json]
+
+imports the app's modules in app.py's order in a fresh interpreter under
+-X importtime (so each row is what that module adds on top of the ones
+before it), reports what each provider SDK would cost if imported eagerly,
+then times the first render and a warm rerun of app.py.
+
+With STARTUP_PROFILE=1 the running app also shows its own import and script
+times in the sidebar.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+ENABLED = os.getenv("STARTUP_PROFILE") == "1"
+APP_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+# Imported at the top of app.py, in order
+APP_MODULES = ("streamlit", "agent_library", "providers", "ratelimit", "metrics", "response_cache", "ingest",
+               "retrieval", "chunking", "runner", "incremental", "run_store", "jobs", "checklist", "routing",
+               "comparison", "findings", "corpus")
+
+# First script run in this process, kept across reruns
+FIRST_RUN = {}
+
+
+def record_run(script_start, imports_done):
+    """Seconds spent in app.py's imports and in the whole script for this run"""
+    run = {'imports_s': imports_done - script_start, 'script_s': time.perf_counter() - script_start}
+    if not FIRST_RUN:
+        FIRST_RUN.update(run)
+    return run
+
+
+def parse_importtime(stderr):
+    """{module: (self_s, cumulative_s)} from -X importtime output"""
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        times[name.strip()] = (int(self_us) / 1e6, int(cumulative_us) / 1e6)
+    return times
+
+
+def _importtime(code):
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                          capture_output=True, text=True, cwd=os.path.dirname(APP_FILE))
+    return parse_importtime(proc.stderr)
+
+
+def module_costs(modules=APP_MODULES):
+    """Incremental cold import cost of each module, imported in the given order"""
+    times = _importtime("; ".join(f"import {m}" for m in modules))
+    return [{'module': m, 'import_s': round(times.get(m, (0, 0))[1], 4)} for m in modules]
+
+
+def sdk_costs():
+    """Cold import cost of each provider SDK on top of the app's own modules"""
+    from providers import SDK_MODULES, GEMINI_AVAILABLE, OPENAI_AVAILABLE, GROK_AVAILABLE
+    available = {'gemini': GEMINI_AVAILABLE, 'openai': OPENAI_AVAILABLE, 'grok': GROK_AVAILABLE}
+    rows = []
+    for provider, module in SDK_MODULES.items():
+        if not available[provider]:
+            rows.append({'provider': provider, 'module': module, 'import_s': None})
+            continue
+        times = _importtime("; ".join(f"import {m}" for m in APP_MODULES) + f"; import {module}")
+        rows.append({'provider': provider, 'module': module, 'import_s': round(times.get(module, (0, 0))[1], 4)})
+    return rows
+
+
+def render_costs():
+    """Cold first render and warm rerun of app.py, each in seconds"""
+    code = (
+        "import time, json\n"
+        "from streamlit.testing.v1 import AppTest\n"
+        f"at = AppTest.from_file({APP_FILE!r}, default_timeout=120)\n"
+        "t0 = time.perf_counter(); at.run(); t1 = time.perf_counter(); at.run(); t2 = time.perf_counter()\n"
+        "print(json.dumps({'first_render_s': t1 - t0, 'rerun_s': t2 - t1, 'exceptions': len(at.exception)}))\n"
+    )
+    proc = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                          cwd=os.path.dirname(APP_FILE))
+    try:
+        return json.loads(proc.stdout.strip().splitlines()[-1])
+    except (ValueError, IndexError):
+        return {'error': proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "no output"}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure app cold-start cost per module.")
+    parser.add_argument('--json', action='store_true', help="print the report as JSON")
+    parser.add_argument('--skip-render', action='store_true', help="only measure imports")
+    args = parser.parse_args(argv)
+
+    report = {'modules': module_costs(), 'sdks': sdk_costs()}
+    report['imports_total_s'] = round(sum(r['import_s'] for r in report['modules']), 4)
+    if not args.skip_render:
+        report['render'] = render_costs()
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return 0
+
+    print("| module | cold import (s) |\n|---|---|")
+    for r in report['modules']:
+        print(f"| {r['module']} | {r['import_s']:.3f} |")
+    print(f"| **total** | {report['imports_total_s']:.3f} |")
+    print("\n| provider SDK (lazy) | module | import on first use (s) |\n|---|---|---|")
+    for r in report['sdks']:
+        cost = "not installed" if r['import_s'] is None else f"{r['import_s']:.3f}"
+        print(f"| {r['provider']} | {r['module']} | {cost} |")
+    if 'render' in report:
+        render = report['render']
+        if 'error' in render:
+            print(f"\nRender failed: {render['error']}")
+        else:
+            print(f"\nFirst render: {render['first_render_s']:.3f}s • warm rerun: {render['rerun_s']:.3f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
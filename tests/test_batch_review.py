@@ -0,0 +1,84 @@
+import json
+
+import pytest
+
+import batch_review
+from batch_review import agent_fingerprints, is_current, review_document
+from run_store import RunStore
+
+CONFIGS = [
+    {'name': "Biocompatibility Assessor", 'provider': 'openai', 'model': 'gpt-4o-mini', 'system_prompt': "Bio."},
+    {'name': "Sterilization Reviewer", 'provider': 'openai', 'model': 'gpt-4o-mini', 'system_prompt': "Sterile."},
+]
+
+
+def complete(fingerprints):
+    return {'status': 'complete',
+            'agents': [{'agent': name, 'fingerprint': fp, 'output': "ok"} for name, fp in fingerprints.items()]}
+
+
+def test_fingerprints_change_with_run_settings():
+    base = agent_fingerprints(CONFIGS, "Review.")
+    assert agent_fingerprints(CONFIGS, "Review.") == base
+    for changed in (agent_fingerprints(CONFIGS, "Review again."),
+                    agent_fingerprints(CONFIGS, "Review.", top_k=3),
+                    agent_fingerprints(CONFIGS, "Review.", chunk_budget=2000),
+                    agent_fingerprints(CONFIGS, "Review.", predicate={'hash': "abc"})):
+        assert all(changed[name] != base[name] for name in base)
+
+
+def test_complete_result_with_matching_fingerprints_is_current():
+    fingerprints = agent_fingerprints(CONFIGS, "Review.")
+    assert is_current(complete(fingerprints), fingerprints)
+
+
+@pytest.mark.parametrize("stale", ["partial", "other prompt", "missing agent", "errored agent"])
+def test_stale_results_are_not_current(stale):
+    fingerprints = agent_fingerprints(CONFIGS, "Review.")
+    result = complete(fingerprints)
+    if stale == "partial":
+        result['status'] = 'partial'
+    elif stale == "other prompt":
+        result = complete(agent_fingerprints(CONFIGS, "Other prompt."))
+    elif stale == "missing agent":
+        result['agents'].pop()
+    else:
+        result['agents'][1] = {'agent': CONFIGS[1]['name'], 'fingerprint': fingerprints[CONFIGS[1]['name']],
+                               'error': "timeout"}
+    assert not is_current(result, fingerprints)
+
+
+def test_rerun_resumes_agents_that_already_succeeded(tmp_path, monkeypatch):
+    doc = tmp_path / "submission.txt"
+    doc.write_text("Cytotoxicity per ISO 10993-5.\fSterilization per ISO 11135.", encoding="utf-8")
+    store = RunStore(str(tmp_path / "runs.sqlite3"))
+    monkeypatch.setattr(batch_review, 'get_store', lambda: store)
+    calls = []
+    failing = {"Sterilization Reviewer"}
+
+    def fake_run_agent(cfg, prompt, keys, **kwargs):
+        calls.append(cfg['name'])
+        if cfg['name'] in failing:
+            raise RuntimeError("provider down")
+        return f"MINOR: {cfg['name']} found nothing major"
+
+    monkeypatch.setattr(batch_review, 'run_agent', fake_run_agent)
+    out_dir = tmp_path / "out"
+    out_dir.mkdir()
+
+    first = review_document(doc, CONFIGS, out_dir, prompt="Review.")
+    assert first['status'] == 'partial' and first['agents_failed'] == ["Sterilization Reviewer"]
+
+    failing.clear()
+    calls.clear()
+    second = review_document(doc, CONFIGS, out_dir, prompt="Review.")
+    assert calls == ["Sterilization Reviewer"]
+    assert second['status'] == 'complete' and second['agents_resumed'] == 1
+    saved = json.loads((out_dir / "submission.txt.json").read_text(encoding="utf-8"))
+    assert [e['agent'] for e in saved['agents']] == [c['name'] for c in CONFIGS]
+    assert is_current(saved, agent_fingerprints(CONFIGS, "Review."))
+    assert not is_current(saved, agent_fingerprints(CONFIGS, "Review.", top_k=3))
+
+    calls.clear()
+    review_document(doc, CONFIGS, out_dir, prompt="A different prompt.")
+    assert sorted(calls) == sorted(c['name'] for c in CONFIGS)
@@ -0,0 +1,24 @@
+from checklist import KeywordMatcher
+
+
+def test_overlapping_keywords_are_all_found():
+    matcher = KeywordMatcher(['software requirements', 'requirements specification', 'risk management'])
+    found = matcher.scan("The Software Requirements Specification lists each requirement.")
+    assert found == {'software requirements', 'requirements specification'}
+
+
+def test_pattern_starting_inside_a_longer_match():
+    matcher = KeywordMatcher(['risk management plan', 'management plan review', 'plan'])
+    found = matcher.scan("See the risk management plan review minutes.")
+    assert found == {'risk management plan', 'management plan review', 'plan'}
+
+
+def test_contained_patterns_are_credited():
+    matcher = KeywordMatcher(['risk management', 'risk management plan'])
+    assert matcher.scan("Risk\nManagement   Plan, rev B") == {'risk management', 'risk management plan'}
+
+
+def test_matches_respect_word_boundaries():
+    matcher = KeywordMatcher(['ots', 'unit'])
+    assert matcher.scan("Robots were used in community testing") == set()
+    assert matcher.scan("OTS software and unit tests") == {'ots', 'unit'}
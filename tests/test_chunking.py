@@ -0,0 +1,99 @@
+import pytest
+
+from chunking import chunk_pages, input_budget, map_reduce, model_context
+from providers import estimate_tokens
+
+FILLER = "The test article met every acceptance criterion under the protocol. "
+
+
+def page(heading, sentences):
+    return f"{heading}\n" + FILLER * sentences
+
+
+@pytest.mark.parametrize("budget", [300, 1000, 4000])
+def test_chunks_stay_within_budget(budget):
+    pages = {n: page(f"{n + 1}. SECTION {n}", 20 + 15 * (n % 4)) for n in range(30)}
+    chunks = chunk_pages(pages, budget)
+    assert all(c['tokens'] <= budget for c in chunks)
+    assert [c['index'] for c in chunks] == list(range(len(chunks)))
+    # Every page lands in a chunk, in order
+    covered = [p for c in chunks for p in c['pages']]
+    assert sorted(set(covered)) == list(range(30)) and covered == sorted(covered)
+
+
+def test_oversized_page_is_split():
+    chunks = chunk_pages({0: FILLER * 200}, 500)
+    assert len(chunks) > 1
+    assert all(c['pages'] == [0] and c['tokens'] <= 500 for c in chunks)
+    assert all(c['text'].startswith("[Page 1]\n") for c in chunks)
+
+
+def test_small_pages_share_a_chunk_with_page_markers():
+    [chunk] = chunk_pages({0: "Intro", 4: "Labeling"}, 1000)
+    assert chunk['pages'] == [0, 4]
+    assert chunk['text'] == "[Page 1]\nIntro\n[Page 5]\nLabeling"
+
+
+def test_blank_pages_make_no_chunks():
+    assert chunk_pages({0: "", 1: "  \n"}, 1000) == []
+
+
+def test_input_budget():
+    cfg = {'model': 'gpt-4o-mini-2024-07-18', 'params': {'max_tokens': 1500}, 'system_prompt': ""}
+    assert model_context(cfg['model']) == 128000
+    assert input_budget(cfg) == 12000
+    assert input_budget(cfg, max_chunk_tokens=None) == 128000 - 1500 - 512
+    assert input_budget({'model': 'unknown', 'params': {'max_tokens': 40000}}) == 256
+
+
+def echo_call(calls):
+    def call(prompt, stats, on_chunk):
+        calls.append(prompt)
+        out = f"answer {len(calls)}"
+        if on_chunk:
+            on_chunk(out)
+        return out
+    return call
+
+
+def test_map_reduce_maps_every_chunk_then_reduces():
+    calls, streamed = [], []
+    chunks = chunk_pages({n: page(f"{n + 1}. PART", 40) for n in range(6)}, 700)
+    assert len(chunks) > 1
+    stats = {}
+    out, trace = map_reduce(echo_call(calls), "Review.", chunks, 100000, on_chunk=streamed.append, stats=stats)
+    assert len(calls) == len(chunks) + 1
+    assert f"reviewed in {len(chunks)} excerpts" in calls[-1]
+    assert out == streamed[0] == f"answer {len(calls)}"
+    assert [t['step'] for t in trace] == ['map'] * len(chunks) + ['reduce']
+    assert stats['tokens_in'] == sum(t['tokens_in'] for t in trace)
+
+
+def test_map_reduce_with_one_chunk_is_a_single_call():
+    calls = []
+    chunks = chunk_pages({0: "Short page"}, 1000)
+    out, trace = map_reduce(echo_call(calls), "Review.", chunks, 1000)
+    assert len(calls) == 1 and "excerpt 1 of 1" in calls[0]
+    assert [t['step'] for t in trace] == ['map']
+
+
+def test_map_reduce_without_chunks_sends_the_instructions_alone():
+    calls = []
+    out, trace = map_reduce(echo_call(calls), "Review.", [], 1000)
+    assert calls == ["Review."]
+    assert out == "answer 1" and len(trace) == 1
+
+
+def test_too_many_partials_are_reduced_hierarchically():
+    calls = []
+
+    def call(prompt, stats, on_chunk):
+        calls.append(prompt)
+        return "finding " * 20
+
+    chunks = [{'index': i, 'pages': [i], 'text': f"[Page {i + 1}]\nx", 'tokens': 3} for i in range(12)]
+    out, trace = map_reduce(call, "Review.", chunks, 300)
+    steps = [t['chunk'] for t in trace if t['step'] == 'reduce']
+    assert any('group' in s for s in steps)
+    assert steps[-1].startswith('level') and 'group' not in steps[-1]
+    assert all(estimate_tokens(p) <= 300 for p in calls[12:-1])
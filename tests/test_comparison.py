@@ -0,0 +1,90 @@
+import pytest
+
+from comparison import (ADDED, CHANGED, IDENTICAL, REMOVED, _sections, align_sections, compare_documents,
+                        comparison_document, diff_section, paragraphs, title_key)
+
+INTRO = "The device is a titanium acetabular cup."
+CYTO = "Cytotoxicity per ISO 10993-5 was grade 0."
+SENS = "Sensitization per ISO 10993-10 showed no reaction."
+EO = "Sterilized by ethylene oxide per ISO 11135."
+SAL = "The sterility assurance level is 10-6."
+
+
+def document(name, pages):
+    return {'name': name, 'hash': f"comparison-{name}", 'pages': dict(enumerate(pages))}
+
+
+def section(title, *paras):
+    return f"{title}\n" + "\n\n".join(paras)
+
+
+@pytest.mark.parametrize("title, key", [
+    ("5.2 Biocompatibility", "biocompatibility"),
+    ("SECTION 7: Biocompatibility", "biocompatibility"),
+    ("## Appendix B - Sterilization Validation", "sterilization validation"),
+    ("12", "12"),
+])
+def test_title_key_ignores_numbering_and_markup(title, key):
+    assert title_key(title) == key
+
+
+def test_long_blocks_split_at_sentence_line_breaks():
+    block = "\n".join(f"Sentence {i} of a long paragraph without blank lines." for i in range(40))
+    split = paragraphs("Short one.\n\n" + block)
+    assert len(split) == 41 and split[:2] == ["Short one.", "Sentence 0 of a long paragraph without blank lines."]
+
+
+def test_sections_align_by_title_then_content():
+    predicate = _sections(document("pred-align", [
+        section("1. DEVICE DESCRIPTION", INTRO),
+        section("2. BIOCOMPATIBILITY", CYTO, SENS),
+        section("3. STERILIZATION", EO, SAL),
+        section("4. SHELF LIFE", "Three years."),
+    ]))
+    subject = _sections(document("subj-align", [
+        section("SECTION 1: Device Description", INTRO),
+        section("SECTION 2: Sterility", EO, SAL, "Residuals per ISO 10993-7."),
+        section("SECTION 3: Biological Evaluation", CYTO, SENS),
+        section("SECTION 4: Labeling", "Instructions for use."),
+    ]))
+    assert align_sections(predicate, subject) == [(0, 0), (2, 1), (1, 2), (None, 3), (3, None)]
+
+
+def test_moved_paragraphs_are_not_reported_as_changes():
+    predicate = _sections(document("pred-move", [section("1. BIOCOMPATIBILITY", CYTO, SENS, EO)]))[0]
+    subject = _sections(document("subj-move", [section("1. BIOCOMPATIBILITY", EO, CYTO, SENS)]))[0]
+    hunks, unchanged, _ = diff_section(predicate, subject)
+    assert hunks == [] and unchanged == 3
+
+
+def test_edited_paragraph_is_the_only_hunk():
+    predicate = _sections(document("pred-edit", [section("1. STERILIZATION", EO, SAL, INTRO)]))[0]
+    subject = _sections(document("subj-edit", [section("1. STERILIZATION", INTRO, EO, SAL.replace("10-6", "10-3"))]))[0]
+    hunks, unchanged, similarity = diff_section(predicate, subject)
+    assert hunks == [{'predicate': [SAL], 'subject': [SAL.replace("10-6", "10-3")]}]
+    assert unchanged == 2 and 0 < similarity < 1
+
+
+def test_comparison_document_keeps_only_the_differences():
+    predicate = document("K123456", [
+        section("1. DEVICE DESCRIPTION", INTRO),
+        section("2. BIOCOMPATIBILITY", CYTO, SENS),
+        section("3. SHELF LIFE", "Three years."),
+    ])
+    subject = document("Subject", [
+        section("1. Device Description", INTRO),
+        section("2. Biocompatibility", SENS, CYTO, "Implantation per ISO 10993-6."),
+        section("3. Labeling", "Instructions for use."),
+    ])
+    comparison = compare_documents(predicate, subject)
+    statuses = {r['title']: r['status'] for r in comparison['sections']}
+    assert statuses == {"1. Device Description": IDENTICAL, "2. Biocompatibility": CHANGED,
+                        "3. Labeling": ADDED, "3. SHELF LIFE": REMOVED}
+    assert comparison['stats']['paragraphs_skipped'] == 3
+
+    doc = comparison_document(comparison)
+    assert doc['page_count'] == 4 and doc['hash'] == comparison['hash']
+    changed = doc['pages'][1]
+    assert "Implantation per ISO 10993-6." in changed and CYTO not in changed
+    assert "2 unchanged paragraph(s) omitted" in changed
+    assert all(INTRO not in page for page in doc['pages'].values())
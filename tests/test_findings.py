@@ -0,0 +1,67 @@
+import pytest
+
+from findings import parse_findings, consolidate
+
+
+@pytest.mark.parametrize('prose', [
+    "Critical thinking was applied to the fatigue data.",
+    "Major portions of the submission follow the guidance.",
+    "Minor differences from the predicate are discussed on page 4.",
+    "Critical-path items were closed before testing.",
+    "- Major portions of the labeling were revised.",
+])
+def test_prose_starting_with_a_severity_word_is_not_a_finding(prose):
+    assert parse_findings(prose, 'agent') == []
+
+
+@pytest.mark.parametrize('line, severity, text', [
+    ("MAJOR: Missing ISO 10993-5 cytotoxicity report", 'MAJOR', "Missing ISO 10993-5 cytotoxicity report"),
+    ("[minor] Typo in the device description", 'MINOR', "Typo in the device description"),
+    ("Critical — no sterilization validation", 'CRITICAL', "no sterilization validation"),
+    ("Major - fatigue data incomplete", 'MAJOR', "fatigue data incomplete"),
+    ("CRITICAL missing EO residual data", 'CRITICAL', "missing EO residual data"),
+    ("1. **Minor:** Labeling font size", 'MINOR', "Labeling font size"),
+])
+def test_severity_tags(line, severity, text):
+    [finding] = parse_findings(line, 'agent')
+    assert (finding['severity'], finding['text']) == (severity, text)
+
+
+def test_bullets_under_a_severity_heading():
+    output = ("### Major Findings\n"
+              "- Fatigue data incomplete (p. 12)\n"
+              "- Minor portions of the protocol are unclear\n"
+              "\n"
+              "Conclusion:\n"
+              "- Overall the submission is well organized\n")
+    findings = parse_findings(output, 'agent')
+    assert [(f['severity'], f['text']) for f in findings] == [
+        ('MAJOR', "Fatigue data incomplete (p. 12)"),
+        ('MAJOR', "Minor portions of the protocol are unclear"),
+    ]
+    assert findings[0]['pages'] == [12]
+
+
+def test_standards_and_pages_are_extracted():
+    [finding] = parse_findings("MAJOR: ISO 10993-5 report missing, see pages 4-6 and 9", 'agent')
+    assert finding['standards'] == ['ISO 10993-5']
+    assert finding['pages'] == [4, 5, 6, 9]
+
+
+def test_near_duplicates_merge_across_agents_unless_standards_differ():
+    findings = (parse_findings("MAJOR: Cytotoxicity testing per ISO 10993-5 is missing for the polymer liner", 'a')
+                + parse_findings("CRITICAL: missing cytotoxicity testing per ISO 10993-5 for polymer liner", 'b')
+                + parse_findings("MAJOR: Sensitization testing per ISO 10993-10 is missing for the liner", 'c'))
+    merged = consolidate(findings)
+    assert [(c['severity'], c['agents']) for c in merged] == [('CRITICAL', ['a', 'b']), ('MAJOR', ['c'])]
+
+
+def test_a_finding_citing_both_standards_does_not_bridge_them():
+    findings = (parse_findings("MAJOR: Biocompatibility testing per ISO 10993-5 is missing for the polymer liner "
+                               "component", 'a')
+                + parse_findings("MAJOR: Biocompatibility testing per ISO 10993-5 and ISO 10993-10 is missing for "
+                                 "the polymer liner component", 'b')
+                + parse_findings("MAJOR: Biocompatibility testing per ISO 10993-10 is missing for the polymer liner "
+                                 "component", 'c'))
+    merged = consolidate(findings)
+    assert sorted(c['agents'] for c in merged) == [['a', 'b'], ['c']]
@@ -0,0 +1,106 @@
+import pytest
+
+from incremental import (REUSE, RERUN, agent_pages, diff_documents, document_sections, input_record, page_hashes,
+                         plan_rereview)
+
+PAGES = [
+    "1. DEVICE DESCRIPTION\nTitanium acetabular cup with a polyethylene liner.",
+    "2. BIOCOMPATIBILITY\nCytotoxicity per ISO 10993-5 on liner extracts, grade 0.",
+    "3. STERILIZATION\nEthylene oxide per ISO 11135 with a sterility assurance level of 10-6.",
+]
+
+CONFIGS = {
+    0: {'name': "Biocompatibility Assessor", 'system_prompt': "Assess cytotoxicity and liner extracts."},
+    1: {'name': "Sterilization Reviewer", 'system_prompt': "Assess ethylene oxide sterilization."},
+    2: {'name': "Summary Writer", 'system_prompt': "Summarize the upstream reviews."},
+}
+FINGERPRINTS = {0: "fp-bio", 1: "fp-sterile", 2: "fp-summary"}
+
+
+def document(pages, tag):
+    return {'hash': f"incremental-{tag}", 'pages': dict(enumerate(pages))}
+
+
+def prior_run(doc, top_k=None, keys=CONFIGS):
+    """Run-store entries as if every agent had run on doc"""
+    entries = []
+    for key in keys:
+        pages, _ = agent_pages(CONFIGS[key], doc, top_k)
+        entries.append({'agent': CONFIGS[key]['name'], 'fingerprint': FINGERPRINTS[key],
+                        'input_pages': input_record(doc, pages), 'output': f"output {key}"})
+    return entries
+
+
+def actions(plan):
+    return {key: p['action'] for key, p in plan.items()}
+
+
+def test_unchanged_document_reuses_every_agent():
+    doc = document(PAGES, "same")
+    plan = plan_rereview(prior_run(doc), CONFIGS, FINGERPRINTS, document(PAGES, "same-again"), None)
+    assert actions(plan) == {0: REUSE, 1: REUSE, 2: REUSE}
+    assert plan[0]['prior']['output'] == "output 0"
+
+
+@pytest.mark.parametrize("revised", [
+    [p.replace(" ", "  ") for p in PAGES],
+    [PAGES[2], PAGES[0], PAGES[1]],
+], ids=["whitespace", "reordered"])
+def test_whitespace_and_moved_pages_still_reuse(revised):
+    plan = plan_rereview(prior_run(document(PAGES, "v1")), CONFIGS, FINGERPRINTS, document(revised, "v2"), None)
+    assert set(actions(plan).values()) == {REUSE}
+
+
+def test_changed_page_reruns_agents_that_read_it():
+    revised = PAGES[:2] + [PAGES[2].replace("10-6", "10-3")]
+    plan = plan_rereview(prior_run(document(PAGES, "v1")), CONFIGS, FINGERPRINTS, document(revised, "v2"), None)
+    assert actions(plan) == {0: RERUN, 1: RERUN, 2: RERUN}
+    assert plan[1]['changed_pages'] == [3] and plan[1]['reason'] == "1 new or changed page(s)"
+
+
+def test_dropped_page_reruns():
+    plan = plan_rereview(prior_run(document(PAGES, "v1")), CONFIGS, FINGERPRINTS, document(PAGES[:2], "v2"), None)
+    assert plan[0]['action'] == RERUN and plan[0]['reason'] == "1 prior page(s) no longer selected"
+
+
+def test_retrieval_limits_reruns_to_agents_whose_pages_changed():
+    revised = PAGES[:2] + [PAGES[2].replace("10-6", "10-3")]
+    prior = prior_run(document(PAGES, "k-v1"), top_k=1, keys=[0, 1])
+    configs = {k: CONFIGS[k] for k in (0, 1)}
+    plan = plan_rereview(prior, configs, FINGERPRINTS, document(revised, "k-v2"), 1)
+    assert actions(plan) == {0: REUSE, 1: RERUN}
+
+
+def test_configuration_change_and_new_agents_rerun():
+    doc = document(PAGES, "cfg")
+    fingerprints = {**FINGERPRINTS, 0: "fp-bio-edited"}
+    plan = plan_rereview(prior_run(doc, keys=[0, 1]), CONFIGS, fingerprints, doc, None)
+    assert plan[0]['reason'] == "configuration changed" and plan[0]['prior'] is None
+    assert plan[1]['action'] == REUSE
+    assert plan[2]['reason'] == "no prior result"
+
+
+def test_errored_prior_entries_are_not_reused():
+    doc = document(PAGES, "err")
+    prior = prior_run(doc)
+    del prior[1]['output']
+    prior[1]['error'] = "timeout"
+    assert plan_rereview(prior, CONFIGS, FINGERPRINTS, doc, None)[1]['action'] == RERUN
+
+
+def test_downstream_of_a_rerun_reruns():
+    doc = document(PAGES, "dag")
+    fingerprints = {**FINGERPRINTS, 1: "fp-sterile-edited"}
+    plan = plan_rereview(prior_run(doc), CONFIGS, fingerprints, doc, None, deps={2: [0, 1], 0: [], 1: []})
+    assert actions(plan) == {0: REUSE, 1: RERUN, 2: RERUN}
+    assert plan[2]['reason'] == "upstream 1 re-runs"
+
+
+def test_diff_reports_moved_changed_and_removed_pages():
+    old = document(PAGES, "diff-v1")
+    new = document([PAGES[1], PAGES[0].replace("Titanium", "Cobalt-chrome")], "diff-v2")
+    diff = diff_documents(page_hashes(old), document_sections(old), new)
+    assert diff['pages_moved'] == [(2, 1)]
+    assert diff['pages_new_content'] == [2] and diff['pages_removed'] == [1, 3]
+    assert {s['title']: s['change'] for s in diff['sections']} == {
+        "1. DEVICE DESCRIPTION": 'modified', "3. STERILIZATION": 'removed'}
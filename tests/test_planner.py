@@ -0,0 +1,65 @@
+import pytest
+
+from chunking import model_context
+from planner import OK, ROUTE, TRIM, count_tokens, fit_prompt, plan_agent, plan_run, prompt_limit, trim_to_tokens
+
+WORDS = "device " * 1000
+
+
+class NoHistory:
+    def provider_calls(self, provider, model, limit):
+        return []
+
+
+def test_short_text_is_not_trimmed():
+    assert trim_to_tokens("Review the submission.", 100) == "Review the submission."
+
+
+@pytest.mark.parametrize("max_tokens", [50, 300, 999])
+def test_trimmed_text_keeps_the_head_within_budget(max_tokens):
+    trimmed = trim_to_tokens(WORDS, max_tokens)
+    assert count_tokens(trimmed) <= max_tokens
+    assert trimmed.startswith("device device") and trimmed.endswith("context ...]")
+
+
+def test_fit_prompt_trims_to_the_model_context():
+    cfg = {'model': 'unknown-model', 'params': {'max_tokens': 1000}, 'system_prompt': "Be brief."}
+    assert fit_prompt(cfg, "Short prompt.") == "Short prompt."
+    fitted = fit_prompt(cfg, WORDS * 40)
+    assert count_tokens(fitted) <= prompt_limit(cfg) < model_context('unknown-model')
+
+
+@pytest.mark.parametrize("provider, model, prompt_tokens, action, planned_model", [
+    ('openai', 'gpt-4o-mini', 10000, OK, 'gpt-4o-mini'),
+    ('openai', 'gpt-4o-mini', 200000, ROUTE, 'gpt-5-nano'),
+    ('openai', 'gpt-4o-mini', 600000, ROUTE, 'gpt-4.1-mini'),
+    ('grok', 'grok-beta', 200000, ROUTE, 'grok-4'),
+    ('grok', 'grok-beta', 300000, TRIM, 'grok-beta'),
+    ('custom', 'unknown-model', 40000, TRIM, 'unknown-model'),
+])
+def test_oversized_prompts_route_to_a_larger_model_or_trim(provider, model, prompt_tokens, action, planned_model):
+    cfg = {'provider': provider, 'model': model, 'params': {'max_tokens': 1500}, 'system_prompt': ""}
+    plan = plan_agent(cfg, prompt_tokens)
+    assert (plan['action'], plan['model']) == (action, planned_model)
+    if action == TRIM:
+        assert plan['tokens_in'] <= model_context(model)
+    else:
+        assert plan['tokens_in'] == prompt_tokens
+
+
+def test_history_drives_output_and_latency_forecasts():
+    cfg = {'provider': 'openai', 'model': 'gpt-4o-mini', 'params': {'max_tokens': 1500}, 'system_prompt': ""}
+    default = plan_agent(cfg, 1000)
+    assert default['tokens_out'] == 750 and default['latency_s'] == 16.0
+    plan = plan_agent(cfg, 1000, history={'runs': 5, 'ttft_s': 0.5, 'tokens_per_s': 100.0, 'tokens_out': 200})
+    assert plan['tokens_out'] == 200 and plan['latency_s'] == 2.5 and plan['history_runs'] == 5
+    assert plan['cost_usd'] == pytest.approx((1000 * 0.15 + 200 * 0.60) / 1e6, abs=1e-5)
+
+
+def test_run_plan_adds_upstream_outputs_and_the_critical_path():
+    cfg = {'provider': 'openai', 'model': 'gpt-4o-mini', 'params': {'max_tokens': 1500}, 'system_prompt': ""}
+    configs = {0: cfg, 1: cfg, 2: cfg}
+    plans = plan_run(configs, "Review the submission.", {0: [], 1: [], 2: [0, 1]}, NoHistory())
+    assert plans[2]['tokens_in'] == plans[0]['tokens_in'] + 2 * (750 + 16)
+    assert plans['total']['latency_s'] == pytest.approx(plans[0]['latency_s'] + plans[2]['latency_s'])
+    assert plans['total']['tokens_out'] == 3 * 750
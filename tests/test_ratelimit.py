@@ -0,0 +1,157 @@
+import pytest
+
+import ratelimit
+from ratelimit import (THROTTLED, TRANSIENT, AdaptiveConcurrency, RateLimiter, TokenBucket, backoff_delay,
+                       classify_error)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, s):
+        self.slept.append(s)
+        self.now += s
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(ratelimit.time, 'monotonic', fake.monotonic)
+    monkeypatch.setattr(ratelimit.time, 'sleep', fake.sleep)
+    return fake
+
+
+class StatusError(Exception):
+    def __init__(self, status_code, message="error"):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def test_bucket_allows_a_burst_then_paces(clock):
+    bucket = TokenBucket(60)
+    assert all(bucket.reserve(1) == 0 for _ in range(60))
+    assert bucket.reserve(1) == pytest.approx(1.0)
+    assert bucket.reserve(1) == pytest.approx(2.0)
+    clock.now += 10
+    assert bucket.reserve(1) == 0
+
+
+def test_bucket_refills_at_the_per_minute_rate(clock):
+    bucket = TokenBucket(120)
+    bucket.reserve(120)
+    clock.now += 15
+    assert bucket.reserve(30) == 0
+    assert bucket.reserve(2) == pytest.approx(1.0)
+
+
+def test_adjust_refunds_overestimated_tokens(clock):
+    bucket = TokenBucket(1000)
+    assert bucket.reserve(1000) == 0
+    bucket.adjust(-400)
+    assert bucket.reserve(400) == 0
+
+
+def test_aimd_halves_on_throttle_and_creeps_back():
+    conc = AdaptiveConcurrency(initial=8, maximum=16)
+    for _ in range(2):
+        conc.acquire()
+    conc.release(THROTTLED)
+    assert conc.limit == 4
+    conc.release(THROTTLED)
+    assert conc.limit == 2 and conc.inflight == 0
+    for _ in range(4):
+        conc.acquire()
+        conc.release("ok")
+    assert 3 < conc.limit < 4
+    conc.acquire()
+    conc.release(TRANSIENT)
+    assert 3 < conc.limit < 4
+
+
+def test_aimd_never_drops_below_one_or_exceeds_the_maximum():
+    conc = AdaptiveConcurrency(initial=1, maximum=2)
+    conc.acquire()
+    conc.release(THROTTLED)
+    assert conc.limit == 1
+    for _ in range(20):
+        conc.acquire()
+        conc.release("ok")
+    assert conc.limit == 2
+
+
+@pytest.mark.parametrize("exc, kind", [
+    (StatusError(429), THROTTLED),
+    (StatusError(503), TRANSIENT),
+    (StatusError(408), TRANSIENT),
+    (StatusError(400), None),
+    (StatusError(401), None),
+    (TimeoutError(), TRANSIENT),
+    (ConnectionError(), TRANSIENT),
+    (Exception("429 Resource has been exhausted"), THROTTLED),
+    (ValueError("Missing OpenAI API key"), None),
+])
+def test_classify_error(exc, kind):
+    assert classify_error(exc) == kind
+
+
+def test_backoff_honours_retry_after(monkeypatch):
+    monkeypatch.setattr(ratelimit.random, 'uniform', lambda lo, hi: hi)
+    assert backoff_delay(0) == 1.0
+    assert backoff_delay(3) == 8.0
+    assert backoff_delay(10) == ratelimit.BACKOFF_CAP_S
+    assert backoff_delay(0, suggested=12) == 12
+
+
+def test_call_retries_throttling_and_halves_concurrency(clock):
+    limits = RateLimiter({'openai': {'rpm': 600, 'tpm': 100000}})
+    attempts = []
+
+    def fn():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise StatusError(429)
+        return "done"
+
+    stats = {}
+    assert limits.call('openai', 'm', fn, 100, stats) == "done"
+    assert stats['retries'] == 2 and stats['throttled'] == 2
+    # 4 halved twice to 1, then +1/limit for the success
+    assert limits.limiter('openai', 'm').concurrency.limit == 2
+    assert limits.limiter('openai', 'm').concurrency.inflight == 0
+
+
+def test_call_does_not_retry_client_errors_or_vetoed_retries(clock):
+    limits = RateLimiter()
+    attempts = []
+
+    def bad_request():
+        attempts.append(1)
+        raise StatusError(400)
+
+    with pytest.raises(StatusError):
+        limits.call('openai', 'm', bad_request, 100)
+    assert len(attempts) == 1
+
+    def unavailable():
+        attempts.append(1)
+        raise StatusError(503)
+
+    with pytest.raises(StatusError):
+        limits.call('openai', 'm', unavailable, 100, retryable=lambda: False)
+    assert len(attempts) == 2
+
+
+def test_configure_updates_existing_limiters():
+    limits = RateLimiter()
+    lim = limits.limiter('gemini', 'flash')
+    limits.configure('gemini', rpm=30)
+    assert lim.requests.per_minute == 30
+    assert limits.settings('gemini')['rpm'] == 30
+    limits.configure('gemini', model='flash', tpm=5000)
+    assert limits.settings('gemini', 'flash') == {'rpm': 30, 'tpm': 5000}
+    assert limits.settings('gemini')['tpm'] != 5000
@@ -0,0 +1,55 @@
+import pytest
+
+import response_cache
+from response_cache import ResponseCache, cache_key
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(response_cache.time, 'time', lambda: now[0])
+    return now
+
+
+def test_key_covers_what_changes_the_response():
+    cfg = {'model': 'gpt-4o-mini', 'system_prompt': "You review.", 'params': {'temperature': 0.2}}
+    base = cache_key('openai', cfg, "prompt")
+    assert cache_key('openai', dict(cfg), "prompt") == base
+    assert cache_key('openai', dict(cfg, name="Renamed agent"), "prompt") == base
+    assert cache_key('openai', dict(cfg, params={'temperature': 0.7}), "prompt") != base
+    assert cache_key('gemini', cfg, "prompt") != base
+    assert cache_key('openai', cfg, "other prompt") != base
+
+
+def test_least_recently_used_is_evicted_past_the_byte_budget(tmp_path, clock):
+    keys = [f"{i:02d}" + "0" * 62 for i in range(3)]
+    cache = ResponseCache(tmp_path, max_bytes=1 << 20, max_age_s=3600)
+    cache.put(keys[0], "x" * 100)
+    cache.max_bytes = cache.stats()["bytes"] * 5 // 2  # room for two entries
+    cache.put(keys[1], "x" * 100)
+    assert cache.get(keys[0])["output"] == "x" * 100  # keys[1] is now the least recently used
+    cache.put(keys[2], "x" * 100)
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) is not None and cache.get(keys[2]) is not None
+    assert cache.evictions == 1
+    assert cache.stats()["bytes"] <= cache.max_bytes
+
+
+def test_entries_expire_after_max_age(tmp_path, clock):
+    cache = ResponseCache(tmp_path, max_bytes=1 << 20, max_age_s=60)
+    cache.put("a" * 64, "old")
+    clock[0] += 30
+    cache.put("b" * 64, "new")
+    assert cache.get("a" * 64)["output"] == "old"
+    clock[0] += 31
+    assert cache.get("a" * 64) is None
+    assert cache.get("b" * 64)["output"] == "new"
+    assert not (tmp_path / "aa" / f"{'a' * 64}.json").exists()
+
+
+def test_index_is_rebuilt_from_disk(tmp_path, clock):
+    ResponseCache(tmp_path).put("c" * 64, "persisted", meta={'model': 'm'})
+    cache = ResponseCache(tmp_path)
+    entry = cache.get("c" * 64)
+    assert entry["output"] == "persisted" and entry["meta"] == {'model': 'm'}
+    assert (cache.hits, cache.misses) == (1, 0)
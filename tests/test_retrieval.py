@@ -0,0 +1,62 @@
+import pytest
+
+from retrieval import PageIndex, agent_query, select_pages, tokenize
+
+PAGES = {
+    0: "Device description: titanium acetabular cup with a polyethylene liner.",
+    1: "Cytotoxicity per ISO 10993-5 was performed on extracts of the liner. Cytotoxicity grade 0.",
+    2: "Sensitization per ISO 10993-10 used the guinea pig maximization test.",
+    3: "Sterilization by ethylene oxide per ISO 11135 with a sterility assurance level of 10-6.",
+    4: "Labeling includes the instructions for use and the package insert. " * 6,
+}
+
+
+def test_tokenize_keeps_standard_numbers_and_their_parts():
+    assert tokenize("Per ISO 10993-5 and the F1800 method") == ['iso', '10993-5', '10993', 'f1800', 'method']
+
+
+def test_most_relevant_page_ranks_first():
+    index = PageIndex(PAGES)
+    ranked = index.search("cytotoxicity extracts")
+    assert ranked[0][0] == 1
+    assert [p for p, _ in ranked] == [1]
+
+
+def test_rare_terms_outweigh_common_ones():
+    index = PageIndex(PAGES)
+    # "iso" appears on three pages, "sensitization" on one
+    ranked = dict(index.search({'iso': 1, 'sensitization': 1}))
+    assert max(ranked, key=ranked.get) == 2
+    assert index.idf('sensitization') > index.idf('iso')
+
+
+def test_term_frequency_saturates_and_long_pages_are_normalized():
+    index = PageIndex({0: "labeling " * 2 + "filler " * 40, 1: "labeling " * 20 + "filler " * 40, 2: "other"})
+    ranked = dict(index.search("labeling"))
+    assert ranked[1] > ranked[0]
+    assert ranked[1] < 10 * ranked[0]
+
+
+def test_compound_standard_matches_its_family():
+    index = PageIndex(PAGES)
+    assert {p for p, _ in index.search("10993")} == {1, 2}
+    assert index.search("10993-5")[0][0] == 1
+
+
+@pytest.mark.parametrize("k, expected", [(1, 1), (2, 2), (0, 3)])
+def test_top_k(k, expected):
+    assert len(PageIndex(PAGES).search("iso", k)) == expected
+
+
+def test_agent_query_drops_prompt_boilerplate():
+    query = agent_query({'desc': "Reviews sterilization", 'system_prompt': "You are an FDA 510(k) reviewer. "
+                                                                           "Assess ethylene oxide validation."})
+    assert set(query) == {'sterilization', 'ethylene', 'oxide', 'validation'}
+
+
+def test_select_pages_falls_back_to_every_page():
+    doc = {'hash': "retrieval-test-doc", 'pages': PAGES}
+    pages, ranked = select_pages(doc, {'system_prompt': "Ethylene oxide residuals"}, k=2)
+    assert list(pages) == [3] and ranked[0][0] == 3
+    pages, ranked = select_pages(doc, {'system_prompt': "Electromagnetic compatibility"}, k=2)
+    assert pages == PAGES and ranked == []
@@ -0,0 +1,122 @@
+import threading
+
+import pytest
+
+import providers
+import routing
+from metrics import Metrics
+from ratelimit import RateLimiter
+from routing import PRIMARY, SECONDARY, run_routed
+
+KEYS = {'openai': "key", 'grok': "key"}
+CONFIG = {'model': 'gpt-4o-mini', 'system_prompt': "Review.",
+          'routing': {'provider': 'grok', 'model': 'grok-3-mini'}}
+
+
+class FakeProviders:
+    """Stands in for the provider SDKs: each provider answers, fails or stalls until cancelled"""
+
+    def __init__(self, **behaviour):
+        self.behaviour = behaviour
+        self.calls = []
+        self.cancelled = {}
+        self.finished = {p: threading.Event() for p in behaviour}
+
+    def __call__(self, provider, config, user_prompt, keys, stream=False, usage=None, timeout=None, cancel=None):
+        self.calls.append((provider, config['model'], timeout))
+        try:
+            kind = self.behaviour[provider]
+            if kind == 'stall':
+                released = threading.Event()
+                cancel.on_cancel(released.set)
+                released.wait(5)
+                self.cancelled[provider] = cancel.cancelled
+                raise TimeoutError("read timed out")
+            if kind == 'fail':
+                raise ValueError(f"{provider} rejected the request")
+            return iter([f"{provider} answer"]) if stream else f"{provider} answer"
+        finally:
+            self.finished[provider].set()
+
+
+@pytest.fixture
+def env(monkeypatch):
+    metrics, limits = Metrics(), RateLimiter()
+    for module in (providers, routing):
+        monkeypatch.setattr(module, 'METRICS', metrics)
+    monkeypatch.setattr(providers, 'LIMITS', limits)
+    monkeypatch.setattr(routing, 'DEFAULT_HEDGE_DELAY_S', 0.1)
+    monkeypatch.setattr(routing, 'MIN_HEDGE_DELAY_S', 0.1)
+
+    def install(**behaviour):
+        fake = FakeProviders(**behaviour)
+        monkeypatch.setattr(providers, '_provider_call', fake)
+        return fake
+
+    return metrics, limits, install
+
+
+def test_unrouted_config_calls_the_provider_directly(env):
+    _, _, install = env
+    fake = install(openai='ok')
+    stats = {}
+    config = {k: v for k, v in CONFIG.items() if k != 'routing'}
+    assert run_routed('openai', config, "Prompt.", KEYS, stats=stats) == "openai answer"
+    assert 'routing' not in stats and fake.calls == [('openai', 'gpt-4o-mini', None)]
+
+
+def test_fast_primary_wins_without_a_hedge(env, monkeypatch):
+    metrics, _, install = env
+    monkeypatch.setattr(routing, 'DEFAULT_HEDGE_DELAY_S', 5.0)
+    fake = install(openai='ok', grok='ok')
+    stats = {}
+    assert run_routed('openai', CONFIG, "Prompt.", KEYS, stats=stats) == "openai answer"
+    assert stats['routing']['winner'] == PRIMARY and not stats['routing']['hedged']
+    assert [c[0] for c in fake.calls] == ['openai']
+    assert metrics.hedge_stats()['hedged'] == 0
+
+
+def test_stalled_primary_is_hedged_and_cancelled(env):
+    metrics, limits, install = env
+    fake = install(openai='stall', grok='ok')
+    stats, streamed = {}, []
+    out = run_routed('openai', CONFIG, "Prompt.", KEYS, on_chunk=streamed.append, stats=stats)
+    assert out == "grok answer" and streamed == ["grok answer"]
+    routed = stats['routing']
+    assert routed['hedged'] and routed['winner'] == SECONDARY
+    assert routed['served_by'] == "grok:grok-3-mini" and routed['added_cost_usd'] > 0
+    # The loser is cancelled at once rather than left on its client timeout
+    assert fake.finished['openai'].wait(2) and fake.cancelled['openai']
+    assert all(timeout == routing.HEDGE_CALL_TIMEOUT_S for _, _, timeout in fake.calls)
+    assert limits.limiter('openai', 'gpt-4o-mini').concurrency.inflight == 0
+    # A cancelled loser is not a provider failure
+    assert metrics.provider_health('openai')[0] == 'unknown'
+    assert metrics.hedge_stats()['secondary_wins'] == 1
+
+
+def test_failed_primary_fails_over_before_the_hedge_delay(env, monkeypatch):
+    _, _, install = env
+    monkeypatch.setattr(routing, 'DEFAULT_HEDGE_DELAY_S', 5.0)
+    fake = install(openai='fail', grok='ok')
+    stats = {}
+    assert run_routed('openai', CONFIG, "Prompt.", KEYS, stats=stats) == "grok answer"
+    assert stats['routing']['failover'] and not stats['routing']['hedged']
+    assert [c[0] for c in fake.calls] == ['openai', 'grok']
+
+
+def test_down_primary_goes_straight_to_the_secondary(env):
+    metrics, _, install = env
+    for _ in range(3):
+        metrics.record_call('openai', 'gpt-4o-mini', 1.0, ok=False)
+    fake = install(openai='ok', grok='ok')
+    stats = {}
+    assert run_routed('openai', CONFIG, "Prompt.", KEYS, stats=stats) == "grok answer"
+    assert stats['routing']['failover'] and stats['routing']['hedge_delay_s'] is None
+    assert [c[0] for c in fake.calls] == ['grok']
+
+
+def test_both_sides_failing_raises(env):
+    _, _, install = env
+    install(openai='fail', grok='fail')
+    with pytest.raises(RuntimeError, match="openai rejected"):
+        run_routed('openai', CONFIG, "Prompt.", KEYS)
@@ -0,0 +1,91 @@
+import csv
+import io
+import json
+
+import pytest
+
+import run_store
+from run_store import RunStore, run_status, spool
+
+
+@pytest.fixture
+def store(tmp_path):
+    return RunStore(str(tmp_path / "runs.sqlite3"))
+
+
+def fill(store, monkeypatch, n, ts_of=lambda i: 1000.0 + i):
+    """n agent runs across two agents, with timestamps from ts_of"""
+    now = [0.0]
+    monkeypatch.setattr(run_store.time, 'time', lambda: now[0])
+    run_id = store.start_run('test', submission="sub.pdf")
+    for i in range(n):
+        now[0] = ts_of(i)
+        store.record(run_id, {'agent': f"Agent {i % 2}", 'provider': 'openai', 'model': 'm',
+                              'output': f"output {i}", 'findings': [i]}, submission="sub.pdf")
+    return run_id
+
+
+def page_through(store, limit, **filters):
+    pages, cursor = [], None
+    while True:
+        rows, cursor = store.query(limit=limit, cursor=cursor, **filters)
+        pages.append([r['id'] for r in rows])
+        if cursor is None:
+            return pages
+
+
+@pytest.mark.parametrize("ts_of", [lambda i: 1000.0 + i, lambda i: 1000.0 + i // 4], ids=["distinct", "tied"])
+def test_keyset_pages_cover_every_row_once_newest_first(store, monkeypatch, ts_of):
+    fill(store, monkeypatch, 23, ts_of)
+    pages = page_through(store, 5)
+    assert [len(p) for p in pages] == [5, 5, 5, 5, 3]
+    ids = [i for p in pages for i in p]
+    assert ids == sorted(ids, reverse=True) and len(set(ids)) == 23
+
+
+def test_exact_final_page_has_no_cursor(store, monkeypatch):
+    fill(store, monkeypatch, 10)
+    assert [len(p) for p in page_through(store, 5)] == [5, 5]
+
+
+def test_filters_apply_to_pages_and_counts(store, monkeypatch):
+    fill(store, monkeypatch, 9)
+    assert store.count(agent="Agent 1") == 4
+    assert sum(len(p) for p in page_through(store, 3, agent="Agent 1")) == 4
+    assert store.count(agent="") == 9
+    with pytest.raises(ValueError):
+        store.query(bogus="x")
+
+
+def test_summary_rows_leave_out_output(store, monkeypatch):
+    fill(store, monkeypatch, 1)
+    [row], _ = store.query()
+    assert 'output' not in row and run_status(row) == 'ok'
+
+
+def test_export_streams_every_entry_in_batches(store, monkeypatch):
+    fill(store, monkeypatch, 7)
+    entries = list(store.iter_entries(batch=3))
+    assert [e['output'] for e in entries] == [f"output {i}" for i in range(7)]
+    assert entries[0]['findings'] == [0]
+    lines = [json.loads(line) for line in store.export_ndjson(agent="Agent 0")]
+    assert [e['output'] for e in lines] == ["output 0", "output 2", "output 4", "output 6"]
+
+
+def test_csv_export_has_a_header_and_one_row_per_entry(store, monkeypatch):
+    fill(store, monkeypatch, 4)
+    with spool(store.export_csv(), max_memory=64) as f:
+        rows = list(csv.DictReader(io.TextIOWrapper(f, encoding='utf-8')))
+    assert [r['output'] for r in rows] == [f"output {i}" for i in range(4)]
+    assert set(rows[0]) == set(run_store.CSV_COLUMNS)
+
+
+def test_status_distinguishes_cancelled_and_skipped_runs(store):
+    run_id = store.start_run('test')
+    store.record(run_id, {'agent': "a", 'output': "ok"})
+    store.record(run_id, {'agent': "b", 'error': "boom"})
+    store.record(run_id, {'agent': "c", 'error': "Skipped: upstream b failed", 'status': run_store.SKIPPED})
+    store.record(run_id, {'agent': "d", 'error': "Cancelled", 'status': run_store.CANCELLED})
+    rows, _ = store.query(run_id=run_id)
+    assert {r['agent']: (run_status(r), r['ok']) for r in rows} == {
+        'a': ('ok', 1), 'b': ('error', 0), 'c': ('skipped', 0), 'd': ('cancelled', 0)}
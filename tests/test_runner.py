@@ -0,0 +1,72 @@
+import threading
+
+import pytest
+
+from runner import build_prompt, run_dag, validate_dag
+
+
+def test_topological_order():
+    order = validate_dag({'report': ['bio', 'sterile'], 'bio': [], 'sterile': ['bio']})
+    assert order == ['bio', 'sterile', 'report']
+
+
+@pytest.mark.parametrize("deps, message", [
+    ({'a': ['b'], 'b': ['a']}, "cycle"),
+    ({'a': ['b'], 'b': ['c'], 'c': ['a'], 'd': []}, "cycle"),
+    ({'a': ['a']}, "itself"),
+    ({'a': ['missing']}, "unknown"),
+])
+def test_invalid_graphs_are_rejected(deps, message):
+    with pytest.raises(ValueError, match=message):
+        validate_dag(deps)
+
+
+def test_cycle_error_names_only_the_agents_in_it():
+    with pytest.raises(ValueError) as exc:
+        validate_dag({1: [2], 2: [1], 3: []})
+    assert str(exc.value).endswith("1, 2")
+
+
+def test_upstream_outputs_are_passed_down():
+    seen = {}
+
+    def execute(node, upstream):
+        seen[node] = upstream
+        return node.upper()
+
+    results = run_dag({'a': [], 'b': ['a'], 'c': ['a', 'b']}, execute)
+    assert seen == {'a': {}, 'b': {'a': 'A'}, 'c': {'a': 'A', 'b': 'B'}}
+    assert {n: r['output'] for n, r in results.items()} == {'a': 'A', 'b': 'B', 'c': 'C'}
+
+
+def test_independent_nodes_run_in_parallel():
+    barrier = threading.Barrier(3, timeout=5)
+
+    def execute(node, upstream):
+        barrier.wait()
+        return node
+
+    results = run_dag({n: [] for n in 'abc'}, execute, max_workers=3)
+    assert all('output' in r for r in results.values())
+
+
+def test_failure_skips_everything_downstream():
+    def execute(node, upstream):
+        if node == 'a':
+            raise RuntimeError("provider down")
+        return node
+
+    done = []
+    results = run_dag({'a': [], 'b': ['a'], 'c': ['b'], 'd': []}, execute,
+                      on_done=lambda node, result: done.append(node))
+    assert results['a']['error'] == "provider down" and not results['a']['skipped']
+    assert results['b']['skipped'] and results['c']['skipped']
+    assert "upstream a failed" in results['b']['error']
+    assert results['d']['output'] == 'd'
+    assert sorted(done) == ['a', 'b', 'c', 'd']
+
+
+def test_build_prompt_labels_upstream_outputs():
+    prompt = build_prompt("Review.", {1: "Looks fine"}, {1: "Biocompatibility"})
+    assert prompt == "Review.\n\n--- Output from Biocompatibility ---\nLooks fine"
+    assert build_prompt("Review.", {}) == "Review."